@@ -27,6 +27,9 @@
 
 #define CHECK_INTERVAL  10000  // communication check interval [mS]
 #define TX_INTERVAL     30000  // depend on the erea rules, total of 360 sec or less per hour
+// Uncomment to POST raw CatPacket bytes to /api/packet instead of the /api/track query string.
+// Needs a server with the /api/packet endpoint (server/packet.py); older servers only accept /api/track.
+// #define UPLOAD_BINARY_PACKETS
 
 #define RF_SW          D5       // RF Switch
 #define sd_sck         D8       // Arduino SPI library uses VSPI circuit
@@ -142,6 +145,7 @@ char * formatCatPacket(const CatPacket &packet, char *buffer, size_t bufferSize)
   int offset = 0;
   offset += snprintf(buffer + offset, bufferSize - offset, "%s", uploadURL);
   offset += snprintf(buffer + offset, bufferSize - offset, "?scan_id=%u,", packet.fields.packetNumber);
+  offset += snprintf(buffer + offset, bufferSize - offset, "&uid=%08X,", packet.fields.UID);
   offset += snprintf(buffer + offset, bufferSize - offset, "&cat_vbatt=%u,", packet.fields.vbatt);
   offset += snprintf(buffer + offset, bufferSize - offset, "&cat_rssi=%d,", packet.fields.rssi);
   offset += snprintf(buffer + offset, bufferSize - offset, "&cat_snr=%d,", packet.fields.snr);
@@ -209,6 +213,36 @@ bool uploadDataToServer(const char *url) {
 }
 
 
+// POST the raw CatPacket to the server binary ingest endpoint, no text formatting needed.
+// The station side RSSI/SNR of the LoRa link are not in the packet, they go in the query string.
+bool uploadPacketToServer(const CatPacket &packet, float apRssi, float apSnr) {
+  if (WiFi.status() != WL_CONNECTED) {
+    Serial.println("uploadPacketToServer: WiFi not connected");
+    return false;
+  }
+
+  char url[160];
+  snprintf(url, sizeof(url), "http://%s/api/packet?version=%u&ap_rssi=%d&ap_snr=%d",
+           uploadHost, PACKET_VERSION, (int)apRssi, (int)apSnr);
+  HTTPClient http;
+  if (!http.begin(url)) {
+    Serial.println("uploadPacketToServer: HTTP begin failed");
+    return false;
+  }
+  http.addHeader("Content-Type", "application/octet-stream");
+
+  int httpCode = http.POST((uint8_t *)&packet, sizeof(packet));
+  if (httpCode <= 0) {
+    Serial.printf("uploadPacketToServer: POST failed, err=%d\n", httpCode);
+    http.end();
+    return false;
+  }
+
+  Serial.printf("uploadPacketToServer: HTTP code %d\n", httpCode);
+  http.end();
+  return httpCode == HTTP_CODE_OK;
+}
+
 //
 // *******************************************************************************************************
 void setup() {
@@ -411,11 +445,15 @@ void loop()
     } else {
       previousCatBssidsCRC32 = currentCatBssidsCRC32;
       Serial.println("New Cat BSSIDs received, cat moved.");
+#ifdef UPLOAD_BINARY_PACKETS
+      uploadPacketToServer(catPacket, radio.getRSSI(), radio.getSNR());
+#else
       char * formattedData = formatCatPacket(catPacket, printBuff, sizeof(printBuff));
       Serial.println("Formatted Data for Upload:");
       Serial.println(formattedData);
       // Here you can add code to upload the formatted data to your server
       uploadDataToServer(formattedData);
+#endif
     }
 
     display.clearDisplay();
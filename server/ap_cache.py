@@ -0,0 +1,86 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_bssid(bssid):
+    """Normalize a BSSID to the upper case, colon separated form used as key everywhere."""
+    return bssid.strip().upper().replace('-', ':')
+
+
+class LocationCache:
+    """Bounded in-process LRU cache of BSSID -> location lookups.
+
+    Positive results (a lat/lon was found) live for `ttl` seconds, negative results
+    (WiGLE had no location, or the lookup failed) for the shorter `negative_ttl`, so an
+    unknown neighbour AP is not sent to WiGLE again on every scan.
+    """
+
+    def __init__(self, maxsize=10000, ttl=86400.0, negative_ttl=3600.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()  # bssid -> (expires_at, location)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, bssid):
+        """Return the cached location dict for bssid, or None on a miss."""
+        key = normalize_bssid(bssid)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, location = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            if location['lat'] is None:
+                self.negative_hits += 1
+            else:
+                self.hits += 1
+            return location
+
+    def put(self, bssid, location):
+        """Store a location dict ({'lat', 'lon', 'error'}), negative if lat/lon is missing."""
+        key = normalize_bssid(bssid)
+        negative = location['lat'] is None or location['lon'] is None
+        expires_at = time.monotonic() + (self.negative_ttl if negative else self.ttl)
+        with self._lock:
+            self._entries[key] = (expires_at, location)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, bssid=None):
+        """Drop one BSSID, or the whole cache when bssid is None. Returns the number of entries dropped."""
+        with self._lock:
+            if bssid is None:
+                count = len(self._entries)
+                self._entries.clear()
+                return count
+            return 1 if self._entries.pop(normalize_bssid(bssid), None) is not None else 0
+
+    def stats(self):
+        """Return the cache counters as a dict."""
+        with self._lock:
+            lookups = self.hits + self.negative_hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'negative_hits': self.negative_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_ratio': (self.hits + self.negative_hits) / lookups if lookups else 0.0
+            }
@@ -0,0 +1,158 @@
+import time
+from spatial import haversine_distances
+
+SQLITE_MAX_IN_PARAMS = 500
+
+SQL_SELECT_LEARNED = ('SELECT bssid, lat, lon, weight, prior, observations, last_lat, last_lon '
+                      'FROM ap_learned WHERE bssid IN ({})')
+SQL_SELECT_LOCATED = 'SELECT bssid, lat, lon, source FROM ap_locations WHERE bssid IN ({}) AND lat IS NOT NULL'
+SQL_UPSERT_LEARNED = ('INSERT INTO ap_learned (bssid, lat, lon, weight, prior, observations, last_lat, last_lon, updated_at) '
+                      'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(bssid) DO UPDATE SET lat = excluded.lat, '
+                      'lon = excluded.lon, weight = excluded.weight, observations = excluded.observations, '
+                      'last_lat = excluded.last_lat, last_lon = excluded.last_lon, updated_at = excluded.updated_at')
+# Upsert in place, like app.py: the rowid is the key of the ap_locations_rtree spatial index
+SQL_UPSERT_LOCATION = ("INSERT INTO ap_locations (bssid, lat, lon, source) VALUES (?, ?, ?, 'learned') "
+                       "ON CONFLICT(bssid) DO UPDATE SET lat = excluded.lat, lon = excluded.lon, source = 'learned'")
+
+
+class APLearner:
+    """Learns AP positions from our own position estimates, kept in the `ap_learned` table.
+
+    After each confident estimate (at least `min_aps` of the scan's APs have a location)
+    every AP of the scan moves towards the estimate by an incremental weighted mean. An
+    observation weighs min(1, 10^((rssi - rssi_ref) / 20)): strong APs are close to the
+    tracker. Only estimates at least `min_spacing` meters from the AP's previous one count,
+    so a pet sleeping in its basket does not drag every AP it hears to the basket.
+
+    The accumulated weight is the confidence of the position; it is capped at `max_weight`
+    so that an AP which moved is followed. An AP with a WiGLE position starts from it, with
+    `prior_weight` that is part of the mean but not of the confidence. APs unknown to WiGLE
+    start from nothing and so get a provisional position from the APs seen with them.
+
+    Once its weight reaches `min_weight` a learned position replaces the one in
+    ap_locations (source 'learned'), so the estimator uses it and WiGLE is no longer asked.
+    It is written again each time it moved more than `min_move` meters.
+    """
+
+    def __init__(self, min_aps=3, min_weight=3.0, max_weight=100.0, prior_weight=3.0, rssi_ref=-60.0,
+                 min_spacing=20.0, min_move=5.0):
+        self.min_aps = min_aps
+        self.min_weight = min_weight
+        self.max_weight = max_weight
+        self.prior_weight = prior_weight
+        self.rssi_ref = rssi_ref
+        self.min_spacing = min_spacing
+        self.min_move = min_move
+        self.scans_used = 0
+        self.scans_skipped = 0
+        self.updates = 0
+        self.too_close = 0
+        self.promoted = 0
+
+    def init_db(self, conn):
+        """Create the learned positions table. ap_locations needs its source column, see app.init_db."""
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS ap_learned (
+                bssid TEXT PRIMARY KEY,
+                lat REAL,
+                lon REAL,
+                weight REAL,
+                prior REAL,
+                observations INTEGER,
+                last_lat REAL,
+                last_lon REAL,
+                updated_at REAL
+            )
+        ''')
+
+    def observation_weight(self, rssi):
+        return min(1.0, 10.0 ** ((rssi - self.rssi_ref) / 20.0))
+
+    def learn(self, conn, scans):
+        """Update the positions of the APs of (estimate, aps) pairs, in the caller's transaction.
+
+        aps is a list of {'bssid', 'rssi'} dicts with normalized BSSIDs. Returns the
+        (bssid, location dict) pairs written to ap_locations, for the caller to publish once
+        the transaction is committed.
+        """
+        scans = [(estimate, aps) for estimate, aps in scans if estimate is not None and aps]
+        if not scans:
+            return []
+        bssids = list({ap['bssid'] for _, aps in scans for ap in aps})
+        learned = {}  # bssid -> [lat, lon, weight, prior, observations, last_lat, last_lon]
+        located = {}  # bssid -> (lat, lon, source)
+        for i in range(0, len(bssids), SQLITE_MAX_IN_PARAMS):
+            chunk = bssids[i:i + SQLITE_MAX_IN_PARAMS]
+            placeholders = ','.join('?' * len(chunk))
+            for bssid, *position in conn.execute(SQL_SELECT_LEARNED.format(placeholders), chunk):
+                learned[bssid] = position
+            for bssid, lat, lon, source in conn.execute(SQL_SELECT_LOCATED.format(placeholders), chunk):
+                located[bssid] = (lat, lon, source)
+
+        used = 0
+        updated = set()
+        for (est_lat, est_lon), aps in scans:
+            # Only estimates resting on enough located APs are trusted
+            if sum(ap['bssid'] in located for ap in aps) < self.min_aps:
+                self.scans_skipped += 1
+                continue
+            used += 1
+            for ap in aps:
+                position = learned.get(ap['bssid'])
+                if position is None:
+                    current = located.get(ap['bssid'])
+                    if current is not None:
+                        position = [current[0], current[1], 0.0, self.prior_weight, 0, None, None]
+                    else:
+                        position = [est_lat, est_lon, 0.0, 0.0, 0, None, None]
+                    learned[ap['bssid']] = position
+                elif position[5] is not None and \
+                        haversine_distances(position[5], position[6], est_lat, est_lon) < self.min_spacing:
+                    self.too_close += 1
+                    continue
+                w = self.observation_weight(ap['rssi'])
+                total = position[2] + position[3] + w
+                position[0] += (est_lat - position[0]) * w / total
+                position[1] += (est_lon - position[1]) * w / total
+                position[2] = min(position[2] + w, self.max_weight)
+                position[4] += 1
+                position[5], position[6] = est_lat, est_lon
+                updated.add(ap['bssid'])
+
+        now = time.time()
+        conn.executemany(SQL_UPSERT_LEARNED, [(bssid, *learned[bssid], now) for bssid in updated])
+        confident = []
+        for bssid in updated:
+            lat, lon, weight = learned[bssid][:3]
+            if weight < self.min_weight:
+                continue
+            current = located.get(bssid)
+            if current is not None and current[2] == 'learned' and \
+                    haversine_distances(current[0], current[1], lat, lon) <= self.min_move:
+                continue
+            if current is None or current[2] != 'learned':
+                self.promoted += 1
+            confident.append((bssid, lat, lon))
+        conn.executemany(SQL_UPSERT_LOCATION, confident)
+
+        self.scans_used += used
+        self.updates += len(updated)
+        return [(bssid, {'lat': lat, 'lon': lon, 'error': None}) for bssid, lat, lon in confident]
+
+    def stats(self, conn):
+        """Return the learned positions and learning counters as a dict."""
+        total, confident = conn.execute('SELECT COUNT(*), COALESCE(SUM(weight >= ?), 0) FROM ap_learned',
+                                        (self.min_weight,)).fetchone()
+        in_use = conn.execute("SELECT COUNT(*) FROM ap_locations WHERE source = 'learned'").fetchone()[0]
+        return {
+            'learned': total,
+            'confident': confident,
+            'provisional': total - confident,
+            'in_ap_locations': in_use,
+            'scans_used': self.scans_used,
+            'scans_skipped': self.scans_skipped,
+            'updates': self.updates,
+            'too_close': self.too_close,
+            'promoted': self.promoted,
+            'min_weight': self.min_weight
+        }
@@ -0,0 +1,230 @@
+import argparse
+import mmap
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+from dotenv import load_dotenv
+from observations import bssid_key
+
+# Load environment variables
+load_dotenv()
+
+DB_NAME = os.getenv('DB_FILENAME')
+
+# Immutable snapshot of ap_locations: header (magic, version, reserved, count, build time),
+# then the sorted 48 bit BSSID keys as uint64, then the latitudes and the longitudes as float64.
+# Every array is 8 byte aligned so it is used in place from the memory map.
+SNAPSHOT_MAGIC = b'APLS'
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = np.dtype([('magic', 'S4'), ('version', '<u2'), ('reserved', '<u2'),
+                            ('count', '<u8'), ('built_at', '<f8')])
+
+SQL_SELECT_CHANGED = 'SELECT bssid, lat, lon FROM ap_locations WHERE updated_at > ?'
+
+
+def init_change_tracking(conn):
+    """Add ap_locations.updated_at and the triggers that set it when a row is inserted or moved.
+
+    Like the R*Tree triggers of spatial.py they live in the database, so every writer sets
+    it: the app, download_bssids.py and AP learning. APSnapshot reads the rows changed since
+    the snapshot was built from it.
+    """
+    if 'updated_at' not in {row[1] for row in conn.execute('PRAGMA table_info(ap_locations)')}:
+        conn.execute('ALTER TABLE ap_locations ADD COLUMN updated_at REAL')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_ap_locations_updated_at ON ap_locations (updated_at)')
+    for name, event in (('insert', 'INSERT'), ('update', 'UPDATE OF lat, lon')):
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS ap_locations_updated_at_{name} AFTER {event} ON ap_locations
+            BEGIN
+                UPDATE ap_locations SET updated_at = (julianday('now') - 2440587.5) * 86400.0
+                WHERE rowid = new.rowid;
+            END
+        ''')
+
+
+def write_snapshot(conn, path):
+    """Write the located APs of ap_locations to path. Returns the number of APs written.
+
+    The file is written next to path and renamed over it, so workers that have the previous
+    snapshot mapped keep reading a complete file.
+    """
+    # Taken before reading, so rows changed while the snapshot is written count as newer
+    built_at = time.time()
+    keys = []
+    lats = []
+    lons = []
+    for bssid, lat, lon in conn.execute('SELECT bssid, lat, lon FROM ap_locations WHERE lat IS NOT NULL AND lon IS NOT NULL'):
+        try:
+            key = bssid_key(bssid)
+        except (AttributeError, ValueError):
+            continue
+        keys.append(key)
+        lats.append(lat)
+        lons.append(lon)
+    keys = np.array(keys, dtype='<u8')
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    # BSSIDs that differ only by separator or case map to one key, keep the first
+    unique = np.concatenate([[True], keys[1:] != keys[:-1]]) if len(keys) else np.zeros(0, bool)
+    header = np.array([(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, 0, int(unique.sum()), built_at)], dtype=SNAPSHOT_HEADER)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(header.tobytes())
+        f.write(keys[unique].tobytes())
+        f.write(np.array(lats, dtype='<f8')[order][unique].tobytes())
+        f.write(np.array(lons, dtype='<f8')[order][unique].tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return int(unique.sum())
+
+
+class APSnapshot:
+    """Read-only, memory-mapped BSSID -> (lat, lon) table written by write_snapshot.
+
+    Opening only maps the file and reads its header, whatever the number of APs; lookups
+    are binary searches on the mapped key array, and every worker process shares the
+    pages through the OS page cache. When the file is replaced by a new snapshot it is
+    mapped again, checked at most every `check_interval` seconds.
+
+    With a `db_pool`, the ap_locations rows updated after the snapshot was built (see
+    init_change_tracking) are read at the same checks and take precedence over it, so new
+    WiGLE answers and learned positions are not hidden until the next rebuild.
+    """
+
+    def __init__(self, path, check_interval=60.0, db_pool=None):
+        self.path = path
+        self.check_interval = check_interval
+        self.db_pool = db_pool
+        self._lock = threading.Lock()
+        self._checked_at = time.monotonic()
+        self._tables = None  # (stat identity, mmap, keys, lats, lons, built_at)
+        self._changed = {}  # BSSID key -> (lat, lon) of the rows updated after built_at
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self._open()
+        self._load_changed()
+
+    def _open(self):
+        with open(self.path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header = np.frombuffer(mapped, SNAPSHOT_HEADER, count=1)[0]
+        if header['magic'] != SNAPSHOT_MAGIC or header['version'] != SNAPSHOT_VERSION:
+            mapped.close()
+            raise ValueError(f"{self.path} is not a version {SNAPSHOT_VERSION} AP snapshot")
+        count = int(header['count'])
+        offset = SNAPSHOT_HEADER.itemsize
+        keys = np.frombuffer(mapped, '<u8', count, offset)
+        lats = np.frombuffer(mapped, '<f8', count, offset + 8 * count)
+        lons = np.frombuffer(mapped, '<f8', count, offset + 16 * count)
+        # The previous map stays valid for the arrays still referenced by other threads
+        self._tables = ((stat.st_ino, stat.st_mtime_ns), mapped, keys, lats, lons, float(header['built_at']))
+
+    def _load_changed(self):
+        """Read the ap_locations rows updated since the current snapshot was built."""
+        if self.db_pool is None:
+            return
+        changed = {}
+        try:
+            rows = self.db_pool.connection().execute(SQL_SELECT_CHANGED, (self._tables[5],)).fetchall()
+        except sqlite3.Error:
+            return  # e.g. a database without init_change_tracking yet, try again at the next check
+        for bssid, lat, lon in rows:
+            try:
+                changed[bssid_key(bssid)] = (lat, lon)
+            except (AttributeError, ValueError):
+                continue
+        self._changed = changed
+
+    def _current(self):
+        """Tables of the current snapshot, after mapping a replaced file again if it is time to check."""
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            with self._lock:
+                if now - self._checked_at >= self.check_interval:
+                    self._checked_at = now
+                    try:
+                        stat = os.stat(self.path)
+                        if (stat.st_ino, stat.st_mtime_ns) != self._tables[0]:
+                            self._open()
+                            self.reloads += 1
+                    except (OSError, ValueError):
+                        pass  # keep serving the snapshot already mapped
+                    self._load_changed()
+        return self._tables
+
+    def __len__(self):
+        return len(self._tables[2])
+
+    def lookup_many(self, bssids):
+        """Return {bssid: (lat, lon)} for the bssids found in the snapshot.
+
+        BSSIDs that are not 48 bit hex, e.g. from a malformed scan, are not found.
+        """
+        _, _, keys, lats, lons, _ = self._current()
+        changed = self._changed
+        result = {}
+        valid = []
+        query = []
+        for bssid in bssids:
+            try:
+                key = bssid_key(bssid)
+            except (AttributeError, ValueError):
+                continue
+            if key in changed:
+                lat, lon = changed[key]
+                if lat is not None and lon is not None:
+                    result[bssid] = (lat, lon)
+                continue
+            query.append(key)
+            valid.append(bssid)
+        if query and len(keys):
+            query = np.array(query, dtype=np.uint64)
+            pos = np.minimum(np.searchsorted(keys, query), len(keys) - 1)
+            found = keys[pos] == query
+            for i in np.flatnonzero(found):
+                result[valid[i]] = (float(lats[pos[i]]), float(lons[pos[i]]))
+        self.hits += len(result)
+        self.misses += len(bssids) - len(result)
+        return result
+
+    def lookup(self, bssid):
+        """(lat, lon) of one BSSID, or None when it is not in the snapshot."""
+        return self.lookup_many([bssid]).get(bssid)
+
+    def stats(self):
+        """Return the snapshot size, age and lookup counters as a dict."""
+        _, _, keys, _, _, built_at = self._tables
+        return {
+            'path': self.path,
+            'entries': len(keys),
+            'built_at': built_at,
+            'age_s': round(time.time() - built_at, 1),
+            'changed_since_built': len(self._changed),
+            'hits': self.hits,
+            'misses': self.misses,
+            'reloads': self.reloads
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write the memory-mapped AP location snapshot of ap_locations.')
+    parser.add_argument('--db', default=DB_NAME, help='SQLite database (default DB_FILENAME)')
+    parser.add_argument('--output', default=os.getenv('AP_SNAPSHOT') or 'ap_locations.snap',
+                        help='snapshot file (default AP_SNAPSHOT)')
+    args = parser.parse_args()
+    if not args.db:
+        parser.error('DB_FILENAME not set in .env and no --db given')
+
+    conn = sqlite3.connect(args.db)
+    count = write_snapshot(conn, args.output)
+    conn.close()
+    print(f"{count} AP locations written to {args.output} ({os.path.getsize(args.output)} bytes)")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,23 +1,39 @@
-import sqlite3
+import atexit
 import datetime
 import math
-import requests
-from requests.auth import HTTPBasicAuth
-from flask import Flask, request, render_template, jsonify
+from flask import Flask, request, render_template, jsonify, Response, stream_with_context, g
+import json
 from dotenv import load_dotenv
 import os
 import logging
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from db import ConnectionPool
+from live import ScanFeed
+from trajectory import simplify, aggregate_grid
+from spatial import init_spatial_index, aps_in_bbox, nearest_aps
+import estimator
+import numpy as np
+from ap_cache import LocationCache, normalize_bssid
+from fingerprint_cache import FingerprintCache
+from wigle_queue import WigleQueue
+from scan_writer import ScanWriter
+from ap_learning import APLearner
+from radiomap import RadioMapUpdater
+from ap_snapshot import APSnapshot, init_change_tracking
+from retention import ScanRetention, init_summary_table
+from packet import decode_cat_packets, PacketError, PACKET_VERSION, CAT_UID
+from metrics import Registry, sampled_logger
+from wigle_client import WigleClient, WigleError
+from observations import pack_observation
 
 # Load environment variables
 load_dotenv()
 
 app = Flask(__name__)
 
-# WiGLE API credentials
-WIGLE_USER = os.getenv('WIGLE_USER')
-WIGLE_TOKEN = os.getenv('WIGLE_TOKEN')
-WIGLE_API_URL = 'https://api.wigle.net/api/v2/network/search'
-
 # Load center points from .env
 map_center_str = os.getenv('MAP_CENTER')
 if not map_center_str:
@@ -39,6 +55,110 @@ if not DB_NAME:
     print("DB_FILENAME not set in .env")
 LOG_FILE = 'wigle_requests.log'
 
+# BSSID location cache settings
+AP_CACHE_SIZE = int(os.getenv('AP_CACHE_SIZE', '10000'))
+AP_CACHE_TTL = float(os.getenv('AP_CACHE_TTL', '86400'))  # seconds, positive results
+AP_CACHE_NEGATIVE_TTL = float(os.getenv('AP_CACHE_NEGATIVE_TTL', '3600'))  # seconds, unknown/failed BSSIDs
+
+# Memory-mapped ap_locations snapshot written by ap_snapshot.py or download_bssids.py --snapshot, empty = none.
+# Looked up before SQLite; rows updated since it was built (WiGLE answers, learned positions)
+# are read from ap_locations every AP_SNAPSHOT_CHECK_INTERVAL and take precedence over it.
+AP_SNAPSHOT = os.getenv('AP_SNAPSHOT', '')
+AP_SNAPSHOT_CHECK_INTERVAL = float(os.getenv('AP_SNAPSHOT_CHECK_INTERVAL', '60'))  # seconds between checks for a new file
+
+# Scan fingerprint -> position memo
+FINGERPRINT_CACHE_SIZE = int(os.getenv('FINGERPRINT_CACHE_SIZE', '10000'))
+FINGERPRINT_TTL = float(os.getenv('FINGERPRINT_TTL', '3600'))  # seconds
+FINGERPRINT_RSSI_BUCKET = int(os.getenv('FINGERPRINT_RSSI_BUCKET', '6'))  # dB
+
+# Concurrent WiGLE resolution of scan misses
+WIGLE_WORKERS = int(os.getenv('WIGLE_WORKERS', '4'))
+WIGLE_DEADLINE = float(os.getenv('WIGLE_DEADLINE', '5.0'))  # seconds a scan waits for WiGLE misses
+
+# Background WiGLE miss queue: when enabled, ingest never waits on WiGLE
+WIGLE_ASYNC = os.getenv('WIGLE_ASYNC', '1') == '1'
+WIGLE_QUEUE_BUDGET = int(os.getenv('WIGLE_QUEUE_BUDGET', '100'))  # WiGLE requests per period, per process
+WIGLE_QUEUE_PERIOD = float(os.getenv('WIGLE_QUEUE_PERIOD', '86400'))  # seconds
+WIGLE_QUEUE_MAX_ATTEMPTS = int(os.getenv('WIGLE_QUEUE_MAX_ATTEMPTS', '5'))
+WIGLE_QUEUE_RETRY_DELAY = float(os.getenv('WIGLE_QUEUE_RETRY_DELAY', '300'))  # seconds, doubled per attempt
+WIGLE_QUEUED_ERROR = 'Queued for WiGLE lookup'
+
+# AP positions learned from our own estimates, see ap_learning.py
+AP_LEARNING = os.getenv('AP_LEARNING', '1') == '1'
+AP_LEARN_MIN_APS = int(os.getenv('AP_LEARN_MIN_APS', '3'))  # located APs an estimate needs to be learned from
+AP_LEARN_MIN_WEIGHT = float(os.getenv('AP_LEARN_MIN_WEIGHT', '3.0'))  # confidence from which a learned position is used
+AP_LEARN_MAX_WEIGHT = float(os.getenv('AP_LEARN_MAX_WEIGHT', '100.0'))  # cap, so that APs which moved are followed
+AP_LEARN_PRIOR_WEIGHT = float(os.getenv('AP_LEARN_PRIOR_WEIGHT', '3.0'))  # weight of the WiGLE position in the mean
+AP_LEARN_MIN_SPACING = float(os.getenv('AP_LEARN_MIN_SPACING', '20.0'))  # meters between two estimates learned from
+AP_LEARN_RSSI_REF = float(os.getenv('AP_LEARN_RSSI_REF', '-60'))  # dBm of a full weight observation
+AP_LEARN_MIN_MOVE = float(os.getenv('AP_LEARN_MIN_MOVE', '5.0'))  # meters before ap_locations is rewritten
+
+# Tracker id given to scans that do not carry one (older firmware, JSON without device_id)
+DEFAULT_DEVICE_ID = os.getenv('DEFAULT_DEVICE_ID', f'{CAT_UID:08X}')
+
+# Link metrics sent by the station with each scan, stored in scans.vbat, cat_rssi, cat_snr, ap_rssi, ap_snr
+LINK_FIELDS = ('cat_vbatt', 'cat_rssi', 'cat_snr', 'ap_rssi', 'ap_snr')
+NO_LINK_METRICS = (None,) * len(LINK_FIELDS)
+
+# Position estimation, see estimator.py
+ESTIMATOR_ALGORITHM = os.getenv('ESTIMATOR_ALGORITHM', 'centroid')  # centroid, trilateration or radiomap
+ESTIMATOR_TOP_K = int(os.getenv('ESTIMATOR_TOP_K', '0')) or None  # only use the k strongest APs, 0 = all
+ESTIMATOR_TX_POWER = float(os.getenv('ESTIMATOR_TX_POWER', str(estimator.DEFAULT_TX_POWER_1M)))  # dBm at 1 m
+ESTIMATOR_PATH_LOSS_EXPONENT = float(os.getenv('ESTIMATOR_PATH_LOSS_EXPONENT', str(estimator.DEFAULT_PATH_LOSS_EXPONENT)))
+# Fingerprint radio map, see radiomap.py: scans it does not cover fall back to RADIO_MAP_FALLBACK.
+# Off unless ESTIMATOR_ALGORITHM=radiomap: the map is built from our own estimates, and on
+# test/synthetic_dataset.py it is no more accurate than the fallback (19.4 m vs 19.3 m median
+# error). A match may only move the fallback estimate by RADIO_MAP_MAX_OFFSET; what the map
+# adds is a position for the scans none of whose APs has a location.
+RADIO_MAP = ESTIMATOR_ALGORITHM == 'radiomap'
+RADIO_MAP_FALLBACK = os.getenv('RADIO_MAP_FALLBACK', 'centroid')
+RADIO_MAP_CELL_SIZE = float(os.getenv('RADIO_MAP_CELL_SIZE', '10'))  # meters
+RADIO_MAP_MIN_SCANS = int(os.getenv('RADIO_MAP_MIN_SCANS', '2'))  # scans a cell needs to be kept
+RADIO_MAP_WINDOW_DAYS = float(os.getenv('RADIO_MAP_WINDOW_DAYS', '30'))  # days of scans the map is built from
+RADIO_MAP_REBUILD_INTERVAL = float(os.getenv('RADIO_MAP_REBUILD_INTERVAL', '3600'))  # seconds
+RADIO_MAP_K = int(os.getenv('RADIO_MAP_K', '4'))  # nearest cells averaged
+RADIO_MAP_MIN_COMMON = int(os.getenv('RADIO_MAP_MIN_COMMON', '4'))  # BSSIDs a cell must share with the scan
+RADIO_MAP_MAX_DISTANCE = float(os.getenv('RADIO_MAP_MAX_DISTANCE', '6'))  # dB RMS, farther cells do not match
+RADIO_MAP_MAX_OFFSET = float(os.getenv('RADIO_MAP_MAX_OFFSET', '15'))  # meters from the fallback estimate, farther matches are rejected
+ESTIMATOR_OPTIONS = {
+    'algorithm': RADIO_MAP_FALLBACK if RADIO_MAP else ESTIMATOR_ALGORITHM,
+    'k': ESTIMATOR_TOP_K,
+    'tx_power': ESTIMATOR_TX_POWER,
+    'exponent': ESTIMATOR_PATH_LOSS_EXPONENT
+}
+
+# /api/points: point budget, and range length from which points are aggregated on a grid
+POINTS_MAX_POINTS = int(os.getenv('POINTS_MAX_POINTS', '2000'))
+POINTS_GRID_AFTER = float(os.getenv('POINTS_GRID_AFTER', '7'))  # days
+
+# Scan retention, see retention.py: scans older than SCAN_RETENTION_DAYS are rolled into per-tracker,
+# per-interval summaries and deleted. The raw observations go with them, so keep at least
+# RADIO_MAP_WINDOW_DAYS when the radio map estimator is used.
+SCAN_RETENTION_DAYS = float(os.getenv('SCAN_RETENTION_DAYS', '0'))  # days, 0 = keep every scan
+SCAN_SUMMARY_INTERVAL = int(os.getenv('SCAN_SUMMARY_INTERVAL', '900'))  # seconds of fixes per summary
+SCAN_RETENTION_INTERVAL = float(os.getenv('SCAN_RETENTION_INTERVAL', '3600'))  # seconds between runs
+SCAN_RETENTION_BATCH = int(os.getenv('SCAN_RETENTION_BATCH', '5000'))  # scans deleted per transaction
+SCAN_VACUUM_PAGES = int(os.getenv('SCAN_VACUUM_PAGES', '1000'))  # pages released per transaction
+
+# Live map stream: how often a stream checks the database for fixes committed by other workers
+LIVE_POLL_INTERVAL = float(os.getenv('LIVE_POLL_INTERVAL', '15'))  # seconds
+
+# Bulk ingest: scans resolved, estimated and committed together
+BULK_CHUNK_SIZE = int(os.getenv('BULK_CHUNK_SIZE', '1000'))
+
+# Write-behind scan persistence: the response is sent once the scan is buffered, a flusher
+# commits the buffer every SCAN_FLUSH_INTERVAL seconds or SCAN_FLUSH_ROWS scans. A crash
+# loses at most SCAN_BUFFER_MAX_ROWS scans (ingest blocks when that many are unsaved).
+SCAN_WRITE_BEHIND = os.getenv('SCAN_WRITE_BEHIND', '0') == '1'
+SCAN_FLUSH_INTERVAL = float(os.getenv('SCAN_FLUSH_INTERVAL', '0.2'))  # seconds
+SCAN_FLUSH_ROWS = int(os.getenv('SCAN_FLUSH_ROWS', '500'))
+SCAN_BUFFER_MAX_ROWS = int(os.getenv('SCAN_BUFFER_MAX_ROWS', '5000'))
+SCAN_FLUSH_MAX_ATTEMPTS = int(os.getenv('SCAN_FLUSH_MAX_ATTEMPTS', '3'))  # failed writes before a batch is dropped
+
+# Per-request debug output: fraction of records kept, written to stdout by a background thread
+REQUEST_LOG_SAMPLE_RATE = float(os.getenv('REQUEST_LOG_SAMPLE_RATE', '0.01'))
+REQUEST_LOG_QUEUE_SIZE = int(os.getenv('REQUEST_LOG_QUEUE_SIZE', '10000'))
+
 # Configure logging
 logging.basicConfig(
     filename=LOG_FILE,
@@ -46,17 +166,115 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
+# Sampled, non-blocking replacement of the per-request prints
+request_log, request_log_listener = sampled_logger('requests', REQUEST_LOG_SAMPLE_RATE,
+                                                   logging.StreamHandler(sys.stdout), REQUEST_LOG_QUEUE_SIZE)
+
+# Per-worker connection pool, created once and reused across requests
+db_pool = ConnectionPool(DB_NAME)
+
+# In-process BSSID location cache in front of ap_locations and WiGLE
+ap_cache = LocationCache(maxsize=AP_CACHE_SIZE, ttl=AP_CACHE_TTL, negative_ttl=AP_CACHE_NEGATIVE_TTL)
+
+# Zero-query lookups of the snapshot, shared by the worker processes through the page cache
+ap_snapshot = None
+if AP_SNAPSHOT:
+    try:
+        ap_snapshot = APSnapshot(AP_SNAPSHOT, check_interval=AP_SNAPSHOT_CHECK_INTERVAL, db_pool=db_pool)
+    except (OSError, ValueError) as e:
+        logging.error(f"AP snapshot {AP_SNAPSHOT} not used: {e}")
+
+# Scan fingerprint (BSSID set + quantized RSSI) -> estimated position, for pets that did not move
+fingerprint_cache = FingerprintCache(maxsize=FINGERPRINT_CACHE_SIZE, ttl=FINGERPRINT_TTL,
+                                     rssi_bucket=FINGERPRINT_RSSI_BUCKET)
+
+# WiGLE API client: credentials, timeouts, retries, shared quota and response cache, see wigle_client.py
+wigle_client = WigleClient()
+
+# Bounded worker pool for WiGLE lookups, with at most one request in flight per BSSID
+wigle_executor = ThreadPoolExecutor(max_workers=WIGLE_WORKERS, thread_name_prefix='wigle')
+wigle_inflight = {}
+wigle_inflight_lock = threading.Lock()
+
+# Wakes up the live map streams when scans are committed
+scan_feed = ScanFeed()
+
+# Prometheus metrics served on /metrics
+metrics = Registry()
+request_seconds = metrics.histogram('petwifi_request_seconds', 'HTTP request latency', ('endpoint',))
+stage_seconds = metrics.histogram('petwifi_stage_seconds', 'Time spent in each scan processing stage', ('stage',))
+wigle_requests = metrics.counter('petwifi_wigle_requests_total', 'WiGLE API calls by outcome', ('result',))
+wigle_quota_errors = metrics.counter('petwifi_wigle_quota_errors_total', 'WiGLE calls refused for quota or rate limit')
+scans_ingested = metrics.counter('petwifi_scans_ingested_total', 'Scans received')
+aps_unlocated = metrics.counter('petwifi_aps_unlocated_total', 'Scanned APs without a known location')
+metrics.gauge('petwifi_cache_hit_ratio', 'Hit ratio of the in-process caches',
+              lambda: {'location': ap_cache.stats()['hit_ratio'], 'fingerprint': fingerprint_cache.stats()['hit_ratio']},
+              label='cache')
+metrics.gauge('petwifi_cache_size', 'Entries of the in-process caches',
+              lambda: {'location': ap_cache.stats()['size'], 'fingerprint': fingerprint_cache.stats()['size']},
+              label='cache')
+metrics.gauge('petwifi_wigle_queue_size', 'BSSIDs waiting in the WiGLE queue', lambda: wigle_queue.stats()['queued'])
+
+# Statements used on the request path, compiled once per connection by the statement cache
+SQL_SELECT_AP_LOCATION = 'SELECT lat, lon FROM ap_locations WHERE bssid = ?'
+SQL_SELECT_AP_LOCATIONS = 'SELECT bssid, lat, lon FROM ap_locations WHERE bssid IN ({})'
+SQLITE_MAX_IN_PARAMS = 500
+# Upsert in place: the rowid is the key of the ap_locations_rtree spatial index
+SQL_INSERT_AP_LOCATION = ("INSERT INTO ap_locations (bssid, lat, lon, source) VALUES (?, ?, ?, 'wigle') "
+                          "ON CONFLICT(bssid) DO UPDATE SET lat = excluded.lat, lon = excluded.lon, source = 'wigle'")
+SQL_INSERT_SCAN = ('INSERT INTO scans (device_id, scan_id, timestamp, est_lat, est_lon, '
+                   'vbat, cat_rssi, cat_snr, ap_rssi, ap_snr, observation) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)')
+SQL_UPDATE_SCAN_ESTIMATE = 'UPDATE scans SET est_lat = ?, est_lon = ? WHERE id = ?'
+SQL_SELECT_SCANS_RANGE = ('SELECT est_lat, est_lon, timestamp FROM scans '
+                          'WHERE timestamp > ? AND timestamp <= ? AND est_lat IS NOT NULL ORDER BY timestamp')
+# One tracker: served by the (device_id, timestamp) index without reading the other trackers' rows
+SQL_SELECT_DEVICE_SCANS_RANGE = ('SELECT est_lat, est_lon, timestamp FROM scans '
+                                 'WHERE device_id = ? AND timestamp > ? AND timestamp <= ? AND est_lat IS NOT NULL '
+                                 'ORDER BY timestamp')
+# Fixes aged out of scans by the retention job, one per tracker and interval
+SQL_SELECT_SUMMARIES_RANGE = ('SELECT lat, lon, bucket_start, count FROM scan_summaries '
+                              'WHERE bucket_start > ? AND bucket_start <= ? ORDER BY bucket_start')
+SQL_SELECT_DEVICE_SUMMARIES_RANGE = ('SELECT lat, lon, bucket_start, count FROM scan_summaries '
+                                     'WHERE device_id = ? AND bucket_start > ? AND bucket_start <= ? ORDER BY bucket_start')
+SQL_SELECT_SCANS_AFTER_ID = 'SELECT id, est_lat, est_lon, timestamp, device_id FROM scans WHERE id > ? ORDER BY id LIMIT 1000'
+SQL_SELECT_SCANS_BY_ID = 'SELECT id, est_lat, est_lon, timestamp, device_id FROM scans WHERE id IN ({})'
+SQL_SELECT_MAX_SCAN_ID = 'SELECT COALESCE(MAX(id), 0) FROM scans'
+SQL_SELECT_SCANS_CENTER = ('SELECT AVG(est_lat), AVG(est_lon) FROM scans '
+                           'WHERE timestamp > ? AND est_lat IS NOT NULL')
+SQL_SELECT_DEVICE_SCANS_CENTER = ('SELECT AVG(est_lat), AVG(est_lon) FROM scans '
+                                  'WHERE device_id = ? AND timestamp > ? AND est_lat IS NOT NULL')
+# Per tracker summary, kept up to date by store_scans
+SQL_UPSERT_DEVICE = ('INSERT INTO devices (device_id, first_seen, last_seen, last_lat, last_lon, scans) '
+                     'VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(device_id) DO UPDATE SET '
+                     'last_lat = CASE WHEN excluded.last_lat IS NOT NULL AND excluded.last_seen >= devices.last_seen '
+                     'THEN excluded.last_lat ELSE devices.last_lat END, '
+                     'last_lon = CASE WHEN excluded.last_lat IS NOT NULL AND excluded.last_seen >= devices.last_seen '
+                     'THEN excluded.last_lon ELSE devices.last_lon END, '
+                     'first_seen = MIN(devices.first_seen, excluded.first_seen), '
+                     'last_seen = MAX(devices.last_seen, excluded.last_seen), '
+                     'scans = devices.scans + excluded.scans')
+SQL_SELECT_DEVICES = 'SELECT device_id, first_seen, last_seen, last_lat, last_lon, scans FROM devices ORDER BY device_id'
+SQL_SELECT_DEVICE = 'SELECT device_id, first_seen, last_seen, last_lat, last_lon, scans FROM devices WHERE device_id = ?'
+SQL_INSERT_PENDING_AP = 'INSERT INTO scan_pending_aps (scan_row, bssid, rssi) VALUES (?, ?, ?)'
+SQL_SELECT_PENDING_SCANS = 'SELECT DISTINCT scan_row FROM scan_pending_aps WHERE bssid = ?'
+SQL_SELECT_PENDING_APS = 'SELECT bssid, rssi FROM scan_pending_aps WHERE scan_row = ?'
+SQL_DELETE_PENDING_APS = 'DELETE FROM scan_pending_aps WHERE scan_row = ?'
+
 def init_db():
     """Initialize the SQLite database."""
-    conn = sqlite3.connect(DB_NAME)
+    conn = db_pool.connection()
     cursor = conn.cursor()
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS ap_locations (
             bssid TEXT PRIMARY KEY,
             lat REAL,
-            lon REAL
+            lon REAL,
+            source TEXT DEFAULT 'wigle'
         )
     ''')
+    # 'wigle' for the positions looked up or downloaded, 'learned' for those copied from ap_learned
+    if 'source' not in [row[1] for row in cursor.execute('PRAGMA table_info(ap_locations)')]:
+        cursor.execute("ALTER TABLE ap_locations ADD COLUMN source TEXT DEFAULT 'wigle'")
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS scans (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -68,151 +286,945 @@ def init_db():
             ap_rssi INTEGER,
             ap_snr INTEGER,
             est_lat REAL,
-            est_lon REAL
+            est_lon REAL,
+            device_id TEXT,
+            observation BLOB
         )
     ''')
+    # Databases created before multi-tracker support: their scans belong to the default tracker
+    if 'device_id' not in [row[1] for row in cursor.execute('PRAGMA table_info(scans)')]:
+        cursor.execute('ALTER TABLE scans ADD COLUMN device_id TEXT')
+        cursor.execute('UPDATE scans SET device_id = ?', (DEFAULT_DEVICE_ID,))
+    # Raw observation of the scan, see observations.py
+    if 'observation' not in [row[1] for row in cursor.execute('PRAGMA table_info(scans)')]:
+        cursor.execute('ALTER TABLE scans ADD COLUMN observation BLOB')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_scans_timestamp ON scans (timestamp)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_scans_device_timestamp ON scans (device_id, timestamp)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS devices (
+            device_id TEXT PRIMARY KEY,
+            first_seen DATETIME,
+            last_seen DATETIME,
+            last_lat REAL,
+            last_lon REAL,
+            scans INTEGER DEFAULT 0
+        )
+    ''')
+    if cursor.execute('SELECT COUNT(*) FROM devices').fetchone()[0] == 0:
+        cursor.execute('''
+            INSERT INTO devices (device_id, first_seen, last_seen, last_lat, last_lon, scans)
+            SELECT device_id, MIN(timestamp), MAX(timestamp),
+                   (SELECT est_lat FROM scans f WHERE f.device_id = s.device_id AND est_lat IS NOT NULL
+                    ORDER BY timestamp DESC LIMIT 1),
+                   (SELECT est_lon FROM scans f WHERE f.device_id = s.device_id AND est_lat IS NOT NULL
+                    ORDER BY timestamp DESC LIMIT 1),
+                   COUNT(*)
+            FROM scans s GROUP BY device_id
+        ''')
+    # APs of scans estimated while some of their BSSIDs were queued for WiGLE
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS scan_pending_aps (
+            scan_row INTEGER,
+            bssid TEXT,
+            rssi INTEGER
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_scan_pending_aps_bssid ON scan_pending_aps (bssid)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_scan_pending_aps_scan ON scan_pending_aps (scan_row)')
+    init_summary_table(conn)
+    wigle_queue.init_db(conn)
+    if ap_learner is not None:
+        ap_learner.init_db(conn)
+    init_spatial_index(conn)
+    init_change_tracking(conn)
     conn.commit()
-    conn.close()
 
 def get_ap_location(bssid):
-    """Query local database first, then WiGLE API if BSSID is missing."""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute('SELECT lat, lon FROM ap_locations WHERE bssid = ?', (bssid.upper(),))
-    result = cursor.fetchone()
+    """Query the in-memory cache, then the local database, then WiGLE API if BSSID is missing."""
+    bssid = normalize_bssid(bssid)
+    loc = ap_cache.get(bssid)
+    if loc is not None:
+        return loc
+    loc = lookup_ap_location(bssid)
+    ap_cache.put(bssid, loc)
+    return loc
+
+def lookup_ap_location(bssid):
+    """Query the snapshot and the local database first, then WiGLE API if BSSID is missing."""
+    if ap_snapshot is not None:
+        found = ap_snapshot.lookup(bssid)
+        if found is not None:
+            return {'lat': found[0], 'lon': found[1], 'error': None}
+    conn = db_pool.connection()
+    result = conn.execute(SQL_SELECT_AP_LOCATION, (bssid.upper(),)).fetchone()
     if result:
-        conn.close()
         return {'lat': result[0], 'lon': result[1], 'error': None}
+    return query_wigle_location(bssid)
 
-    # BSSID not in local database, query WiGLE API
+def query_wigle_location(bssid):
+    """Query WiGLE API for a BSSID and store the location found in the local database."""
     params = {
         'netid': bssid.upper(),
         'onlymine': 'false',
         'freenet': 'false',
         'paynet': 'false'
     }
-    headers = {'Accept': 'application/json'}
-    logging.info(f"WiGLE API request for BSSID {bssid}: {params}")
     try:
-        response = requests.get(WIGLE_API_URL, params=params, auth=HTTPBasicAuth(WIGLE_USER, WIGLE_TOKEN), headers=headers)
-        logging.info(f"WiGLE API response status for BSSID {bssid}: {response.status_code}")
-        if response.status_code == 200:
-            data = response.json()
-            if data.get('success') and data.get('resultCount', 0) > 0:
-                result = data['results'][0]
-                lat = result.get('trilat')
-                lon = result.get('trilong')
-                if lat is not None and lon is not None:
-                    cursor.execute('INSERT INTO ap_locations (bssid, lat, lon) VALUES (?, ?, ?)',
-                                   (bssid.upper(), lat, lon))
-                    conn.commit()
-                    conn.close()
-                    return {'lat': lat, 'lon': lon, 'error': None}
-                else:
-                    conn.close()
-                    return {'lat': None, 'lon': None, 'error': 'WiGLE returned no location data'}
-            else:
-                conn.close()
-                error_msg = f"WiGLE API error: {data.get('message', 'Unknown error')}"
-                logging.error(error_msg)
-                return {'lat': None, 'lon': None, 'error': error_msg}
+        with stage_seconds.time('wigle'):
+            data = wigle_client.search(params)
+    except WigleError as e:
+        if e.quota:
+            wigle_quota_errors.inc()
+        if e.status == 200:
+            wigle_requests.inc('api_error')
+            error_msg = f"WiGLE API error: {e.message}"
+        elif e.status is not None:
+            wigle_requests.inc('http_error')
+            error_msg = f"WiGLE HTTP {e.status}: {e.message}"
         else:
-            conn.close()
-            error_msg = f"WiGLE HTTP {response.status_code}: {response.text}"
-            logging.error(error_msg)
-            return {'lat': None, 'lon': None, 'error': error_msg}
-    except requests.RequestException as e:
-        conn.close()
-        error_msg = f"WiGLE request failed: {str(e)}"
-        logging.error(error_msg)
+            # Network errors and local quota refusals, both worth retrying later
+            wigle_requests.inc('network_error')
+            error_msg = f"WiGLE request failed: {e.message}"
+        logging.error(f"{error_msg} (BSSID {bssid})")
         return {'lat': None, 'lon': None, 'error': error_msg}
+    if data.get('resultCount', 0) > 0:
+        result = data['results'][0]
+        lat = result.get('trilat')
+        lon = result.get('trilong')
+        if lat is not None and lon is not None:
+            conn = db_pool.connection()
+            with conn:
+                conn.execute(SQL_INSERT_AP_LOCATION, (bssid.upper(), lat, lon))
+            fingerprint_cache.invalidate_bssid(bssid)
+            wigle_requests.inc('found')
+            return {'lat': lat, 'lon': lon, 'error': None}
+    wigle_requests.inc('no_location')
+    return {'lat': None, 'lon': None, 'error': 'WiGLE returned no location data'}
+
+def resolve_wigle_location(bssid):
+    """Worker task: query WiGLE and cache the answer, even if the requesting scan gave up on it."""
+    try:
+        loc = query_wigle_location(bssid)
+        ap_cache.put(bssid, loc)
+        return loc
+    finally:
+        with wigle_inflight_lock:
+            wigle_inflight.pop(bssid, None)
+
+def submit_wigle_lookup(bssid):
+    """Return the future of the WiGLE lookup for bssid, starting one if none is in flight."""
+    with wigle_inflight_lock:
+        future = wigle_inflight.get(bssid)
+        if future is None:
+            future = wigle_executor.submit(resolve_wigle_location, bssid)
+            wigle_inflight[bssid] = future
+        return future
+
+def is_transient_wigle_error(loc):
+    """True for WiGLE failures worth retrying (HTTP errors such as quota, network failures)."""
+    return loc['error'] is not None and loc['error'].startswith(('WiGLE HTTP', 'WiGLE request failed'))
+
+def on_wigle_resolved(bssid, loc):
+    """WiGLE queue callback: cache the answer and re-estimate the scans that were waiting for it."""
+    ap_cache.put(bssid, loc)
+    reestimate_pending_scans(bssid)
+
+def lookup_queued_bssid(bssid):
+    """WiGLE queue lookup: skip WiGLE when the BSSID got resolved since it was queued."""
+    loc = ap_cache.get(bssid)
+    if loc is not None and loc['error'] != WIGLE_QUEUED_ERROR:
+        return loc
+    return lookup_ap_location(bssid)
+
+# Persistent WiGLE miss queue, drained in the background under a request budget
+wigle_queue = WigleQueue(db_pool, lookup_queued_bssid, on_wigle_resolved, retryable=is_transient_wigle_error,
+                         requests_sent=lambda: wigle_client.requests,
+                         budget=WIGLE_QUEUE_BUDGET, period=WIGLE_QUEUE_PERIOD,
+                         max_attempts=WIGLE_QUEUE_MAX_ATTEMPTS, retry_delay=WIGLE_QUEUE_RETRY_DELAY)
+
+def get_ap_locations(bssids, deadline=WIGLE_DEADLINE, queue_misses=WIGLE_ASYNC):
+    """Resolve a batch of BSSIDs: cache, snapshot, then one ap_locations query, then WiGLE for the rest.
+
+    Returns a dict normalized BSSID -> location dict. With `queue_misses` the unknown BSSIDs
+    are returned as WIGLE_QUEUED_ERROR entries right away; the caller pushes them onto the
+    WiGLE queue once the scans that need them are stored.
+    Otherwise they are looked up concurrently; those still pending after `deadline` seconds
+    get an error entry, their lookup keeps running and its answer lands in the cache.
+    """
+    locations = {}
+    missing = []
+    for bssid in dict.fromkeys(normalize_bssid(b) for b in bssids):
+        loc = ap_cache.get(bssid)
+        if loc is not None:
+            locations[bssid] = loc
+        else:
+            missing.append(bssid)
+
+    if missing and ap_snapshot is not None:
+        for bssid, (lat, lon) in ap_snapshot.lookup_many(missing).items():
+            locations[bssid] = {'lat': lat, 'lon': lon, 'error': None}
+        missing = [bssid for bssid in missing if bssid not in locations]
+
+    if missing:
+        conn = db_pool.connection()
+        with stage_seconds.time('db_lookup'):
+            for i in range(0, len(missing), SQLITE_MAX_IN_PARAMS):
+                chunk = missing[i:i + SQLITE_MAX_IN_PARAMS]
+                sql = SQL_SELECT_AP_LOCATIONS.format(','.join('?' * len(chunk)))
+                for bssid, lat, lon in conn.execute(sql, chunk):
+                    loc = {'lat': lat, 'lon': lon, 'error': None}
+                    ap_cache.put(bssid, loc)
+                    locations[bssid] = loc
+        missing = [bssid for bssid in missing if bssid not in locations]
+
+    if missing and queue_misses:
+        for bssid in missing:
+            loc = {'lat': None, 'lon': None, 'error': WIGLE_QUEUED_ERROR}
+            ap_cache.put(bssid, loc)
+            locations[bssid] = loc
+    elif missing:
+        futures = {submit_wigle_lookup(bssid): bssid for bssid in missing}
+        done, pending = wait(futures, timeout=deadline)
+        for future in done:
+            locations[futures[future]] = future.result()
+        for future in pending:
+            locations[futures[future]] = {'lat': None, 'lon': None, 'error': 'WiGLE lookup still pending'}
+
+    return locations
 
 
 @app.route('/api/track', methods=['GET'])
 def track_device():
     """Track a device's location based on its BSSID."""
-    scan_id = request.args.get('scan_id', type=int)
-    bssids = request.args.getlist('bssid[]')
-    rssis = request.args.getlist('rssi[]')
-    print(f"Received track request: scan_id={scan_id}, bssids={bssids}, rssis={rssis}")
+    with stage_seconds.time('parse'):
+        # The station firmware appends a ',' to every value, e.g. scan_id=12,
+        scan_id = request.args.get('scan_id', type=lambda v: int(v.rstrip(',')))
+        device_id = normalize_device_id(request.args.get('uid'))
+        link = link_metrics(request.args)
+        bssids = [b.rstrip(',') for b in request.args.getlist('bssid[]')]
+        rssis = [r.rstrip(',') for r in request.args.getlist('rssi[]')]
+        request_log.debug("Received track request: device=%s, scan_id=%s, bssids=%s, rssis=%s",
+                          device_id, scan_id, bssids, rssis)
 
-    aps = []
-    for bssid, rssi in zip(bssids, rssis):
-        if not bssid or not rssi:
-            return jsonify({'error': 'Missing bssid or rssi parameters'}), 400
-        aps.append({'bssid': bssid, 'rssi': int(rssi)})
+        aps = []
+        for bssid, rssi in zip(bssids, rssis):
+            if not bssid or not rssi:
+                return jsonify({'error': 'Missing bssid or rssi parameters'}), 400
+            aps.append({'bssid': bssid, 'rssi': int(rssi)})
 
     aps_with_loc = []
     errors = []
-    return process_aps(scan_id, aps, aps_with_loc, errors)
+    return process_aps(scan_id, aps, aps_with_loc, errors, device_id, link)
 
 
 @app.route('/api/scan', methods=['POST'])
 def receive_scan():
     """Handle incoming scan data and estimate IoT position."""
-    data = request.json
-    if not data or 'aps' not in data or 'scan_id' not in data:
+    with stage_seconds.time('parse'):
+        data = request.json
+    if not isinstance(data, dict) or 'aps' not in data or 'scan_id' not in data:
         return jsonify({'error': 'Invalid data format'}), 400
+    try:
+        aps = parse_scan_aps(data['aps'])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
     aps_with_loc = []
     errors = []
-    return process_aps(data['scan_id'], data['aps'], aps_with_loc, errors)
+    return process_aps(data['scan_id'], aps, aps_with_loc, errors,
+                       normalize_device_id(data.get('device_id')), link_metrics(data))
+
+
+@app.route('/api/packet', methods=['POST'])
+def receive_packets():
+    """Handle one or more raw CatPackets (packet.h wire format) posted back to back.
+
+    The station side link metrics, which are not part of the packet, come as the ?ap_rssi=
+    and ?ap_snr= query arguments.
+    """
+    version = request.args.get('version', default=PACKET_VERSION, type=int)
+    try:
+        with stage_seconds.time('parse'):
+            packets = decode_cat_packets(request.get_data(cache=False), version)
+    except PacketError as e:
+        return jsonify({'error': str(e)}), 400
+
+    results = []
+    for packet in packets:
+        device_id = normalize_device_id(packet['uid'])
+        link = link_metrics({'cat_vbatt': packet['vbatt'], 'cat_rssi': packet['cat_rssi'], 'cat_snr': packet['cat_snr'],
+                             'ap_rssi': request.args.get('ap_rssi'), 'ap_snr': request.args.get('ap_snr')})
+        result = process_scan(packet['scan_id'], packet['aps'], [], [], device_id, link)
+        result['scan_id'] = packet['scan_id']
+        result['device_id'] = device_id
+        results.append(result)
+    return jsonify({'status': 'success', 'results': results}), 200
+
+
+@app.route('/api/scans', methods=['POST'])
+def receive_scans():
+    """Bulk ingest: a JSON array of scans, or an NDJSON body with one scan per line.
+
+    A scan is {"scan_id", "aps", optional "timestamp" (ISO 8601), optional "device_id"} plus
+    the optional link metrics of LINK_FIELDS.
+
+    Scans are handled in chunks of BULK_CHUNK_SIZE: the BSSIDs of a chunk are resolved once,
+    all its positions estimated and written in one transaction. Per-scan results are streamed
+    back as NDJSON, one line per scan in input order.
+    """
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        scans = iter_ndjson(request.stream)
+    else:
+        data = request.get_json(silent=True)
+        if not isinstance(data, list):
+            return jsonify({'error': 'Expected a JSON array or an NDJSON body of scans'}), 400
+        scans = iter(data)
+
+    def generate():
+        chunk = []
+        for scan in scans:
+            chunk.append(scan)
+            if len(chunk) >= BULK_CHUNK_SIZE:
+                for result in process_scan_batch(chunk):
+                    yield json.dumps(result) + '\n'
+                chunk = []
+        if chunk:
+            for result in process_scan_batch(chunk):
+                yield json.dumps(result) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+def iter_ndjson(stream):
+    """Yield the JSON value of each non-empty line of a binary stream, or an error dict."""
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield {'error': f'Invalid JSON line: {e}'}
+
+
+def local_naive(timestamp):
+    """A datetime as naive local time, the form every stored timestamp uses."""
+    if timestamp.tzinfo is not None:
+        return timestamp.astimezone().replace(tzinfo=None)
+    return timestamp
 
 
-def process_aps(scan_id, aps, aps_with_loc, errors):
-    print(str(aps))
+def parse_scan_aps(aps):
+    """The APs of a scan that have a BSSID and an RSSI, as {'bssid', 'rssi'} dicts with an int RSSI.
+
+    Raises ValueError when aps is not a list of objects or an AP has a BSSID or RSSI of the wrong type.
+    """
+    if not isinstance(aps, list):
+        raise ValueError('aps must be a list')
+    valid_aps = []
     for ap in aps:
+        if not isinstance(ap, dict):
+            raise ValueError('Each AP must be an object with bssid and rssi')
         bssid = ap.get('bssid')
         rssi = ap.get('rssi')
-        if bssid and rssi:
-            loc = get_ap_location(bssid)
-            if loc['lat'] is not None and loc['lon'] is not None:
-                # Weight based on signal strength (convert dBm to linear scale)
-                weight = 10 ** (rssi / 10.0)
-                aps_with_loc.append((loc['lat'], loc['lon'], weight))
-            if loc['error']:
-                errors.append({'bssid': bssid, 'error': loc['error']})
+        if not bssid or not rssi:
+            continue
+        if not isinstance(bssid, str):
+            raise ValueError(f'Invalid bssid: {bssid!r}')
+        try:
+            rssi = int(rssi)
+        except (TypeError, ValueError):
+            raise ValueError(f'Invalid rssi for {bssid}: {rssi!r}')
+        valid_aps.append({'bssid': bssid, 'rssi': rssi})
+    return valid_aps
 
-    response = {'status': 'success', 'errors': errors}
-    if aps_with_loc:
-        sum_w = sum(w for _, _, w in aps_with_loc)
-        if sum_w > 0:
-            est_lat = sum(w * lat for lat, _, w in aps_with_loc) / sum_w
-            est_lon = sum(w * lon for _, lon, w in aps_with_loc) / sum_w
-
-            conn = sqlite3.connect(DB_NAME)
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO scans (scan_id, timestamp, est_lat, est_lon)
-                VALUES (?, ?, ?, ?)
-            ''', (scan_id, datetime.datetime.now(), est_lat, est_lon))
-            conn.commit()
-            conn.close()
-        else:
-            response['status'] = 'no valid weights'
+
+def process_scan_batch(scans):
+    """Resolve, estimate and store a list of scans in one pass. Returns one result dict per scan."""
+    results = [None] * len(scans)
+    # Rows to store by input index, so that scan row ids follow the input order
+    rows = [None] * len(scans)
+    batch = []
+    for i, scan in enumerate(scans):
+        if not isinstance(scan, dict):
+            results[i] = {'status': 'error', 'error': 'Invalid data format'}
+            continue
+        if 'aps' not in scan or 'scan_id' not in scan:
+            results[i] = {'status': 'error', 'error': scan.get('error', 'Invalid data format')}
+            continue
+        timestamp = datetime.datetime.now()
+        if scan.get('timestamp'):
+            try:
+                # A '...Z' or '+02:00' timestamp is converted, so the batch compares and sorts alike
+                timestamp = local_naive(datetime.datetime.fromisoformat(scan['timestamp']))
+            except (TypeError, ValueError):
+                results[i] = {'scan_id': scan['scan_id'], 'status': 'error', 'error': 'Invalid timestamp'}
+                continue
+        try:
+            valid_aps = parse_scan_aps(scan['aps'])
+        except ValueError as e:
+            results[i] = {'scan_id': scan['scan_id'], 'status': 'error', 'error': str(e)}
+            continue
+        device_id = normalize_device_id(scan.get('device_id'))
+        link = link_metrics(scan)
+        fingerprint = fingerprint_cache.key(valid_aps)
+        cached = fingerprint_cache.get(fingerprint)
+        if cached is not None:
+            estimate, cached_errors = cached
+            results[i] = {'status': 'success', 'errors': list(cached_errors), 'scan_id': scan['scan_id']}
+            rows[i] = (device_id, scan['scan_id'], timestamp, estimate, valid_aps, [], link)
+            continue
+        batch.append((i, device_id, scan['scan_id'], timestamp, valid_aps, fingerprint, link))
+
+    locations = get_ap_locations([ap['bssid'] for _, _, _, _, valid_aps, _, _ in batch for ap in valid_aps])
+    located = []
+    for i, device_id, scan_id, timestamp, valid_aps, _, _ in batch:
+        aps_with_loc = []
+        errors = []
+        scan_pending = locate_scan_aps(valid_aps, locations, aps_with_loc, errors)
+        located.append((aps_with_loc, errors, scan_pending))
+    estimates = estimate_positions([aps_with_loc for aps_with_loc, _, _ in located],
+                                   [valid_aps for _, _, _, _, valid_aps, _, _ in batch])
+
+    for (i, device_id, scan_id, timestamp, valid_aps, fingerprint, link), (aps_with_loc, errors, scan_pending), estimate in zip(batch, located, estimates):
+        response = scan_response(aps_with_loc, estimate, errors, scan_pending)
+        response['scan_id'] = scan_id
+        results[i] = response
+        remember_fingerprint(fingerprint, estimate, errors, scan_pending)
+        rows[i] = (device_id, scan_id, timestamp, estimate, valid_aps, scan_pending, link)
+
+    persist_scans([row for row in rows if row is not None])
+    return results
+
+
+def estimate_positions(scans_aps_with_loc, scans_aps=None):
+    """Estimate many scans in one vectorized call. Returns a list of (lat, lon) or None per scan.
+
+    With the radio map enabled, the raw scans_aps ({'bssid', 'rssi'} lists) are also matched
+    against it; the estimate from the located APs is kept for the scans it does not cover
+    and when the match disagrees with it.
+    """
+    if not scans_aps_with_loc:
+        return []
+    with stage_seconds.time('estimate'):
+        est_lat, est_lon = estimator.estimate_batch(*estimator.pad_scans(scans_aps_with_loc), **ESTIMATOR_OPTIONS)
+        estimates = [None if np.isnan(lat) else (float(lat), float(lon)) for lat, lon in zip(est_lat, est_lon)]
+        if radio_map is not None and scans_aps is not None:
+            for i, aps in enumerate(scans_aps):
+                matched = radio_map.match(aps, estimates[i])
+                if matched is not None:
+                    estimates[i] = matched
+    return estimates
+
+
+def reestimate_pending_scans(bssid):
+    """Re-estimate, in one batch, the scans that saw a BSSID which just left the WiGLE queue."""
+    conn = db_pool.connection()
+    scan_rows = [row[0] for row in conn.execute(SQL_SELECT_PENDING_SCANS, (bssid,))]
+    if not scan_rows:
+        return
+    scans_aps = {scan_row: conn.execute(SQL_SELECT_PENDING_APS, (scan_row,)).fetchall() for scan_row in scan_rows}
+    locations = get_ap_locations([ap_bssid for aps in scans_aps.values() for ap_bssid, _ in aps], queue_misses=True)
+    scans_aps_with_loc = []
+    for aps in scans_aps.values():
+        scans_aps_with_loc.append([(locations[ap_bssid]['lat'], locations[ap_bssid]['lon'], rssi) for ap_bssid, rssi in aps
+                                   if locations[ap_bssid]['lat'] is not None and locations[ap_bssid]['lon'] is not None])
+    estimates = estimate_positions(scans_aps_with_loc, [[{'bssid': ap_bssid, 'rssi': rssi} for ap_bssid, rssi in aps]
+                                                        for aps in scans_aps.values()])
+
+    unresolved = {ap_bssid for aps in scans_aps.values() for ap_bssid, _ in aps
+                  if locations[ap_bssid]['error'] == WIGLE_QUEUED_ERROR}
+    wigle_queue.enqueue(sorted(unresolved))
+    still_queued = wigle_queue.queued(sorted(unresolved))
+    with conn:
+        conn.executemany(SQL_UPDATE_SCAN_ESTIMATE, [(estimate[0], estimate[1], scan_row)
+                                                    for scan_row, estimate in zip(scans_aps, estimates) if estimate is not None])
+        conn.executemany(SQL_DELETE_PENDING_APS, [(scan_row,) for scan_row, aps in scans_aps.items()
+                                                  if not any(ap_bssid in still_queued for ap_bssid, _ in aps)])
+    scan_feed.publish([scan_row for scan_row, estimate in zip(scans_aps, estimates) if estimate is not None])
+    logging.info(f"Re-estimated {len(scan_rows)} scan rows after WiGLE lookup of {bssid}")
+
+
+def process_aps(scan_id, aps, aps_with_loc, errors, device_id=DEFAULT_DEVICE_ID, link=NO_LINK_METRICS):
+    return jsonify(process_scan(scan_id, aps, aps_with_loc, errors, device_id, link)), 200
+
+
+def process_scan(scan_id, aps, aps_with_loc, errors, device_id=DEFAULT_DEVICE_ID, link=NO_LINK_METRICS):
+    """Locate the APs of one scan, estimate and store its position. Returns the response dict."""
+    request_log.debug("Scan %s of %s aps: %s", scan_id, device_id, aps)
+    valid_aps = [ap for ap in aps if ap.get('bssid') and ap.get('rssi')]
+    fingerprint = fingerprint_cache.key(valid_aps)
+    cached = fingerprint_cache.get(fingerprint)
+    if cached is not None:
+        estimate, cached_errors = cached
+        errors.extend(cached_errors)
+        response = {'status': 'success', 'errors': errors}
+        pending = []
     else:
+        locations = get_ap_locations([ap['bssid'] for ap in valid_aps])
+        response, estimate, pending = estimate_scan(valid_aps, locations, aps_with_loc, errors)
+        remember_fingerprint(fingerprint, estimate, errors, pending)
+    persist_scans([(device_id, scan_id, datetime.datetime.now(), estimate, valid_aps, pending, link)])
+    return response
+
+
+def remember_fingerprint(fingerprint, estimate, errors, pending):
+    """Memoize a final estimate; scans still waiting on WiGLE are not final."""
+    if estimate is not None and not pending:
+        fingerprint_cache.put(fingerprint, (estimate, list(errors)))
+
+
+def estimate_scan(valid_aps, locations, aps_with_loc, errors):
+    """Estimate one scan from already resolved AP locations.
+
+    Returns (response dict, (est_lat, est_lon) or None, list of BSSIDs queued for WiGLE).
+    """
+    pending = locate_scan_aps(valid_aps, locations, aps_with_loc, errors)
+    estimate = estimate_positions([aps_with_loc], [valid_aps])[0] if aps_with_loc or radio_map is not None else None
+    return scan_response(aps_with_loc, estimate, errors, pending), estimate, pending
+
+
+def locate_scan_aps(valid_aps, locations, aps_with_loc, errors):
+    """Collect (lat, lon, rssi) of the located APs and the lookup errors. Returns the queued BSSIDs."""
+    pending = []
+    for ap in valid_aps:
+        bssid = ap['bssid']
+        loc = locations[normalize_bssid(bssid)]
+        if loc['lat'] is not None and loc['lon'] is not None:
+            aps_with_loc.append((loc['lat'], loc['lon'], ap['rssi']))
+        else:
+            aps_unlocated.inc()
+        if loc['error'] == WIGLE_QUEUED_ERROR:
+            pending.append(normalize_bssid(bssid))
+        elif loc['error']:
+            errors.append({'bssid': bssid, 'error': loc['error']})
+    return pending
+
+
+def scan_response(aps_with_loc, estimate, errors, pending):
+    """Build the response dict of one scan."""
+    response = {'status': 'success', 'errors': errors}
+    if not aps_with_loc and estimate is None:
         response['status'] = 'no valid APs'
+    elif estimate is None:
+        response['status'] = 'no valid weights'
+
+    if pending:
+        response['pending'] = pending
+        if estimate is None:
+            response['status'] = 'pending'
+    return response
+
+
+def persist_scans(scans):
+    """Store scans now, or hand them to the write-behind buffer when SCAN_WRITE_BEHIND is set."""
+    if scan_writer is not None:
+        scan_writer.submit(scans)
+        return
+    conn = db_pool.connection()
+    with stage_seconds.time('store'), conn:
+        learned = store_scans(conn, scans)
+    on_scans_stored(scans, learned)
+
+
+def on_scans_stored(scans, learned=()):
+    """Once scans are committed: wake the live map, queue their unknown BSSIDs for WiGLE and
+    publish the AP positions learned from them."""
+    scan_feed.publish()
+    wigle_queue.enqueue(sorted({bssid for _, _, _, _, _, pending, _ in scans for bssid in pending}))
+    for bssid, loc in learned:
+        on_ap_learned(bssid, loc)
+
+
+def write_scans(conn, scans):
+    """ScanWriter flush: one transaction for everything buffered."""
+    with stage_seconds.time('store'):
+        return store_scans(conn, scans)
+
+
+def store_scans(conn, scans):
+    """Insert scans in the caller's transaction.
+
+    scans is a list of (device_id, scan_id, timestamp, estimate, valid_aps, pending, link)
+    tuples. Every scan is stored with its raw observation, also those without an estimate,
+    so that they can be re-processed later (see reestimate.py). Returns the (bssid, location)
+    pairs that AP learning wrote to ap_locations, to be cached only once committed.
+    """
+    scans_ingested.inc(amount=len(scans))
+    rows = []
+    devices = {}  # device_id -> [first_seen, last_seen, last_lat, last_lon, scans]
+    for device_id, scan_id, timestamp, estimate, valid_aps, pending, link in scans:
+        # Naive and aware datetimes do not compare, and the scans table only holds naive local time
+        timestamp = local_naive(timestamp)
+        est_lat, est_lon = estimate if estimate is not None else (None, None)
+        device = devices.setdefault(device_id, [timestamp, timestamp, None, None, 0])
+        device[0] = min(device[0], timestamp)
+        device[1] = max(device[1], timestamp)
+        if estimate is not None and timestamp >= device[1]:
+            device[2], device[3] = est_lat, est_lon
+        device[4] += 1
+        row = (device_id, scan_id, timestamp, est_lat, est_lon, *link, pack_observation(valid_aps))
+        if not pending:
+            rows.append(row)
+            continue
+        scan_row = conn.execute(SQL_INSERT_SCAN, row).lastrowid
+        # Index the APs by BSSID so the scan can be re-estimated once WiGLE answers
+        conn.executemany(SQL_INSERT_PENDING_AP,
+                         [(scan_row, normalize_bssid(ap['bssid']), ap['rssi']) for ap in valid_aps])
+    if rows:
+        conn.executemany(SQL_INSERT_SCAN, rows)
+    conn.executemany(SQL_UPSERT_DEVICE, [(device_id, *device) for device_id, device in devices.items()])
+    if ap_learner is None:
+        return []
+    return ap_learner.learn(conn, [(estimate, [{'bssid': normalize_bssid(ap['bssid']), 'rssi': ap['rssi']} for ap in valid_aps])
+                                   for _, _, _, estimate, valid_aps, _, _ in scans])
+
+
+def link_metrics(values):
+    """(vbat in V, cat_rssi, cat_snr, ap_rssi, ap_snr) from a mapping of LINK_FIELDS, None when missing."""
+    link = []
+    for name in LINK_FIELDS:
+        value = values.get(name)
+        try:
+            # The station firmware appends a ',' to every query string value
+            link.append(float(str(value).rstrip(',')) if value not in (None, '') else None)
+        except ValueError:
+            link.append(None)
+    if link[0] is not None:
+        link[0] /= 1000.0  # cat_vbatt is in mV
+    return tuple(link)
+
+
+def normalize_device_id(device_id):
+    """Tracker id as stored: the cat UID as 8 upper case hex digits, or DEFAULT_DEVICE_ID when missing."""
+    if device_id is None:
+        return DEFAULT_DEVICE_ID
+    if isinstance(device_id, int):
+        return f'{device_id:08X}'
+    # The station firmware appends a ',' to every query string value
+    device_id = str(device_id).strip().rstrip(',').upper()
+    if device_id.startswith('0X'):
+        device_id = device_id[2:]
+    return device_id or DEFAULT_DEVICE_ID
+
+
+
+def on_ap_learned(bssid, loc):
+    """A learned AP position is now in ap_locations: serve it from the cache and drop the fingerprints using it."""
+    ap_cache.put(bssid, loc)
+    fingerprint_cache.invalidate_bssid(bssid)
+
+
+# Self-calibrating AP positions, updated with each stored scan
+ap_learner = None
+if AP_LEARNING:
+    ap_learner = APLearner(min_aps=AP_LEARN_MIN_APS, min_weight=AP_LEARN_MIN_WEIGHT,
+                           max_weight=AP_LEARN_MAX_WEIGHT, prior_weight=AP_LEARN_PRIOR_WEIGHT, rssi_ref=AP_LEARN_RSSI_REF,
+                           min_spacing=AP_LEARN_MIN_SPACING, min_move=AP_LEARN_MIN_MOVE)
+
+# Radio map estimator, rebuilt in the background from the stored scans
+radio_map = None
+if RADIO_MAP:
+    radio_map = RadioMapUpdater(db_pool, interval=RADIO_MAP_REBUILD_INTERVAL, window_days=RADIO_MAP_WINDOW_DAYS,
+                                k=RADIO_MAP_K, min_common=RADIO_MAP_MIN_COMMON, max_distance=RADIO_MAP_MAX_DISTANCE,
+                                max_offset=RADIO_MAP_MAX_OFFSET, cell_size=RADIO_MAP_CELL_SIZE,
+                                min_scans=RADIO_MAP_MIN_SCANS, estimator_options=ESTIMATOR_OPTIONS,
+                                on_built=fingerprint_cache.clear)
+
+# Retention job, rolling old scans into scan_summaries in the background
+scan_retention = None
+if SCAN_RETENTION_DAYS > 0:
+    scan_retention = ScanRetention(db_pool, keep_days=SCAN_RETENTION_DAYS, interval=SCAN_RETENTION_INTERVAL,
+                                   bucket_seconds=SCAN_SUMMARY_INTERVAL, batch_size=SCAN_RETENTION_BATCH,
+                                   vacuum_pages=SCAN_VACUUM_PAGES)
+    if RADIO_MAP and SCAN_RETENTION_DAYS < RADIO_MAP_WINDOW_DAYS:
+        logging.warning(f"SCAN_RETENTION_DAYS={SCAN_RETENTION_DAYS} is shorter than RADIO_MAP_WINDOW_DAYS="
+                        f"{RADIO_MAP_WINDOW_DAYS}, the radio map only sees the scans kept")
+
+# Group commit of the scans, when enabled
+scan_writer = None
+if SCAN_WRITE_BEHIND:
+    scan_writer = ScanWriter(db_pool, write_scans, on_scans_stored, flush_interval=SCAN_FLUSH_INTERVAL,
+                             flush_rows=SCAN_FLUSH_ROWS, max_rows=SCAN_BUFFER_MAX_ROWS,
+                             max_attempts=SCAN_FLUSH_MAX_ATTEMPTS)
+    metrics.gauge('petwifi_scan_buffer_size', 'Scans waiting for the write-behind flush',
+                  lambda: scan_writer.stats()['buffered'])
+    # Last flush when the interpreter exits normally, e.g. Ctrl-C on the development server
+    atexit.register(scan_writer.stop, 5.0)
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def observe_request_latency(response):
+    """Record the request latency per endpoint (the route function name)."""
+    # Streaming responses are observed when their headers are sent, not when the stream ends
+    if 'request_start' in g:
+        request_seconds.observe(time.perf_counter() - g.request_start, request.endpoint or 'unknown')
+    return response
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_view():
+    """Prometheus text exposition of the request, stage, WiGLE and cache metrics."""
+    return Response(metrics.render(), content_type=Registry.CONTENT_TYPE)
+
+
+@app.route('/api/queue', methods=['GET'])
+def queue_stats():
+    """Report the WiGLE miss queue and client state, and the scan write-behind buffer when enabled."""
+    stats = wigle_queue.stats()
+    stats['wigle_client'] = wigle_client.stats()
+    if scan_writer is not None:
+        stats['scan_writer'] = scan_writer.stats()
+    return jsonify(stats), 200
+
+
+@app.route('/api/aps', methods=['GET'])
+def aps_in_area():
+    """List known APs inside ?bbox=min_lat,min_lon,max_lat,max_lon."""
+    try:
+        min_lat, min_lon, max_lat, max_lon = (float(v) for v in request.args.get('bbox', '').split(','))
+    except ValueError:
+        return jsonify({'error': 'bbox must be min_lat,min_lon,max_lat,max_lon'}), 400
+    rows = aps_in_bbox(db_pool.connection(), min_lat, max_lat, min_lon, max_lon)
+    return jsonify([{'bssid': bssid, 'lat': lat, 'lon': lon} for bssid, lat, lon in rows]), 200
+
+
+@app.route('/api/aps/learned', methods=['GET'])
+def aps_learned():
+    """Report the AP positions learned from our own estimates."""
+    if ap_learner is None:
+        return jsonify({'error': 'AP learning is disabled'}), 404
+    return jsonify(ap_learner.stats(db_pool.connection())), 200
+
+
+@app.route('/api/radiomap', methods=['GET'])
+def radio_map_stats():
+    """Report the radio map size, last build and match counters."""
+    if radio_map is None:
+        return jsonify({'error': 'The radio map estimator is disabled'}), 404
+    return jsonify(radio_map.stats()), 200
+
 
+@app.route('/api/radiomap', methods=['POST'])
+def radio_map_rebuild():
+    """Rebuild the radio map now, e.g. after a bulk import."""
+    if radio_map is None:
+        return jsonify({'error': 'The radio map estimator is disabled'}), 404
+    return jsonify(radio_map.rebuild()), 200
+
+
+@app.route('/api/retention', methods=['GET'])
+def retention_stats():
+    """Report the scan retention settings, counters and database file size."""
+    if scan_retention is None:
+        return jsonify({'error': 'Scan retention is disabled'}), 404
+    return jsonify(scan_retention.stats()), 200
+
+
+@app.route('/api/retention', methods=['POST'])
+def retention_run():
+    """Summarize and delete the expired scans now."""
+    if scan_retention is None:
+        return jsonify({'error': 'Scan retention is disabled'}), 404
+    return jsonify(scan_retention.run()), 200
+
+
+@app.route('/api/aps/nearest', methods=['GET'])
+def aps_nearest():
+    """List the k known APs nearest to ?lat=&lon= (k defaults to 10)."""
+    lat = request.args.get('lat', type=float)
+    lon = request.args.get('lon', type=float)
+    k = request.args.get('k', default=10, type=int)
+    if lat is None or lon is None:
+        return jsonify({'error': 'Missing lat or lon parameters'}), 400
+    rows = nearest_aps(db_pool.connection(), lat, lon, k)
+    return jsonify([{'bssid': bssid, 'lat': ap_lat, 'lon': ap_lon, 'distance': distance}
+                    for bssid, ap_lat, ap_lon, distance in rows]), 200
+
+
+@app.route('/api/cache', methods=['GET'])
+def cache_stats():
+    """Report BSSID location and scan fingerprint cache counters, and the AP snapshot lookups."""
+    stats = ap_cache.stats()
+    stats['fingerprints'] = fingerprint_cache.stats()
+    if ap_snapshot is not None:
+        stats['snapshot'] = ap_snapshot.stats()
+    return jsonify(stats), 200
+
+
+@app.route('/api/cache', methods=['DELETE'])
+def cache_invalidate():
+    """Invalidate one BSSID (?bssid=) or the whole BSSID location cache, with the fingerprints using them."""
+    bssid = request.args.get('bssid')
+    dropped = ap_cache.invalidate(bssid)
+    if bssid is None:
+        fingerprint_cache.clear()
+    else:
+        fingerprint_cache.invalidate_bssid(bssid)
+    return jsonify({'status': 'success', 'invalidated': dropped}), 200
+
+
+@app.route('/api/stream', methods=['GET'])
+def stream_points():
+    """Server-Sent Events stream of newly estimated positions, as 'fix' events [lat, lon, timestamp, device_id].
+
+    The event id is the scans row id, so a reconnecting client resumes from Last-Event-ID.
+    A new client starts after ?since=, the last_scan_id of the /api/points response it drew,
+    so that no fix stored in between is missed; otherwise it starts with the next scan.
+    ?device= only streams the fixes of one tracker.
+    """
+    device = request.args.get('device')
+    device = normalize_device_id(device) if device else None
+    last_id = request.headers.get('Last-Event-ID', type=int)
+    if last_id is None:
+        last_id = request.args.get('since', type=int)
+    if last_id is None:
+        last_id = db_pool.connection().execute(SQL_SELECT_MAX_SCAN_ID).fetchone()[0]
+
+    def generate(last_id):
+        conn = db_pool.connection()
+        seq = scan_feed.seq
+        yield 'retry: 5000\n\n'
+        while True:
+            seq, updated = scan_feed.wait(seq, LIVE_POLL_INTERVAL)
+            rows = conn.execute(SQL_SELECT_SCANS_AFTER_ID, (last_id,)).fetchall()
+            updated = [scan_row for scan_row in updated if scan_row <= last_id]
+            if updated:
+                rows = conn.execute(SQL_SELECT_SCANS_BY_ID.format(','.join('?' * len(updated))), updated).fetchall() + rows
+            sent = False
+            for scan_row, est_lat, est_lon, timestamp, device_id in rows:
+                last_id = max(last_id, scan_row)
+                if est_lat is not None and device in (None, device_id):
+                    yield f'id: {last_id}\nevent: fix\ndata: {json.dumps([est_lat, est_lon, timestamp, device_id])}\n\n'
+                    sent = True
+            if not sent:
+                # Keeps proxies from closing the connection and detects clients that went away
+                yield ': keepalive\n\n'
+
+    return Response(stream_with_context(generate(last_id)), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+def parse_time_arg(name, default):
+    """Parse an ISO 8601 query argument into a datetime, raising ValueError on bad input."""
+    value = request.args.get(name)
+    if not value:
+        return default
+    return local_naive(datetime.datetime.fromisoformat(value))
+
+
+@app.route('/api/points', methods=['GET'])
+def points_api():
+    """Estimated positions between ?since= and ?until= (ISO 8601, default last 24 hours).
+
+    At most ?max_points= points are returned: the trajectory is simplified with
+    Douglas-Peucker, or, for ranges longer than POINTS_GRID_AFTER days or with ?mode=grid,
+    aggregated into grid cells. ?device= restricts them to one tracker, otherwise the
+    positions of all trackers are mixed. Fixes older than SCAN_RETENTION_DAYS are the
+    centroids of their summary intervals, weighted by their number of fixes on the grid.
+    """
+    device = request.args.get('device')
+    return points_response(normalize_device_id(device) if device else None)
+
+
+@app.route('/api/devices/<device_id>/points', methods=['GET'])
+def device_points_api(device_id):
+    """Estimated positions of one tracker, same arguments as /api/points."""
+    return points_response(normalize_device_id(device_id))
+
+
+def points_response(device_id):
+    now = datetime.datetime.now()
+    try:
+        since = parse_time_arg('since', now - datetime.timedelta(hours=24))
+        until = parse_time_arg('until', now)
+    except ValueError:
+        return jsonify({'error': 'since and until must be ISO 8601 timestamps'}), 400
+    max_points = max(request.args.get('max_points', default=POINTS_MAX_POINTS, type=int), 2)
+    mode = request.args.get('mode')
+    if mode is None:
+        mode = 'grid' if until - since > datetime.timedelta(days=POINTS_GRID_AFTER) else 'simplify'
+    if mode not in ('simplify', 'grid'):
+        return jsonify({'error': 'mode must be simplify or grid'}), 400
+
+    conn = db_pool.connection()
+    # Read first: a scan stored during the queries below is streamed again rather than missed
+    last_scan_id = conn.execute(SQL_SELECT_MAX_SCAN_ID).fetchone()[0]
+    if device_id is None:
+        summaries = conn.execute(SQL_SELECT_SUMMARIES_RANGE, (since, until)).fetchall()
+        rows = conn.execute(SQL_SELECT_SCANS_RANGE, (since, until)).fetchall()
+    else:
+        summaries = conn.execute(SQL_SELECT_DEVICE_SUMMARIES_RANGE, (device_id, since, until)).fetchall()
+        rows = conn.execute(SQL_SELECT_DEVICE_SCANS_RANGE, (device_id, since, until)).fetchall()
+    # Summarized fixes are older than the scans still stored, so the points stay in time order
+    weights = [s[3] for s in summaries] + [1] * len(rows)
+    rows = [s[:3] for s in summaries] + rows
+    response = {'since': since.isoformat(' '), 'until': until.isoformat(' '), 'count': sum(weights),
+                'last_scan_id': last_scan_id}
+    if device_id is not None:
+        response['device_id'] = device_id
+    if summaries:
+        response['summarized'] = len(summaries)
+    if len(rows) <= max_points:
+        response.update({'mode': 'raw', 'points': rows})
+    elif mode == 'simplify':
+        keep = simplify([r[0] for r in rows], [r[1] for r in rows], max_points)
+        response.update({'mode': 'simplify', 'points': [rows[i] for i in keep]})
+    else:
+        cell_size, cells = aggregate_grid([r[0] for r in rows], [r[1] for r in rows],
+                                          [r[2] for r in rows], max_points, weights=weights)
+        response.update({'mode': 'grid', 'cell_size': cell_size, 'cells': cells})
     return jsonify(response), 200
 
 
+@app.route('/api/devices', methods=['GET'])
+def devices_api():
+    """List the trackers with their first and last scan time, last fix and number of scans."""
+    rows = db_pool.connection().execute(SQL_SELECT_DEVICES).fetchall()
+    return jsonify([device_dict(row) for row in rows]), 200
+
+
+@app.route('/api/devices/<device_id>', methods=['GET'])
+def device_api(device_id):
+    """Summary of one tracker."""
+    row = db_pool.connection().execute(SQL_SELECT_DEVICE, (normalize_device_id(device_id),)).fetchone()
+    if row is None:
+        return jsonify({'error': 'Unknown device'}), 404
+    return jsonify(device_dict(row)), 200
+
+
+def device_dict(row):
+    device_id, first_seen, last_seen, last_lat, last_lon, scans = row
+    return {'device_id': device_id, 'first_seen': first_seen, 'last_seen': last_seen,
+            'last_lat': last_lat, 'last_lon': last_lon, 'scans': scans}
+
+
 @app.route('/')
 def map_view():
-    """Render map with IoT positions from the last 24 hours, including timestamps."""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    one_day_ago = datetime.datetime.now() - datetime.timedelta(hours=24)
-    cursor.execute('SELECT est_lat, est_lon, timestamp FROM scans WHERE timestamp > ? ORDER BY timestamp', (one_day_ago,))
-    points = cursor.fetchall()
-    conn.close()
+    """Render the map page, which fetches the positions of the last 24 hours of every tracker."""
+    return render_map(None)
+
+
+@app.route('/devices/<device_id>')
+def device_map_view(device_id):
+    """Render the map page of one tracker."""
+    return render_map(normalize_device_id(device_id))
 
-    bounds = [[0, 0], [0, 0]]
-    #
-    if points:
-        avg_lat = sum(p[0] for p in points) / len(points)
-        avg_lon = sum(p[1] for p in points) / len(points)
 
+def render_map(device_id):
+    conn = db_pool.connection()
+    one_day_ago = datetime.datetime.now() - datetime.timedelta(hours=24)
+    if device_id is None:
+        avg_lat, avg_lon = conn.execute(SQL_SELECT_SCANS_CENTER, (one_day_ago,)).fetchone()
     else:
+        avg_lat, avg_lon = conn.execute(SQL_SELECT_DEVICE_SCANS_CENTER, (device_id, one_day_ago)).fetchone()
+
+    if avg_lat is None:
         avg_lat = MAP_CENTER_LAT
         avg_lon = MAP_CENTER_LON
 
@@ -224,8 +1236,41 @@ def map_view():
         [avg_lat - delta_lat, avg_lon - delta_lon],
         [avg_lat + delta_lat, avg_lon + delta_lon]
     ]
-    return render_template('map.html', points=points, bounds=bounds)
+    return render_template('map.html', bounds=bounds, device=device_id)
+
+_app_initialized = False
+_app_init_lock = threading.Lock()
+
+def init_app():
+    """Create the schema and start the WiGLE queue and background jobs, once per worker process."""
+    global _app_initialized
+    with _app_init_lock:
+        if _app_initialized:
+            return
+        init_db()
+        # BSSIDs left in the queue by a previous run are drained without waiting for a new scan
+        wigle_queue.start()
+        if radio_map is not None:
+            radio_map.start()
+        if scan_retention is not None:
+            scan_retention.start()
+        _app_initialized = True
+
+def shutdown_app(timeout=5.0):
+    """Flush the buffered scans, stop the background workers, flush the request log and close the database connections."""
+    if scan_writer is not None:
+        scan_writer.stop(timeout)
+    wigle_queue.stop(timeout)
+    if radio_map is not None:
+        radio_map.stop(timeout)
+    if scan_retention is not None:
+        scan_retention.stop(timeout)
+    wigle_executor.shutdown(wait=False, cancel_futures=True)
+    wigle_client.close()
+    request_log_listener.stop()
+    db_pool.close_all()
 
 if __name__ == '__main__':
-    init_db()
+    # Development server, see serve.py for production
+    init_app()
     app.run(debug=True, port=4201)
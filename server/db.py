@@ -0,0 +1,108 @@
+import sqlite3
+import threading
+import logging
+import os
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# SQLite tuning, overridable from .env
+SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')  # WAL makes NORMAL crash-safe
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))  # bytes
+SQLITE_CACHE_SIZE = int(os.getenv('SQLITE_CACHE_SIZE', '-16000'))  # negative value = KiB
+SQLITE_BUSY_TIMEOUT = float(os.getenv('SQLITE_BUSY_TIMEOUT', '5.0'))  # seconds
+SQLITE_CACHED_STATEMENTS = int(os.getenv('SQLITE_CACHED_STATEMENTS', '128'))
+
+
+class ConnectionPool:
+    """Per-thread SQLite connections that are opened once and reused across requests.
+
+    Each thread of a worker gets its own connection, opened in WAL mode so readers
+    never block behind the writer. Statements are compiled once per connection and
+    kept in the sqlite3 statement cache, keyed by the SQL text.
+
+    When a thread ends, e.g. the thread-per-request development server, its connection
+    goes back to the pool and is handed to the next thread, so the number of open
+    connections follows the number of live threads, not the number of requests.
+    """
+
+    def __init__(self, db_name):
+        self.db_name = db_name
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        self._owners = {}  # id(connection) -> thread using it
+        self._idle = []
+        self._pid = os.getpid()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_name, timeout=SQLITE_BUSY_TIMEOUT,
+                               check_same_thread=False, cached_statements=SQLITE_CACHED_STATEMENTS)
+        # Only takes effect on a new database, before its first table: lets retention.py give
+        # the pages of deleted scans back to the file system
+        conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(f'PRAGMA synchronous={SQLITE_SYNCHRONOUS}')
+        conn.execute(f'PRAGMA mmap_size={SQLITE_MMAP_SIZE}')
+        conn.execute(f'PRAGMA cache_size={SQLITE_CACHE_SIZE}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        logging.info(f"Opened SQLite connection to {self.db_name} in thread {threading.get_ident()}")
+        return conn
+
+    def _reset_after_fork(self):
+        """Drop connections inherited from a parent process, they must not be shared."""
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        self._owners = {}
+        self._idle = []
+        self._pid = os.getpid()
+
+    def _reclaim(self):
+        """Move the connections of the threads that ended to the idle list. Called with the lock held."""
+        for conn in self._connections:
+            owner = self._owners.get(id(conn))
+            if owner is not None and not owner.is_alive():
+                del self._owners[id(conn)]
+                if conn.in_transaction:
+                    conn.rollback()
+                self._idle.append(conn)
+
+    def connection(self):
+        """Return this thread's connection, reusing one of an ended thread or opening one on first use."""
+        if os.getpid() != self._pid:
+            self._reset_after_fork()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            with self._lock:
+                self._reclaim()
+                conn = self._idle.pop() if self._idle else None
+            opened = conn is None
+            if opened:
+                conn = self._connect()
+            with self._lock:
+                if opened:
+                    self._connections.append(conn)
+                self._owners[id(conn)] = threading.current_thread()
+            self._local.conn = conn
+        return conn
+
+    def stats(self):
+        """Return the number of open and idle connections."""
+        with self._lock:
+            self._reclaim()
+            return {'connections': len(self._connections), 'idle': len(self._idle)}
+
+    def close_all(self):
+        """Close every connection opened by this pool."""
+        with self._lock:
+            for conn in self._connections:
+                try:
+                    conn.close()
+                except sqlite3.Error as e:
+                    logging.error(f"Error closing SQLite connection: {e}")
+            self._connections = []
+            self._owners = {}
+            self._idle = []
+        self._local = threading.local()
@@ -1,164 +1,406 @@
-import sqlite3
-import requests
-from requests.auth import HTTPBasicAuth
-from dotenv import load_dotenv
-import os
-import math
-import logging
-from datetime import datetime
-
-# Load environment variables
-load_dotenv()
-
-# WiGLE API credentials
-WIGLE_USER = os.getenv('WIGLE_USER')
-WIGLE_TOKEN = os.getenv('WIGLE_TOKEN')
-WIGLE_API_URL = 'https://api.wigle.net/api/v2/network/search'
-
-# Load center points from .env
-center_points_str = os.getenv('CENTER_POINTS')
-if not center_points_str:
-    raise ValueError("CENTER_POINTS not found in .env file")
-try:
-    # Parse comma-separated lat,lon pairs
-    coords = center_points_str.split(',')
-    if len(coords) % 2 != 0:
-        raise ValueError("CENTER_POINTS must have an even number of values (lat,lon pairs)")
-    center_points = [(float(coords[i]), float(coords[i+1])) for i in range(0, len(coords), 2)]
-except ValueError as e:
-    raise ValueError(f"Invalid CENTER_POINTS format in .env: {e}")
-
-# Database and logging setup
-DB_NAME = 'wigle_cache8.db'
-LOG_FILE = 'wigle_requests8.log'
-
-# Configure logging
-logging.basicConfig(
-    filename=LOG_FILE,
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
-
-def init_db():
-    """Initialize the SQLite database."""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS ap_locations (
-            bssid TEXT PRIMARY KEY,
-            lat REAL,
-            lon REAL,
-            lastupdt TEXT,
-            road TEXT,
-            channel INTEGER,
-            housenumber TEXT
-        )
-    ''')
-    conn.commit()
-    conn.close()
-
-def haversine_distance(lat1, lon1, lat2, lon2):
-    """Calculate distance between two points in meters using Haversine formula."""
-    R = 6371000  # Earth's radius in meters
-    phi1 = math.radians(lat1)
-    phi2 = math.radians(lat2)
-    delta_phi = math.radians(lat2 - lat1)
-    delta_lambda = math.radians(lon2 - lon1)
-    a = math.sin(delta_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(delta_lambda / 2) ** 2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    return R * c
-
-def get_bounding_box(lat, lon, radius_m=1000):
-    """Calculate bounding box for a given center point and radius."""
-    METERS_PER_DEGREE_LAT = 111194.0
-    COS_LAT = math.cos(math.radians(lat))
-    METERS_PER_DEGREE_LON = METERS_PER_DEGREE_LAT * COS_LAT
-    lat_delta = radius_m / METERS_PER_DEGREE_LAT
-    lon_delta = radius_m / METERS_PER_DEGREE_LON
-    return {
-        'latrange1': lat - lat_delta,
-        'latrange2': lat + lat_delta,
-        'longrange1': lon - lon_delta,
-        'longrange2': lon + lon_delta
-    }
-
-def query_wigle(center_lat, center_lon):
-    """Query WiGLE API for APs within 1km radius, handling pagination."""
-    params = get_bounding_box(center_lat, center_lon)
-    params.update({
-        'onlymine': 'false',
-        'freenet': 'false',
-        'paynet': 'false',
-        'resultsPerPage': '100',
-        'variance': 0.003
-    })
-    all_results = []
-    search_after = None
-    headers = {'Accept': 'application/json'}
-
-    while True:
-        if search_after:
-            params['searchAfter'] = search_after
-        logging.info(f"WiGLE API request for center ({center_lat}, {center_lon}): {params}")
-        try:
-            response = requests.get(WIGLE_API_URL, params=params, auth=HTTPBasicAuth(WIGLE_USER, WIGLE_TOKEN), headers=headers)
-            logging.info(f"WiGLE API response status: {response.status_code}")
-            response.raise_for_status()
-            data = response.json()
-            if not data.get('success'):
-                logging.error(f"WiGLE API error: {data.get('message', 'Unknown error')}")
-                break
-            results = data.get('results', [])
-            if not results:
-                break
-            # Filter results within 1km radius
-            for ap in results:
-                lat = ap.get('trilat')
-                lon = ap.get('trilong')
-                bssid = ap.get('netid')
-                lastupdt = ap.get('lastupdt')
-                road = ap.get('road')
-                channel = ap.get('channel')
-                housenumber = ap.get('housenumber')
-                if lat is None or lon is None or bssid is None:
-                    continue
-                if haversine_distance(center_lat, center_lon, lat, lon) <= 1000:
-                    all_results.append({'bssid': bssid.upper(), 'lat': lat, 'lon': lon, 'lastupdt': lastupdt,
-                                        'road': road, 'channel': channel, 'housenumber': housenumber})
-            search_after = data.get('searchAfter')
-            if not search_after:
-                break
-        except requests.RequestException as e:
-            logging.error(f"WiGLE API request failed: {str(e)}")
-            break
-
-    return all_results
-
-def store_aps_in_db(aps):
-    """Store APs in the SQLite database."""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    for ap in aps:
-        cursor.execute('''
-            INSERT OR IGNORE INTO ap_locations (bssid, lat, lon, lastupdt, road, channel, housenumber)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (ap['bssid'], ap['lat'], ap['lon'], ap['lastupdt'], ap['road'], ap['channel'], ap['housenumber']))
-    conn.commit()
-    conn.close()
-
-def download_bssids():
-    """Download BSSIDs for each center point and store in database."""
-    init_db()
-    for lat, lon in center_points:
-        print(f"Fetching BSSIDs for center point ({lat}, {lon})...")
-        aps = query_wigle(lat, lon)
-        if aps:
-            print(f"Found {len(aps)} APs for center point ({lat}, {lon}).")
-            store_aps_in_db(aps)
-        else:
-            print(f"No APs found for center point ({lat}, {lon}).")
-        logging.info(f"Completed fetching {len(aps)} APs for center ({lat}, {lon})")
-
-if __name__ == '__main__':
-    download_bssids()
-    print(f"Data stored in {DB_NAME}. API requests logged in {LOG_FILE}.")
\ No newline at end of file
+import sqlite3
+from dotenv import load_dotenv
+import os
+import math
+import time
+import argparse
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+import numpy as np
+from db import ConnectionPool
+from spatial import init_spatial_index, haversine_distances
+from ap_snapshot import write_snapshot, init_change_tracking
+from wigle_client import WigleClient, WigleError
+
+# Load environment variables
+load_dotenv()
+
+# Load center points from .env
+center_points_str = os.getenv('CENTER_POINTS')
+if not center_points_str:
+    raise ValueError("CENTER_POINTS not found in .env file")
+try:
+    # Parse comma-separated lat,lon pairs
+    coords = center_points_str.split(',')
+    if len(coords) % 2 != 0:
+        raise ValueError("CENTER_POINTS must have an even number of values (lat,lon pairs)")
+    center_points = [(float(coords[i]), float(coords[i+1])) for i in range(0, len(coords), 2)]
+except ValueError as e:
+    raise ValueError(f"Invalid CENTER_POINTS format in .env: {e}")
+
+# Database and logging setup
+DB_NAME = 'wigle_cache8.db'
+LOG_FILE = 'wigle_requests8.log'
+
+# Crawler mode defaults, overridable on the command line
+CRAWL_RADIUS = 1000  # meters around each center point
+CRAWL_TILE_SIZE = float(os.getenv('CRAWL_TILE_SIZE', '500'))  # meters
+CRAWL_WORKERS = int(os.getenv('CRAWL_WORKERS', '4'))
+CRAWL_RATE = float(os.getenv('CRAWL_RATE', '1.0'))  # WiGLE requests per second
+CRAWL_BURST = int(os.getenv('CRAWL_BURST', '4'))
+
+# Configure logging
+logging.basicConfig(
+    filename=LOG_FILE,
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+def init_db():
+    """Initialize the SQLite database."""
+    conn = sqlite3.connect(DB_NAME)
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ap_locations (
+            bssid TEXT PRIMARY KEY,
+            lat REAL,
+            lon REAL,
+            lastupdt TEXT,
+            road TEXT,
+            channel INTEGER,
+            housenumber TEXT,
+            source TEXT DEFAULT 'wigle'
+        )
+    ''')
+    # Databases shared with app.py before it labelled learned positions
+    if 'source' not in {row[1] for row in cursor.execute('PRAGMA table_info(ap_locations)')}:
+        cursor.execute("ALTER TABLE ap_locations ADD COLUMN source TEXT DEFAULT 'wigle'")
+    init_spatial_index(conn)
+    init_change_tracking(conn)
+    # Crawler mode: one row per tile, with the searchAfter cursor of the next page to fetch
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS crawl_tiles (
+            tile_id TEXT PRIMARY KEY,
+            min_lat REAL,
+            max_lat REAL,
+            min_lon REAL,
+            max_lon REAL,
+            search_after TEXT,
+            done INTEGER DEFAULT 0,
+            pages INTEGER DEFAULT 0,
+            aps INTEGER DEFAULT 0,
+            updated_at TEXT,
+            pass_started_at TEXT,
+            since TEXT,
+            last_crawled_at TEXT
+        )
+    ''')
+    # Refresh columns, for databases created by an earlier crawler
+    columns = {row[1] for row in cursor.execute('PRAGMA table_info(crawl_tiles)')}
+    for column in ('pass_started_at', 'since', 'last_crawled_at'):
+        if column not in columns:
+            cursor.execute(f'ALTER TABLE crawl_tiles ADD COLUMN {column} TEXT')
+    conn.commit()
+    conn.close()
+
+def haversine_distance(lat1, lon1, lat2, lon2):
+    """Calculate distance between two points in meters using Haversine formula."""
+    R = 6371000  # Earth's radius in meters
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    delta_phi = math.radians(lat2 - lat1)
+    delta_lambda = math.radians(lon2 - lon1)
+    a = math.sin(delta_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(delta_lambda / 2) ** 2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    return R * c
+
+def get_bounding_box(lat, lon, radius_m=1000):
+    """Calculate bounding box for a given center point and radius."""
+    METERS_PER_DEGREE_LAT = 111194.0
+    COS_LAT = math.cos(math.radians(lat))
+    METERS_PER_DEGREE_LON = METERS_PER_DEGREE_LAT * COS_LAT
+    lat_delta = radius_m / METERS_PER_DEGREE_LAT
+    lon_delta = radius_m / METERS_PER_DEGREE_LON
+    return {
+        'latrange1': lat - lat_delta,
+        'latrange2': lat + lat_delta,
+        'longrange1': lon - lon_delta,
+        'longrange2': lon + lon_delta
+    }
+
+def query_wigle(center_lat, center_lon):
+    """Query WiGLE API for APs within 1km radius, handling pagination."""
+    params = get_bounding_box(center_lat, center_lon)
+    params.update({
+        'onlymine': 'false',
+        'freenet': 'false',
+        'paynet': 'false',
+        'resultsPerPage': '100',
+        'variance': 0.003
+    })
+    all_results = []
+    search_after = None
+    client = WigleClient()
+
+    while True:
+        if search_after:
+            params['searchAfter'] = search_after
+        logging.info(f"WiGLE API request for center ({center_lat}, {center_lon})")
+        try:
+            data = client.search(params)
+            results = data.get('results', [])
+            if not results:
+                break
+            # Filter results within 1km radius
+            for ap in results:
+                lat = ap.get('trilat')
+                lon = ap.get('trilong')
+                bssid = ap.get('netid')
+                lastupdt = ap.get('lastupdt')
+                road = ap.get('road')
+                channel = ap.get('channel')
+                housenumber = ap.get('housenumber')
+                if lat is None or lon is None or bssid is None:
+                    continue
+                if haversine_distance(center_lat, center_lon, lat, lon) <= 1000:
+                    all_results.append({'bssid': bssid.upper(), 'lat': lat, 'lon': lon, 'lastupdt': lastupdt,
+                                        'road': road, 'channel': channel, 'housenumber': housenumber})
+            search_after = data.get('searchAfter')
+            if not search_after:
+                break
+        except WigleError as e:
+            logging.error(f"WiGLE API request failed: {e.message}")
+            break
+
+    client.close()
+    return all_results
+
+SQL_INSERT_AP = '''
+    INSERT OR IGNORE INTO ap_locations (bssid, lat, lon, lastupdt, road, channel, housenumber)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+
+def store_aps_in_db(aps):
+    """Store APs in the SQLite database."""
+    conn = sqlite3.connect(DB_NAME)
+    conn.executemany(SQL_INSERT_AP, [(ap['bssid'], ap['lat'], ap['lon'], ap['lastupdt'], ap['road'],
+                                      ap['channel'], ap['housenumber']) for ap in aps])
+    conn.commit()
+    conn.close()
+
+def download_bssids():
+    """Download BSSIDs for each center point and store in database."""
+    init_db()
+    for lat, lon in center_points:
+        print(f"Fetching BSSIDs for center point ({lat}, {lon})...")
+        aps = query_wigle(lat, lon)
+        if aps:
+            print(f"Found {len(aps)} APs for center point ({lat}, {lon}).")
+            store_aps_in_db(aps)
+        else:
+            print(f"No APs found for center point ({lat}, {lon}).")
+        logging.info(f"Completed fetching {len(aps)} APs for center ({lat}, {lon})")
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, at most `capacity` saved up."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Take one token, sleeping until one is available."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+def make_tiles(centers, radius_m, tile_m):
+    """Cover the circles around the centers with non-overlapping tiles of a fixed grid.
+
+    The grid is anchored at lat/lon 0 so overlapping circles map to the same tiles, which are
+    therefore only crawled once. Returns a list of (tile_id, min_lat, max_lat, min_lon, max_lon).
+    """
+    lat_step = tile_m / 111194.0
+    # One longitude step for the whole area, computed at the mean latitude
+    ref_lat = sum(lat for lat, _ in centers) / len(centers)
+    lon_step = tile_m / (111194.0 * math.cos(math.radians(ref_lat)))
+    half_diagonal = tile_m / math.sqrt(2)
+    tiles = {}
+    for lat, lon in centers:
+        box = get_bounding_box(lat, lon, radius_m)
+        for i in range(math.floor(box['latrange1'] / lat_step), math.floor(box['latrange2'] / lat_step) + 1):
+            for j in range(math.floor(box['longrange1'] / lon_step), math.floor(box['longrange2'] / lon_step) + 1):
+                tile_id = f'{tile_m:g}:{i}:{j}'
+                if tile_id in tiles:
+                    continue
+                min_lat, min_lon = i * lat_step, j * lon_step
+                center_lat, center_lon = min_lat + lat_step / 2, min_lon + lon_step / 2
+                if haversine_distance(lat, lon, center_lat, center_lon) <= radius_m + half_diagonal:
+                    tiles[tile_id] = (tile_id, min_lat, min_lat + lat_step, min_lon, min_lon + lon_step)
+    return sorted(tiles.values())
+
+def filter_page(results, tile, centers, radius_m):
+    """Keep the APs of a WiGLE result page that lie inside the tile and within radius_m of a center."""
+    aps = [ap for ap in results if ap.get('trilat') is not None and ap.get('trilong') is not None and ap.get('netid')]
+    if not aps:
+        return []
+    lats = np.array([ap['trilat'] for ap in aps], dtype=float)
+    lons = np.array([ap['trilong'] for ap in aps], dtype=float)
+    _, min_lat, max_lat, min_lon, max_lon = tile
+    # Half-open tile bounds, so an AP on a tile edge belongs to exactly one tile
+    keep = (lats >= min_lat) & (lats < max_lat) & (lons >= min_lon) & (lons < max_lon)
+    near = np.zeros(len(aps), dtype=bool)
+    for lat, lon in centers:
+        near |= haversine_distances(lat, lon, lats, lons) <= radius_m
+    keep &= near
+    return [ap for ap, k in zip(aps, keep) if k]
+
+SQL_UPSERT_AP = '''
+    INSERT INTO ap_locations (bssid, lat, lon, lastupdt, road, channel, housenumber, source)
+    VALUES (?, ?, ?, ?, ?, ?, ?, 'wigle')
+    ON CONFLICT(bssid) DO UPDATE SET lat = excluded.lat, lon = excluded.lon, lastupdt = excluded.lastupdt,
+        road = excluded.road, channel = excluded.channel, housenumber = excluded.housenumber, source = 'wigle'
+'''
+
+def upsert_aps(conn, aps):
+    """Insert new APs and update changed ones in place. Returns (added, updated, unchanged) counts."""
+    rows = {}
+    for ap in aps:
+        rows[ap['netid'].upper()] = (ap['netid'].upper(), ap['trilat'], ap['trilong'], ap.get('lastupdt'),
+                                     ap.get('road'), ap.get('channel'), ap.get('housenumber'))
+    if not rows:
+        return 0, 0, 0
+    existing = {}
+    keys = list(rows)
+    for i in range(0, len(keys), 500):
+        chunk = keys[i:i + 500]
+        sql = 'SELECT bssid, lat, lon, lastupdt, road, channel, housenumber FROM ap_locations WHERE bssid IN ({})'
+        for row in conn.execute(sql.format(','.join('?' * len(chunk))), chunk):
+            existing[row[0]] = tuple(row)
+    changed = [row for bssid, row in rows.items() if existing.get(bssid) != row]
+    conn.executemany(SQL_UPSERT_AP, changed)
+    added = sum(1 for row in changed if row[0] not in existing)
+    return added, len(changed) - added, len(rows) - len(changed)
+
+def wigle_timestamp(iso_time):
+    """Format an ISO timestamp the way the WiGLE lastupdt search filter expects: yyyyMMddhhmmss."""
+    return datetime.fromisoformat(iso_time).strftime('%Y%m%d%H%M%S')
+
+def crawl_tile(tile, client, pool, centers, radius_m):
+    """Fetch every page of one tile, committing each page together with its searchAfter cursor.
+
+    Tiles with a `since` time only ask WiGLE for networks updated after it. Returns
+    (tile_id, [added, updated, unchanged], complete).
+    """
+    tile_id, min_lat, max_lat, min_lon, max_lon = tile
+    conn = pool.connection()
+    search_after, since = conn.execute('SELECT search_after, since FROM crawl_tiles WHERE tile_id = ?',
+                                       (tile_id,)).fetchone()
+    params = {
+        'latrange1': min_lat,
+        'latrange2': max_lat,
+        'longrange1': min_lon,
+        'longrange2': max_lon,
+        'onlymine': 'false',
+        'freenet': 'false',
+        'paynet': 'false',
+        'resultsPerPage': '100'
+    }
+    if since:
+        params['lastupdt'] = wigle_timestamp(since)
+    counts = [0, 0, 0]
+    while True:
+        if search_after:
+            params['searchAfter'] = search_after
+        logging.info(f"WiGLE API request for tile {tile_id}")
+        try:
+            data = client.search(params)
+        except WigleError as e:
+            # The tile stays not done, a later run resumes it from its last cursor
+            logging.error(f"WiGLE API request failed for tile {tile_id}: {e.message}")
+            return tile_id, counts, False
+
+        aps = filter_page(data.get('results', []), tile, centers, radius_m)
+        search_after = data.get('searchAfter') if data.get('results') else None
+        with conn:
+            page_counts = upsert_aps(conn, aps)
+            conn.execute('''
+                UPDATE crawl_tiles SET search_after = ?, done = ?, pages = pages + 1, aps = aps + ?, updated_at = ?
+                WHERE tile_id = ?
+            ''', (search_after, 0 if search_after else 1, len(aps), datetime.now().isoformat(), tile_id))
+            if not search_after:
+                # A finished pass makes its start time the lastupdt filter of the next refresh
+                conn.execute('UPDATE crawl_tiles SET last_crawled_at = pass_started_at WHERE tile_id = ?', (tile_id,))
+        counts = [c + p for c, p in zip(counts, page_counts)]
+        if not search_after:
+            return tile_id, counts, True
+
+def crawl(tile_m=CRAWL_TILE_SIZE, workers=CRAWL_WORKERS, rate=CRAWL_RATE, burst=CRAWL_BURST, reset=False, refresh=False):
+    """Crawler mode: fetch the tiles covering all center points concurrently, resuming unfinished tiles.
+
+    With refresh, tiles crawled completely before are fetched again, asking WiGLE only for the
+    networks updated since their last pass started.
+    """
+    init_db()
+    pool = ConnectionPool(DB_NAME)
+    conn = pool.connection()
+    tiles = make_tiles(center_points, CRAWL_RADIUS, tile_m)
+    # WiGLE lastupdt is compared in UTC
+    now = datetime.utcnow().replace(microsecond=0).isoformat()
+    with conn:
+        if reset:
+            conn.execute('UPDATE crawl_tiles SET search_after = NULL, done = 0, pages = 0, aps = 0, since = NULL, '
+                         'pass_started_at = ?', (now,))
+        if refresh:
+            conn.execute('UPDATE crawl_tiles SET search_after = NULL, done = 0, since = last_crawled_at, '
+                         'pass_started_at = ? WHERE done = 1', (now,))
+        conn.executemany('INSERT OR IGNORE INTO crawl_tiles (tile_id, min_lat, max_lat, min_lon, max_lon, pass_started_at) '
+                         'VALUES (?, ?, ?, ?, ?, ?)', [tile + (now,) for tile in tiles])
+    done = {row[0] for row in conn.execute('SELECT tile_id FROM crawl_tiles WHERE done = 1')}
+    todo = [tile for tile in tiles if tile[0] not in done]
+    print(f"{len(tiles)} tiles of {tile_m:g} m, {len(tiles) - len(todo)} already done, crawling {len(todo)}.")
+
+    # Cached pages are replayed without waiting for the token bucket
+    bucket = TokenBucket(rate, burst)
+    client = WigleClient(pool_size=workers, throttle=bucket.acquire)
+
+    failed = 0
+    totals = [0, 0, 0]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(crawl_tile, tile, client, pool, center_points, CRAWL_RADIUS) for tile in todo]
+        for future in as_completed(futures):
+            tile_id, counts, complete = future.result()
+            if not complete:
+                failed += 1
+            totals = [t + c for t, c in zip(totals, counts)]
+            print(f"Tile {tile_id}: {counts[0]} added, {counts[1]} updated, {counts[2]} unchanged"
+                  f"{'' if complete else ', interrupted'}.")
+    pool.close_all()
+    client.close()
+    print(f"Crawl finished: {totals[0]} APs added, {totals[1]} updated, {totals[2]} unchanged, "
+          f"{failed} tiles left to resume.")
+    return totals
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Download WiGLE BSSIDs around CENTER_POINTS.')
+    parser.add_argument('--crawl', action='store_true', help='parallel, resumable tile crawler mode')
+    parser.add_argument('--tile-size', type=float, default=CRAWL_TILE_SIZE, help='crawler tile size in meters')
+    parser.add_argument('--workers', type=int, default=CRAWL_WORKERS, help='concurrent crawler requests')
+    parser.add_argument('--rate', type=float, default=CRAWL_RATE, help='WiGLE requests per second')
+    parser.add_argument('--burst', type=int, default=CRAWL_BURST, help='WiGLE requests allowed in a burst')
+    parser.add_argument('--reset', action='store_true', help='restart the crawl instead of resuming it')
+    parser.add_argument('--refresh', action='store_true',
+                        help='incremental crawl: only networks updated since each tile was last crawled')
+    parser.add_argument('--snapshot', help='then write the memory-mapped AP snapshot read by app.py (AP_SNAPSHOT) to this file')
+    args = parser.parse_args()
+    if args.crawl or args.refresh:
+        crawl(args.tile_size, args.workers, args.rate, args.burst, args.reset, args.refresh)
+    else:
+        download_bssids()
+    print(f"Data stored in {DB_NAME}. API requests logged in {LOG_FILE}.")
+    if args.snapshot:
+        conn = sqlite3.connect(DB_NAME)
+        print(f"{write_snapshot(conn, args.snapshot)} AP locations written to {args.snapshot}")
+        conn.close()
\ No newline at end of file
@@ -0,0 +1,129 @@
+import numpy as np
+
+EARTH_RADIUS = 6371000.0  # meters
+
+# Log-distance path-loss model: rssi = TX_POWER_1M - 10 * n * log10(d)
+DEFAULT_TX_POWER_1M = -40.0  # dBm measured at 1 m
+DEFAULT_PATH_LOSS_EXPONENT = 3.0  # 2 in free space, 2.7-4 indoors / urban
+MIN_DISTANCE = 1.0  # meters
+GAUSS_NEWTON_ITERATIONS = 10
+
+
+def pad_scans(scans):
+    """Pack a list of scans, each a list of (lat, lon, rssi), into padded (S, K) arrays plus a mask."""
+    k = max((len(scan) for scan in scans), default=0)
+    lats = np.zeros((len(scans), k))
+    lons = np.zeros((len(scans), k))
+    rssis = np.full((len(scans), k), -np.inf)
+    mask = np.zeros((len(scans), k), dtype=bool)
+    for i, scan in enumerate(scans):
+        if scan:
+            lats[i, :len(scan)], lons[i, :len(scan)], rssis[i, :len(scan)] = zip(*scan)
+            mask[i, :len(scan)] = True
+    return lats, lons, rssis, mask
+
+
+def to_enu(lats, lons, lat0, lon0):
+    """Project degrees to a local east/north plane in meters around (lat0, lon0), per scan row."""
+    cos0 = np.cos(np.radians(lat0))[:, None]
+    x = np.radians(lons - lon0[:, None]) * EARTH_RADIUS * cos0
+    y = np.radians(lats - lat0[:, None]) * EARTH_RADIUS
+    return x, y
+
+
+def from_enu(x, y, lat0, lon0):
+    """Inverse of to_enu for one point per scan row."""
+    lat = lat0 + np.degrees(y / EARTH_RADIUS)
+    lon = lon0 + np.degrees(x / (EARTH_RADIUS * np.cos(np.radians(lat0))))
+    return lat, lon
+
+
+def rssi_weights(rssis, mask):
+    """Linear power weights 10^(rssi/10), zero outside the mask."""
+    return np.where(mask, 10.0 ** (np.where(mask, rssis, 0.0) / 10.0), 0.0)
+
+
+def top_k_mask(rssis, mask, k):
+    """Restrict mask to the k strongest APs of each scan."""
+    if k is None or k >= rssis.shape[1]:
+        return mask
+    order = np.argsort(np.where(mask, -rssis, np.inf), axis=1)
+    keep = np.zeros_like(mask)
+    np.put_along_axis(keep, order[:, :k], True, axis=1)
+    return keep & mask
+
+
+def _centroid_enu(x, y, w):
+    sum_w = w.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (w * x).sum(axis=1) / sum_w, (w * y).sum(axis=1) / sum_w
+
+
+def _trilaterate_enu(x, y, rssis, mask, w, tx_power, exponent):
+    """Weighted least squares fit of |p - ap| = d(rssi) by Gauss-Newton, all scans at once."""
+    d = np.maximum(10.0 ** ((tx_power - np.where(mask, rssis, tx_power)) / (10.0 * exponent)), MIN_DISTANCE)
+    # Near APs give tighter ranges, so weight residuals by 1/d^2
+    rw = np.where(mask, 1.0 / d ** 2, 0.0)
+    px, py = _centroid_enu(x, y, w)
+    for _ in range(GAUSS_NEWTON_ITERATIONS):
+        dx = px[:, None] - x
+        dy = py[:, None] - y
+        r = np.maximum(np.hypot(dx, dy), 1e-6)
+        res = r - d
+        jx, jy = dx / r, dy / r
+        a11 = (rw * jx * jx).sum(axis=1)
+        a12 = (rw * jx * jy).sum(axis=1)
+        a22 = (rw * jy * jy).sum(axis=1)
+        b1 = (rw * jx * res).sum(axis=1)
+        b2 = (rw * jy * res).sum(axis=1)
+        det = a11 * a22 - a12 * a12
+        # Scans with fewer than 3 APs, or collinear ones, keep their centroid
+        ok = (mask.sum(axis=1) >= 3) & (np.abs(det) > 1e-12)
+        safe_det = np.where(ok, det, 1.0)
+        px = px - np.where(ok, (a22 * b1 - a12 * b2) / safe_det, 0.0)
+        py = py - np.where(ok, (a11 * b2 - a12 * b1) / safe_det, 0.0)
+    return px, py
+
+
+def estimate_batch(lats, lons, rssis, mask, algorithm='centroid', k=None,
+                   tx_power=DEFAULT_TX_POWER_1M, exponent=DEFAULT_PATH_LOSS_EXPONENT):
+    """Estimate positions for S scans at once from padded (S, K) arrays.
+
+    algorithm is 'centroid' (RSSI weighted centroid) or 'trilateration' (log-distance
+    path-loss ranges solved by least squares); k keeps only the k strongest APs of each scan.
+    Returns (est_lat, est_lon) arrays of shape (S,), NaN where a scan has no usable AP.
+    """
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+    rssis = np.asarray(rssis, dtype=float)
+    mask = top_k_mask(rssis, np.asarray(mask, dtype=bool), k)
+    count = mask.sum(axis=1)
+    safe_count = np.maximum(count, 1)
+    # Reference point per scan: plain mean of its APs
+    lat0 = np.where(mask, lats, 0.0).sum(axis=1) / safe_count
+    lon0 = np.where(mask, lons, 0.0).sum(axis=1) / safe_count
+    x, y = to_enu(lats, lons, lat0, lon0)
+    w = rssi_weights(rssis, mask)
+
+    if algorithm == 'centroid':
+        px, py = _centroid_enu(x, y, w)
+    elif algorithm == 'trilateration':
+        px, py = _trilaterate_enu(x, y, rssis, mask, w, tx_power, exponent)
+    else:
+        raise ValueError(f"Unknown estimation algorithm {algorithm}")
+
+    est_lat, est_lon = from_enu(px, py, lat0, lon0)
+    invalid = (count == 0) | ~(w.sum(axis=1) > 0)
+    est_lat[invalid] = np.nan
+    est_lon[invalid] = np.nan
+    return est_lat, est_lon
+
+
+def estimate(aps, algorithm='centroid', k=None, **kwargs):
+    """Estimate one position from a list of (lat, lon, rssi). Returns (lat, lon) or None."""
+    if not aps:
+        return None
+    est_lat, est_lon = estimate_batch(*pad_scans([aps]), algorithm=algorithm, k=k, **kwargs)
+    if np.isnan(est_lat[0]):
+        return None
+    return float(est_lat[0]), float(est_lon[0])
@@ -1,4 +1,7 @@
 import sqlite3
+import argparse
+import math
+import struct
 from dotenv import load_dotenv
 import os
 
@@ -11,26 +14,181 @@ if not DB_NAME:
     print("DB_FILENAME not set in .env")
 LOG_FILE = 'wigle_extract_bssid.log'
 
-dbfile = DB_NAME
-con = sqlite3.connect(dbfile)
+# Raw flash image header: magic, version, kind, bloom hash count, key count, bloom bits, reserved
+BIN_MAGIC = b'BSSD'
+BIN_VERSION = 1
+BIN_KIND_SORTED = 0
+BIN_KIND_BLOOM = 1
+BIN_HEADER = struct.Struct('<4sBBHIII')
 
-cur = con.cursor()
+FNV64_OFFSET = 0xcbf29ce484222325
+FNV64_PRIME = 0x100000001b3
 
-out_file = 'bssid_list.h'
-with open(out_file, 'w') as f:
-    f.write('#ifndef BSSID_LIST_H\n')
-    f.write('#define BSSID_LIST_H\n\n')
-    f.write('const char* bssid_list[][6] = {\n')
 
-    # Execute a query
-    for row in cur.execute("SELECT bssid FROM ap_locations"):
-        bssid = row[0]
-        f.write(f'    {{0x{bssid[0:2]},0x{bssid[3:5]},0x{bssid[6:8]},0x{bssid[9:11]},0x{bssid[12:14]},0x{bssid[15:17]}}},\n')
+def load_bssids(con, bbox=None, crawled_tiles=False):
+    """Return the sorted, deduplicated 6 byte BSSID keys of ap_locations, optionally filtered by area."""
+    sql = "SELECT a.bssid FROM ap_locations a"
+    params = []
+    if crawled_tiles:
+        # Only APs inside tiles the crawler has completely fetched
+        sql += (" JOIN crawl_tiles t ON (t.done = 1 OR t.last_crawled_at IS NOT NULL)"
+                " AND a.lat >= t.min_lat AND a.lat < t.max_lat AND a.lon >= t.min_lon AND a.lon < t.max_lon")
+    if bbox:
+        min_lat, min_lon, max_lat, max_lon = bbox
+        sql += " WHERE a.lat BETWEEN ? AND ? AND a.lon BETWEEN ? AND ?"
+        params = [min_lat, max_lat, min_lon, max_lon]
+    keys = set()
+    for (bssid,) in con.execute(sql, params):
+        try:
+            key = bytes.fromhex(bssid.replace(':', '').replace('-', ''))
+        except (AttributeError, ValueError):
+            continue
+        if len(key) == 6:
+            keys.add(key)
+    # Big endian 6 byte keys: byte order == numeric order, so the device can binary search with memcmp
+    return sorted(keys)
 
-    f.write('};\n\n')
-    f.write('#endif // BSSID_LIST_H\n')
 
+def fnv1a64(key):
+    """64 bit FNV-1a hash, same as bssid_hash() in the generated header."""
+    h = FNV64_OFFSET
+    for b in key:
+        h ^= b
+        h = (h * FNV64_PRIME) & 0xFFFFFFFFFFFFFFFF
+    return h
 
 
-# Be sure to close the connection
-con.close()
\ No newline at end of file
+def bloom_parameters(count, fp_rate):
+    """Optimal bit count and hash count for count keys at the wanted false positive rate."""
+    m = max(8, math.ceil(-count * math.log(fp_rate) / (math.log(2) ** 2)))
+    m = (m + 7) // 8 * 8
+    k = max(1, round(m / max(count, 1) * math.log(2)))
+    return m, k
+
+
+def build_bloom(keys, fp_rate):
+    """Build a Bloom filter of the keys, using double hashing of the two halves of FNV-1a 64."""
+    m, k = bloom_parameters(len(keys), fp_rate)
+    bits = bytearray(m // 8)
+    for key in keys:
+        h = fnv1a64(key)
+        h1 = h & 0xFFFFFFFF
+        h2 = (h >> 32) | 1
+        for i in range(k):
+            bit = (h1 + i * h2) % m
+            bits[bit >> 3] |= 1 << (bit & 7)
+    return bits, m, k
+
+
+def c_bytes(data, per_line=16, indent='    '):
+    """Format bytes as lines of C hex literals."""
+    lines = []
+    for i in range(0, len(data), per_line):
+        lines.append(indent + ','.join(f'0x{b:02X}' for b in data[i:i + per_line]) + ',')
+    return '\n'.join(lines)
+
+
+def write_sorted_header(keys, out_file):
+    """Write a sorted table of 6 byte keys with a binary search lookup function."""
+    with open(out_file, 'w') as f:
+        f.write('#ifndef BSSID_LIST_H\n')
+        f.write('#define BSSID_LIST_H\n\n')
+        f.write('#include <stdint.h>\n#include <string.h>\n\n')
+        f.write(f'#define BSSID_COUNT {len(keys)}\n\n')
+        f.write('// Sorted 48 bit BSSID keys, most significant byte first\n')
+        f.write('const uint8_t bssid_list[][6] = {\n')
+        for key in keys:
+            f.write('    {' + ','.join(f'0x{b:02X}' for b in key) + '},\n')
+        f.write('};\n\n')
+        f.write('// Binary search of the sorted table\n')
+        f.write('static inline bool bssid_known(const uint8_t *bssid) {\n')
+        f.write('    int lo = 0, hi = BSSID_COUNT - 1;\n')
+        f.write('    while (lo <= hi) {\n')
+        f.write('        int mid = (lo + hi) / 2;\n')
+        f.write('        int cmp = memcmp(bssid, bssid_list[mid], 6);\n')
+        f.write('        if (cmp == 0) return true;\n')
+        f.write('        if (cmp < 0) hi = mid - 1; else lo = mid + 1;\n')
+        f.write('    }\n')
+        f.write('    return false;\n')
+        f.write('}\n\n')
+        f.write('#endif // BSSID_LIST_H\n')
+
+
+def write_bloom_header(bits, m, k, count, fp_rate, out_file):
+    """Write a Bloom filter of the BSSIDs with its membership test function."""
+    with open(out_file, 'w') as f:
+        f.write('#ifndef BSSID_LIST_H\n')
+        f.write('#define BSSID_LIST_H\n\n')
+        f.write('#include <stdint.h>\n\n')
+        f.write(f'// Bloom filter of {count} BSSIDs, false positive rate {fp_rate:g}\n')
+        f.write(f'#define BSSID_BLOOM_BITS {m}UL\n')
+        f.write(f'#define BSSID_BLOOM_HASHES {k}\n\n')
+        f.write('const uint8_t bssid_bloom[] = {\n')
+        f.write(c_bytes(bits) + '\n')
+        f.write('};\n\n')
+        f.write('// 64 bit FNV-1a of the 6 BSSID bytes\n')
+        f.write('static inline uint64_t bssid_hash(const uint8_t *bssid) {\n')
+        f.write(f'    uint64_t h = 0x{FNV64_OFFSET:X}ULL;\n')
+        f.write('    for (int i = 0; i < 6; i++) {\n')
+        f.write('        h ^= bssid[i];\n')
+        f.write(f'        h *= 0x{FNV64_PRIME:X}ULL;\n')
+        f.write('    }\n')
+        f.write('    return h;\n')
+        f.write('}\n\n')
+        f.write('// false: surely unknown, true: probably known\n')
+        f.write('static inline bool bssid_known(const uint8_t *bssid) {\n')
+        f.write('    uint64_t h = bssid_hash(bssid);\n')
+        f.write('    uint32_t h1 = (uint32_t)h;\n')
+        f.write('    uint32_t h2 = (uint32_t)(h >> 32) | 1;\n')
+        f.write('    for (uint32_t i = 0; i < BSSID_BLOOM_HASHES; i++) {\n')
+        f.write('        uint32_t bit = (uint32_t)((h1 + (uint64_t)i * h2) % BSSID_BLOOM_BITS);\n')
+        f.write('        if (!(bssid_bloom[bit >> 3] & (1 << (bit & 7)))) return false;\n')
+        f.write('    }\n')
+        f.write('    return true;\n')
+        f.write('}\n\n')
+        f.write('#endif // BSSID_LIST_H\n')
+
+
+def write_bin(out_file, kind, payload, count, m=0, k=0):
+    """Write a raw flash image: BIN_HEADER followed by the sorted keys or the Bloom bits."""
+    with open(out_file, 'wb') as f:
+        f.write(BIN_HEADER.pack(BIN_MAGIC, BIN_VERSION, kind, k, count, m, 0))
+        f.write(payload)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate the tracker BSSID table from ap_locations.')
+    parser.add_argument('--format', choices=['sorted', 'bloom'], default='sorted',
+                        help='sorted binary search table, or Bloom filter for very large areas')
+    parser.add_argument('--fp-rate', type=float, default=0.01, help='Bloom filter false positive rate')
+    parser.add_argument('--bbox', help='only APs inside min_lat,min_lon,max_lat,max_lon')
+    parser.add_argument('--crawled-tiles', action='store_true', help='only APs inside tiles crawled by download_bssids.py')
+    parser.add_argument('--output', default='bssid_list.h', help='C header to write')
+    parser.add_argument('--bin', help='also write a raw flash image to this file')
+    args = parser.parse_args()
+
+    bbox = None
+    if args.bbox:
+        bbox = [float(v) for v in args.bbox.split(',')]
+        if len(bbox) != 4:
+            parser.error('--bbox must be min_lat,min_lon,max_lat,max_lon')
+
+    con = sqlite3.connect(DB_NAME)
+    keys = load_bssids(con, bbox, args.crawled_tiles)
+    con.close()
+
+    if args.format == 'sorted':
+        write_sorted_header(keys, args.output)
+        if args.bin:
+            write_bin(args.bin, BIN_KIND_SORTED, b''.join(keys), len(keys))
+        print(f"{len(keys)} BSSIDs written to {args.output} ({len(keys) * 6} bytes of table)")
+    else:
+        bits, m, k = build_bloom(keys, args.fp_rate)
+        write_bloom_header(bits, m, k, len(keys), args.fp_rate, args.output)
+        if args.bin:
+            write_bin(args.bin, BIN_KIND_BLOOM, bytes(bits), len(keys), m, k)
+        print(f"{len(keys)} BSSIDs written to {args.output} as a {m} bit Bloom filter with {k} hashes")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+import threading
+import time
+from collections import OrderedDict
+from ap_cache import normalize_bssid
+
+
+class FingerprintCache:
+    """Bounded LRU memo of scan fingerprint -> estimated position.
+
+    A fingerprint is the sorted set of BSSIDs of a scan with each RSSI quantized into
+    `rssi_bucket` dB buckets, so a pet that has not moved maps to the same key. A reverse
+    index from BSSID to fingerprints drops every entry that used an AP whose location changed.
+    """
+
+    def __init__(self, maxsize=10000, ttl=3600.0, rssi_bucket=6):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.rssi_bucket = rssi_bucket
+        self._entries = OrderedDict()  # key -> (expires_at, result)
+        self._by_bssid = {}  # bssid -> set of keys
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def key(self, aps):
+        """Fingerprint of a list of {'bssid', 'rssi'} dicts."""
+        return tuple(sorted((normalize_bssid(ap['bssid']), int(ap['rssi']) // self.rssi_bucket) for ap in aps))
+
+    def get(self, key):
+        """Return the cached result for a fingerprint, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, result):
+        """Store the result of a fingerprint."""
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, result)
+            for bssid, _ in key:
+                self._by_bssid.setdefault(bssid, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        self._entries.pop(key, None)
+        for bssid, _ in key:
+            keys = self._by_bssid.get(bssid)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_bssid[bssid]
+
+    def invalidate_bssid(self, bssid):
+        """Drop every fingerprint that contains bssid. Returns the number of entries dropped."""
+        with self._lock:
+            keys = list(self._by_bssid.get(normalize_bssid(bssid), ()))
+            for key in keys:
+                self._remove(key)
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def clear(self):
+        """Drop every fingerprint."""
+        with self._lock:
+            self._entries.clear()
+            self._by_bssid.clear()
+
+    def stats(self):
+        """Return the cache counters as a dict."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'hit_ratio': self.hits / lookups if lookups else 0.0
+            }
@@ -1 +1 @@
-pip install flask requests dotenv
+pip install -r requirements.txt
@@ -0,0 +1,60 @@
+import collections
+import logging
+import threading
+
+
+class ScanFeed:
+    """Wakes live map streams up when scans are committed.
+
+    Every publish bumps a sequence number. Streams wait for it to change and then read the
+    new scans rows from the database, so the feed itself carries no positions, only the ids
+    of existing rows whose estimate was updated (they would not show up as new rows).
+    """
+
+    def __init__(self, history=1000):
+        self._cond = threading.Condition()
+        self._seq = 0
+        self._updates = collections.deque(maxlen=history)  # (seq, scan row id)
+        self._listeners = set()
+
+    @property
+    def seq(self):
+        return self._seq
+
+    def publish(self, updated_rows=()):
+        """Signal new scans rows, and optionally the ids of re-estimated ones."""
+        with self._cond:
+            self._seq += 1
+            for scan_row in updated_rows:
+                self._updates.append((self._seq, scan_row))
+            self._cond.notify_all()
+            listeners = list(self._listeners)
+        for listener in listeners:
+            try:
+                listener()
+            except Exception as e:
+                # e.g. the event loop of a stream that went away is closed: drop that listener
+                logging.warning(f"Live feed: dropping a failed listener: {e!r}")
+                self.unsubscribe(listener)
+
+    def subscribe(self, listener):
+        """Call listener() from the publishing thread on every publish, for streams that cannot block a thread.
+
+        A listener that raises is unsubscribed.
+        """
+        with self._cond:
+            self._listeners.add(listener)
+
+    def unsubscribe(self, listener):
+        with self._cond:
+            self._listeners.discard(listener)
+
+    def wait(self, seq, timeout):
+        """Block until something is published after seq, or timeout.
+
+        Returns (current seq, ids of rows re-estimated since seq).
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq != seq, timeout)
+            updated = [scan_row for update_seq, scan_row in self._updates if update_seq > seq]
+            return self._seq, updated
@@ -0,0 +1,181 @@
+import bisect
+import contextlib
+import logging
+import logging.handlers
+import queue
+import random
+import threading
+import time
+
+# Latency buckets in seconds, from a cache hit to a slow WiGLE call
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def format_labels(names, values):
+    if not names:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for v in values)
+    return '{' + ','.join(f'{n}="{v}"' for n, v in zip(names, escaped)) + '}'
+
+
+class Counter:
+    """Monotonic counter, optionally split by label values."""
+
+    kind = 'counter'
+
+    def __init__(self, name, doc, labels=()):
+        self.name = name
+        self.doc = doc
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        if not values and not self.labels:
+            values = [((), 0)]
+        for label_values, value in values:
+            yield self.name, format_labels(self.labels, label_values), value
+
+
+class Gauge:
+    """Value read when the metrics are rendered: callback() returns a number, or a dict label value -> number."""
+
+    kind = 'gauge'
+
+    def __init__(self, name, doc, callback, label=None):
+        self.name = name
+        self.doc = doc
+        self.callback = callback
+        self.label = label
+
+    def samples(self):
+        value = self.callback()
+        if self.label is None:
+            yield self.name, '', value
+        else:
+            for label_value, v in sorted(value.items()):
+                yield self.name, format_labels((self.label,), (label_value,)), v
+
+
+class Histogram:
+    """Cumulative bucket histogram of durations, optionally split by label values."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, doc, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.doc = doc
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            series[i] += 1
+            series[-1] += value
+
+    @contextlib.contextmanager
+    def time(self, *label_values):
+        """Observe the duration of the with block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *label_values)
+
+    def samples(self):
+        with self._lock:
+            series = sorted((k, list(v)) for k, v in self._series.items())
+        for label_values, counts in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                yield (self.name + '_bucket',
+                       format_labels(self.labels + ('le',), label_values + (le,)), cumulative)
+            labels = format_labels(self.labels, label_values)
+            yield self.name + '_sum', labels, counts[-1]
+            yield self.name + '_count', labels, cumulative
+
+
+class Registry:
+    """Set of metrics rendered together in the Prometheus text exposition format."""
+
+    CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, doc, labels=()):
+        return self.register(Counter(name, doc, labels))
+
+    def gauge(self, name, doc, callback, label=None):
+        return self.register(Gauge(name, doc, callback, label))
+
+    def histogram(self, name, doc, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, doc, labels, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.doc}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+class SampleFilter(logging.Filter):
+    """Let through a fraction `rate` of the records, warnings and errors always pass."""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+def sampled_logger(name, rate, handler, capacity=10000):
+    """Logger whose records are sampled, then formatted and written by a background thread.
+
+    The request thread only enqueues the record; when the queue is full the record is
+    dropped instead of blocking. Returns (logger, listener); call listener.stop() to flush.
+    """
+    records = queue.Queue(maxsize=capacity)
+    queue_handler = DroppingQueueHandler(records)
+    queue_handler.addFilter(SampleFilter(rate))
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    logger.addHandler(queue_handler)
+    listener = logging.handlers.QueueListener(records, handler, respect_handler_level=True)
+    listener.start()
+    return logger, listener
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records rather than waiting when the queue is full."""
+
+    dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
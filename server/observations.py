@@ -0,0 +1,138 @@
+import struct
+import numpy as np
+
+# Raw observation of a scan, stored in scans.observation: the APs heard, packed back to
+# back as 8 byte records laid out like AccessPoint in packet.h (bssid 6 bytes, rssi i8, channel u8).
+AP_RECORD = struct.Struct('<6sbB')
+AP_DTYPE = np.dtype([('bssid', 'u1', (6,)), ('rssi', 'i1'), ('channel', 'u1')])
+
+SQL_SELECT_OBSERVATIONS = ('SELECT id, timestamp, device_id, est_lat, est_lon, vbat, cat_rssi, cat_snr, ap_rssi, ap_snr, '
+                           'observation FROM scans WHERE timestamp > ? AND timestamp <= ?{} ORDER BY timestamp')
+SQL_SELECT_AP_LOCATIONS = 'SELECT bssid, lat, lon FROM ap_locations WHERE bssid IN ({})'
+SQLITE_MAX_IN_PARAMS = 500
+
+
+def bssid_key(bssid):
+    """48 bit integer key of a colon or dash separated BSSID. Raises ValueError for anything else."""
+    digits = bssid.replace(':', '').replace('-', '')
+    if len(digits) != 12:
+        raise ValueError(f'Not a 48 bit BSSID: {bssid!r}')
+    return int(digits, 16)
+
+
+def format_bssid_key(key):
+    """Upper case, colon separated BSSID of a 48 bit key."""
+    return ':'.join(f'{(int(key) >> shift) & 0xFF:02X}' for shift in range(40, -8, -8))
+
+
+def pack_observation(aps):
+    """Pack a list of {'bssid', 'rssi', optional 'channel'} dicts. Malformed BSSIDs are skipped."""
+    records = []
+    for ap in aps:
+        try:
+            raw = bytes.fromhex(ap['bssid'].replace(':', '').replace('-', ''))
+        except (AttributeError, ValueError):
+            continue
+        if len(raw) != 6:
+            continue
+        rssi = max(-128, min(127, int(ap['rssi'])))
+        records.append(AP_RECORD.pack(raw, rssi, int(ap.get('channel') or 0) & 0xFF))
+    return b''.join(records)
+
+
+def unpack_observation(blob):
+    """Decode one packed observation into a list of {'bssid', 'rssi', 'channel'} dicts."""
+    return [{'bssid': ':'.join(f'{b:02X}' for b in raw), 'rssi': rssi, 'channel': channel}
+            for raw, rssi, channel in AP_RECORD.iter_unpack(blob or b'')]
+
+
+def decode_rows(rows):
+    """Decode rows of SQL_SELECT_OBSERVATIONS into a dict of NumPy arrays, one entry per scan.
+
+    The APs are returned as padded (S, K) arrays: 'bssids' (uint64 keys), 'rssis' (float,
+    -inf padding), 'channels' and 'mask'. All the blobs are decoded with one frombuffer.
+    """
+    n = len(rows)
+    columns = list(zip(*rows))
+    blobs = [blob or b'' for blob in columns[10]]
+    counts = np.fromiter((len(blob) for blob in blobs), np.int64, n) // AP_DTYPE.itemsize
+    records = np.frombuffer(b''.join(blobs), AP_DTYPE)
+    width = int(counts.max()) if n else 0
+    scan_index = np.repeat(np.arange(n), counts)
+    ap_index = np.arange(len(records)) - np.repeat(np.cumsum(counts) - counts, counts)
+
+    # Big endian 6 byte BSSID -> 48 bit key
+    raw = records['bssid'].astype(np.uint64)
+    keys = np.zeros(len(records), np.uint64)
+    for i in range(6):
+        keys |= raw[:, i] << np.uint64(40 - 8 * i)
+
+    bssids = np.zeros((n, width), np.uint64)
+    rssis = np.full((n, width), -np.inf)
+    channels = np.zeros((n, width), np.uint8)
+    mask = np.zeros((n, width), bool)
+    bssids[scan_index, ap_index] = keys
+    rssis[scan_index, ap_index] = records['rssi']
+    channels[scan_index, ap_index] = records['channel']
+    mask[scan_index, ap_index] = True
+    return {
+        'id': np.fromiter(columns[0], np.int64, n),
+        'timestamp': np.array(columns[1], dtype='datetime64[us]'),
+        'device_id': np.array(columns[2], dtype=object),
+        'est_lat': np.array(columns[3], dtype=float),
+        'est_lon': np.array(columns[4], dtype=float),
+        'vbat': np.array(columns[5], dtype=float),
+        'cat_rssi': np.array(columns[6], dtype=float),
+        'cat_snr': np.array(columns[7], dtype=float),
+        'ap_rssi': np.array(columns[8], dtype=float),
+        'ap_snr': np.array(columns[9], dtype=float),
+        'bssids': bssids,
+        'rssis': rssis,
+        'channels': channels,
+        'mask': mask
+    }
+
+
+def read_observations(conn, since, until, device_id=None, batch_size=50000):
+    """Stream the scans of a time range, oldest first, as decode_rows() dicts of at most batch_size scans."""
+    if device_id is None:
+        cursor = conn.execute(SQL_SELECT_OBSERVATIONS.format(''), (since, until))
+    else:
+        cursor = conn.execute(SQL_SELECT_OBSERVATIONS.format(' AND device_id = ?'), (since, until, device_id))
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield decode_rows(rows)
+
+
+def locate(conn, bssids, mask):
+    """Look the (S, K) BSSID keys up in ap_locations with one query per 500 distinct APs.
+
+    Returns (lats, lons, located) arrays of the same shape; located is False for unknown APs.
+    """
+    known_keys = []
+    known_lats = []
+    known_lons = []
+    distinct = np.unique(bssids[mask])
+    for i in range(0, len(distinct), SQLITE_MAX_IN_PARAMS):
+        chunk = [format_bssid_key(key) for key in distinct[i:i + SQLITE_MAX_IN_PARAMS]]
+        for bssid, lat, lon in conn.execute(SQL_SELECT_AP_LOCATIONS.format(','.join('?' * len(chunk))), chunk):
+            if lat is not None and lon is not None:
+                known_keys.append(bssid_key(bssid))
+                known_lats.append(lat)
+                known_lons.append(lon)
+    order = np.argsort(np.array(known_keys, np.uint64))
+    known_keys = np.array(known_keys, np.uint64)[order]
+    known_lats = np.array(known_lats, float)[order]
+    known_lons = np.array(known_lons, float)[order]
+
+    lats = np.zeros(bssids.shape)
+    lons = np.zeros(bssids.shape)
+    located = np.zeros(bssids.shape, bool)
+    if len(known_keys):
+        pos = np.minimum(np.searchsorted(known_keys, bssids), len(known_keys) - 1)
+        located = mask & (known_keys[pos] == bssids)
+        lats[located] = known_lats[pos[located]]
+        lons[located] = known_lons[pos[located]]
+    return lats, lons, located
@@ -0,0 +1,67 @@
+import struct
+
+# Mirrors Lora_peer_to_peer/Lora_station_251001-113904-seeed_xiao_esp32s3/include/packet.h
+CAT_UID = 0x54705810
+PACKET_VERSION = 1
+MAX_APS_IN_PACKET = 5
+
+# CatPacket v1 as laid out in memory on the ESP32 (little endian, natural alignment):
+# UID u32, packetNumber u8, 1 pad byte, vbatt u16, rssi i8, snr i8, interval u8, apCount u8,
+# then MAX_APS_IN_PACKET AccessPoint records of bssid 6 bytes, rssi i8, channel u8.
+# The pad byte makes sizeof(CatPacket) 52, one more than the 11 + 5 * 8 bytes in packet.h.
+CAT_PACKET_V1 = struct.Struct('<IBxHbbBB' + '6sbB' * MAX_APS_IN_PACKET)
+
+
+class PacketError(ValueError):
+    """Raised when a binary frame cannot be decoded."""
+
+
+def format_bssid(raw):
+    """Format 6 raw bytes as an upper case, colon separated BSSID."""
+    return ':'.join(f'{b:02X}' for b in raw)
+
+
+def _decode_v1(fields):
+    uid, packet_number, vbatt, rssi, snr, interval, ap_count = fields[:7]
+    aps = []
+    for i in range(min(ap_count, MAX_APS_IN_PACKET)):
+        raw_bssid, ap_rssi, channel = fields[7 + 3 * i:10 + 3 * i]
+        aps.append({'bssid': format_bssid(raw_bssid), 'rssi': ap_rssi, 'channel': channel})
+    return {
+        'uid': uid,
+        'scan_id': packet_number,
+        'vbatt': vbatt,
+        'cat_rssi': rssi,
+        'cat_snr': snr,
+        'interval': interval,
+        'aps': aps
+    }
+
+
+# PACKET_VERSION -> (record layout, decoder of one unpacked record)
+DECODERS = {
+    1: (CAT_PACKET_V1, _decode_v1),
+}
+
+
+def decode_cat_packets(data, version=PACKET_VERSION):
+    """Decode a frame of one or more back to back CatPackets into a list of dicts."""
+    if version not in DECODERS:
+        raise PacketError(f"Unsupported packet version {version}")
+    layout, decode = DECODERS[version]
+    if not data or len(data) % layout.size != 0:
+        raise PacketError(f"Frame of {len(data)} bytes is not a whole number of {layout.size} byte packets")
+    return [decode(fields) for fields in layout.iter_unpack(data)]
+
+
+def encode_cat_packet(uid, scan_id, vbatt, cat_rssi, cat_snr, interval, aps):
+    """Build a v1 CatPacket, as sent by the station. aps is a list of (bssid, rssi, channel)."""
+    aps = aps[:MAX_APS_IN_PACKET]
+    fields = [uid, scan_id, vbatt, cat_rssi, cat_snr, interval, len(aps)]
+    for i in range(MAX_APS_IN_PACKET):
+        if i < len(aps):
+            bssid, rssi, channel = aps[i]
+            fields.extend([bytes.fromhex(bssid.replace(':', '')), rssi, channel])
+        else:
+            fields.extend([bytes(6), 0, 0])
+    return CAT_PACKET_V1.pack(*fields)
@@ -0,0 +1,262 @@
+import datetime
+import logging
+import math
+import threading
+import time
+import numpy as np
+import estimator
+from ap_cache import normalize_bssid
+from observations import read_observations, locate, format_bssid_key
+from spatial import haversine_distances
+
+METERS_PER_DEGREE_LAT = 111194.0
+
+
+class RadioMap:
+    """Gridded RSSI fingerprint index: for each grid cell, the mean RSSI of every BSSID heard there.
+
+    The (cell, BSSID) means are stored as a sparse matrix in compressed column form, one
+    column per BSSID, so matching a scan only touches the cells that heard its BSSIDs.
+    RSSIs are shifted by `rssi_floor`, the value of a BSSID that is not heard, which turns
+    the RSSI distance of a scan to every candidate cell into
+    |q|^2 + |c|^2 - 2 q.c, with q.c summed over the scan's BSSIDs only.
+    """
+
+    def __init__(self, bssids, indptr, cells, values, cell_lats, cell_lons, cell_scans,
+                 rssi_floor=-100.0, cell_size=10.0):
+        self.columns = {bssid: i for i, bssid in enumerate(bssids)}  # BSSID -> column
+        self.indptr = indptr
+        self.cells = cells
+        self.values = values
+        self.cell_lats = cell_lats
+        self.cell_lons = cell_lons
+        self.cell_scans = cell_scans
+        self.rssi_floor = rssi_floor
+        self.cell_size = cell_size
+        n = len(cell_lats)
+        self.cell_norms = np.bincount(cells, weights=values * values, minlength=n)
+        self.cell_bssids = np.bincount(cells, minlength=n)
+
+    def __len__(self):
+        return len(self.cell_lats)
+
+    def match(self, aps, k=4, min_common=4, max_distance=6.0):
+        """Estimate the position of one scan, a list of {'bssid', 'rssi'} dicts, from its k nearest cells.
+
+        Only cells sharing at least min_common BSSIDs with the scan are candidates; the
+        distance is the RMS RSSI difference in dB over the BSSIDs of the scan and the cell.
+        A BSSID listed twice in the scan counts once, with its strongest RSSI.
+        Returns (lat, lon), the inverse distance weighted mean of the cell centers, or None
+        when no cell is closer than max_distance.
+        """
+        if not len(self):
+            return None
+        values = {}
+        for ap in aps:
+            bssid = normalize_bssid(ap['bssid'])
+            value = max(float(ap['rssi']) - self.rssi_floor, 0.0)
+            values[bssid] = max(values.get(bssid, value), value)
+        columns = []
+        query = []
+        query_norm = 0.0
+        for bssid, value in values.items():
+            query_norm += value * value
+            column = self.columns.get(bssid)
+            if column is not None:
+                columns.append(column)
+                query.append(value)
+        if len(columns) < min_common:
+            return None
+        starts = self.indptr[columns]
+        lengths = self.indptr[np.array(columns) + 1] - starts
+        # Postings of the scan's BSSIDs, gathered without a Python loop over cells
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        cells = self.cells[offsets]
+        products = self.values[offsets] * np.repeat(query, lengths)
+        candidates, inverse, common = np.unique(cells, return_inverse=True, return_counts=True)
+        dots = np.bincount(inverse, weights=products)
+        keep = common >= min_common
+        if not keep.any():
+            return None
+        candidates = candidates[keep]
+        squared = np.maximum(query_norm + self.cell_norms[candidates] - 2 * dots[keep], 0.0)
+        union = len(values) + self.cell_bssids[candidates] - common[keep]
+        distances = np.sqrt(squared / union)
+        close = distances <= max_distance
+        if not close.any():
+            return None
+        candidates = candidates[close]
+        distances = distances[close]
+        if len(candidates) > k:
+            nearest = np.argpartition(distances, k)[:k]
+            candidates = candidates[nearest]
+            distances = distances[nearest]
+        weights = 1.0 / (distances + 1.0)
+        return (float(np.dot(weights, self.cell_lats[candidates]) / weights.sum()),
+                float(np.dot(weights, self.cell_lons[candidates]) / weights.sum()))
+
+    def stats(self):
+        return {
+            'cells': len(self),
+            'bssids': len(self.columns),
+            'entries': len(self.cells),
+            'cell_size': self.cell_size
+        }
+
+
+def build_radio_map(conn, since, until, cell_size=10.0, min_scans=2, rssi_floor=-100.0,
+                    batch_size=50000, **options):
+    """Build a RadioMap from the raw observations of the scans stored between since and until.
+
+    Each scan is positioned again with estimator.estimate_batch(**options) from the current
+    ap_locations, so learned AP positions are used; scans without an estimate are left out.
+    Cells of cell_size meters with fewer than min_scans scans are dropped.
+    """
+    lat_step = cell_size / METERS_PER_DEGREE_LAT
+    lon_step = None
+    # Per batch: (cell key, lat, lon) of each estimated scan and (cell key, BSSID, RSSI) of each AP heard
+    pair_parts = []
+    cell_parts = []
+    for batch in read_observations(conn, since, until, batch_size=batch_size):
+        lats, lons, located = locate(conn, batch['bssids'], batch['mask'])
+        est_lat, est_lon = estimator.estimate_batch(lats, lons, batch['rssis'], located, **options)
+        ok = ~np.isnan(est_lat)
+        if not ok.any():
+            continue
+        est_lat, est_lon = est_lat[ok], est_lon[ok]
+        if lon_step is None:
+            lon_step = lat_step / max(math.cos(math.radians(float(est_lat.mean()))), 1e-6)
+        # Cell key: row and column of the grid packed in one int64
+        cell_keys = (np.floor(est_lat / lat_step).astype(np.int64) << 32) + np.floor(est_lon / lon_step).astype(np.int64)
+        cell_parts.append((cell_keys, est_lat, est_lon))
+        mask = batch['mask'][ok]
+        pair_parts.append((np.broadcast_to(cell_keys[:, None], mask.shape)[mask],
+                           batch['bssids'][ok][mask], batch['rssis'][ok][mask]))
+    if not cell_parts:
+        return RadioMap([], np.zeros(1, np.int64), np.zeros(0, np.int64), np.zeros(0), np.zeros(0), np.zeros(0),
+                        np.zeros(0, np.int64), rssi_floor, cell_size)
+
+    cell_keys = np.concatenate([part[0] for part in cell_parts])
+    cell_ids, scan_cell, cell_scans = np.unique(cell_keys, return_inverse=True, return_counts=True)
+    cell_lats = np.bincount(scan_cell, weights=np.concatenate([part[1] for part in cell_parts])) / cell_scans
+    cell_lons = np.bincount(scan_cell, weights=np.concatenate([part[2] for part in cell_parts])) / cell_scans
+    kept = cell_scans >= min_scans
+    renumber = np.cumsum(kept) - 1  # old cell index -> index among the kept cells
+
+    pair_cells = np.searchsorted(cell_ids, np.concatenate([part[0] for part in pair_parts]))
+    pair_bssids = np.concatenate([part[1] for part in pair_parts])
+    pair_rssis = np.concatenate([part[2] for part in pair_parts])
+    in_kept = kept[pair_cells]
+    pair_cells, pair_bssids, pair_rssis = renumber[pair_cells[in_kept]], pair_bssids[in_kept], pair_rssis[in_kept]
+
+    bssid_keys, pair_columns = np.unique(pair_bssids, return_inverse=True)
+    # One entry per (column, cell), sorted by column then cell: the compressed column layout
+    pair_index = pair_columns.astype(np.int64) * int(kept.sum()) + pair_cells
+    entries, entry_of_pair, counts = np.unique(pair_index, return_inverse=True, return_counts=True)
+    means = np.bincount(entry_of_pair, weights=pair_rssis) / counts
+    entry_columns = entries // int(kept.sum())
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(entry_columns, minlength=len(bssid_keys)))])
+    return RadioMap([format_bssid_key(key) for key in bssid_keys], indptr, entries % int(kept.sum()),
+                    np.maximum(means - rssi_floor, 0.0), cell_lats[kept], cell_lons[kept], cell_scans[kept],
+                    rssi_floor, cell_size)
+
+
+class RadioMapUpdater:
+    """Keeps a RadioMap of the last `window_days` days of scans, rebuilt every `interval` seconds.
+
+    Builds run in a background thread and replace `radio_map` in one assignment, so
+    `match` never waits for a build and always sees a complete index. `on_built()` is called
+    after each build, e.g. to drop the positions memoized from the previous map.
+
+    The map is built from our own estimates, so a match is only trusted when it agrees with
+    the fallback estimate of the scan: one more than `max_offset` meters away from it is
+    rejected and the fallback is used.
+    """
+
+    def __init__(self, db_pool, interval=3600.0, window_days=30.0, k=4, min_common=4, max_distance=6.0,
+                 max_offset=15.0, cell_size=10.0, min_scans=2, estimator_options=None, on_built=lambda: None):
+        self.db_pool = db_pool
+        self.interval = interval
+        self.window_days = window_days
+        self.k = k
+        self.min_common = min_common
+        self.max_distance = max_distance
+        self.max_offset = max_offset
+        self.cell_size = cell_size
+        self.min_scans = min_scans
+        self.estimator_options = estimator_options or {}
+        self.on_built = on_built
+        self.radio_map = None
+        self.built_at = None
+        self.build_seconds = None
+        self.matches = 0
+        self.misses = 0
+        self.rejected = 0
+        self._build_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def match(self, aps, fallback=None):
+        """Position of a scan from the current radio map, or None when it does not cover it.
+
+        fallback is the (lat, lon) estimated without the map, None when there is none.
+        """
+        radio_map = self.radio_map
+        estimate = radio_map.match(aps, self.k, self.min_common, self.max_distance) if radio_map is not None else None
+        if estimate is None:
+            self.misses += 1
+        elif fallback is not None and \
+                haversine_distances(fallback[0], fallback[1], estimate[0], estimate[1]) > self.max_offset:
+            self.rejected += 1
+            return None
+        else:
+            self.matches += 1
+        return estimate
+
+    def rebuild(self):
+        """Build the radio map now, in the calling thread. Returns its stats."""
+        with self._build_lock:
+            start = time.perf_counter()
+            until = datetime.datetime.now()
+            since = until - datetime.timedelta(days=self.window_days)
+            radio_map = build_radio_map(self.db_pool.connection(), since, until, self.cell_size, self.min_scans,
+                                        **self.estimator_options)
+            self.radio_map = radio_map
+            self.built_at = until
+            self.build_seconds = time.perf_counter() - start
+        self.on_built()
+        logging.info(f"Radio map built: {radio_map.stats()} in {self.build_seconds:.1f} s")
+        return radio_map.stats()
+
+    def start(self):
+        """Start the background rebuilds, the first one right away."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='radio-map', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.rebuild()
+            except Exception as e:
+                logging.exception(f"Radio map build failed: {e}")
+            self._stop.wait(self.interval)
+
+    def stats(self):
+        """Return the radio map size, build and match counters as a dict."""
+        stats = self.radio_map.stats() if self.radio_map is not None else {'cells': 0}
+        stats.update({
+            'built_at': self.built_at.isoformat(' ') if self.built_at is not None else None,
+            'build_seconds': self.build_seconds,
+            'matches': self.matches,
+            'misses': self.misses,
+            'rejected': self.rejected,
+            'window_days': self.window_days
+        })
+        return stats
@@ -0,0 +1,81 @@
+import argparse
+import datetime
+import os
+import sqlite3
+import numpy as np
+from dotenv import load_dotenv
+import estimator
+from observations import read_observations, locate
+
+# Load environment variables
+load_dotenv()
+
+DB_NAME = os.getenv('DB_FILENAME')
+if not DB_NAME:
+    print("DB_FILENAME not set in .env")
+
+# Same settings as the server, see app.py
+ESTIMATOR_ALGORITHM = os.getenv('ESTIMATOR_ALGORITHM', 'centroid')
+ESTIMATOR_TOP_K = int(os.getenv('ESTIMATOR_TOP_K', '0')) or None
+ESTIMATOR_TX_POWER = float(os.getenv('ESTIMATOR_TX_POWER', str(estimator.DEFAULT_TX_POWER_1M)))
+ESTIMATOR_PATH_LOSS_EXPONENT = float(os.getenv('ESTIMATOR_PATH_LOSS_EXPONENT', str(estimator.DEFAULT_PATH_LOSS_EXPONENT)))
+
+SQL_UPDATE_SCAN_ESTIMATE = 'UPDATE scans SET est_lat = ?, est_lon = ? WHERE id = ?'
+
+
+def reestimate(since, until, device_id=None, only_missing=False, dry_run=False, batch_size=50000, **options):
+    """Re-estimate the stored scans of a time range from their raw observations and the current ap_locations.
+
+    Returns the counters (scans read, estimated, updated, median move in meters of the
+    scans that already had an estimate).
+    """
+    reader = sqlite3.connect(DB_NAME)
+    writer = sqlite3.connect(DB_NAME)
+    read = estimated = updated = 0
+    moves = []
+    for batch in read_observations(reader, since, until, device_id, batch_size):
+        lats, lons, located = locate(reader, batch['bssids'], batch['mask'])
+        est_lat, est_lon = estimator.estimate_batch(lats, lons, batch['rssis'], located, **options)
+        ok = ~np.isnan(est_lat)
+        had = ok & ~np.isnan(batch['est_lat'])
+        if had.any():
+            x, y = estimator.to_enu(est_lat[had, None], est_lon[had, None], batch['est_lat'][had], batch['est_lon'][had])
+            moves.append(np.hypot(x[:, 0], y[:, 0]))
+        if only_missing:
+            ok &= np.isnan(batch['est_lat'])
+        read += len(batch['id'])
+        estimated += int((~np.isnan(est_lat)).sum())
+        if not dry_run and ok.any():
+            with writer:
+                writer.executemany(SQL_UPDATE_SCAN_ESTIMATE,
+                                   zip(est_lat[ok].tolist(), est_lon[ok].tolist(), batch['id'][ok].tolist()))
+            updated += int(ok.sum())
+    reader.close()
+    writer.close()
+    median_move = float(np.median(np.concatenate(moves))) if moves else 0.0
+    return {'read': read, 'estimated': estimated, 'updated': updated, 'median_move_m': median_move}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Re-estimate stored scans from their raw observations.')
+    parser.add_argument('--since', default='1970-01-01', help='ISO 8601 start, exclusive')
+    parser.add_argument('--until', default=None, help='ISO 8601 end, inclusive (default now)')
+    parser.add_argument('--device', help='only the scans of this tracker id')
+    parser.add_argument('--only-missing', action='store_true', help='only scans without an estimate yet')
+    parser.add_argument('--algorithm', choices=['centroid', 'trilateration'], default=ESTIMATOR_ALGORITHM)
+    parser.add_argument('--k', type=int, default=ESTIMATOR_TOP_K or 0, help='only use the k strongest APs, 0 = all')
+    parser.add_argument('--batch-size', type=int, default=50000, help='scans decoded per batch')
+    parser.add_argument('--dry-run', action='store_true', help='compare with the stored estimates without writing')
+    args = parser.parse_args()
+
+    since = datetime.datetime.fromisoformat(args.since)
+    until = datetime.datetime.fromisoformat(args.until) if args.until else datetime.datetime.now()
+    counters = reestimate(since, until, args.device and args.device.upper(), args.only_missing, args.dry_run,
+                          args.batch_size, algorithm=args.algorithm, k=args.k or None,
+                          tx_power=ESTIMATOR_TX_POWER, exponent=ESTIMATOR_PATH_LOSS_EXPONENT)
+    print(f"{counters['read']} scans read, {counters['estimated']} estimated, {counters['updated']} updated, "
+          f"median move of previously estimated scans {counters['median_move_m']:.1f} m")
+
+
+if __name__ == '__main__':
+    main()
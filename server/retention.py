@@ -0,0 +1,295 @@
+import argparse
+import datetime
+import logging
+import os
+import threading
+import time
+import numpy as np
+from dotenv import load_dotenv
+from db import ConnectionPool
+
+# Load environment variables
+load_dotenv()
+
+DB_NAME = os.getenv('DB_FILENAME')
+
+METERS_PER_DEGREE_LAT = 111194.0
+EPOCH = datetime.datetime(1970, 1, 1)
+
+# Oldest scans first, with the start of their summary interval computed by SQLite
+SQL_SELECT_EXPIRED = ("SELECT id, device_id, timestamp, datetime((CAST(strftime('%s', timestamp) AS INTEGER) / ?) * ?, "
+                      "'unixepoch'), est_lat, est_lon FROM scans WHERE timestamp < ? ORDER BY timestamp LIMIT ?")
+SQL_COUNT_EXPIRED = 'SELECT COUNT(*) FROM scans WHERE timestamp < ?'
+SQL_SELECT_SUMMARY = ('SELECT lat, lon, count, spread, first_seen, last_seen FROM scan_summaries '
+                      'WHERE device_id = ? AND bucket_start = ?')
+SQL_UPSERT_SUMMARY = ('INSERT INTO scan_summaries (device_id, bucket_start, bucket_seconds, lat, lon, count, spread, '
+                      'first_seen, last_seen) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(device_id, bucket_start) '
+                      'DO UPDATE SET lat = excluded.lat, lon = excluded.lon, count = excluded.count, '
+                      'spread = excluded.spread, first_seen = excluded.first_seen, last_seen = excluded.last_seen')
+SQL_DELETE_SCAN = 'DELETE FROM scans WHERE id = ?'
+SQL_DELETE_PENDING_APS = 'DELETE FROM scan_pending_aps WHERE scan_row = ?'
+
+
+def init_summary_table(conn):
+    """Create scan_summaries: per tracker and interval, the centroid, number and spread of the fixes aged out of scans."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS scan_summaries (
+            device_id TEXT,
+            bucket_start DATETIME,
+            bucket_seconds INTEGER,
+            lat REAL,
+            lon REAL,
+            count INTEGER,
+            spread REAL,
+            first_seen DATETIME,
+            last_seen DATETIME,
+            PRIMARY KEY (device_id, bucket_start)
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_scan_summaries_bucket ON scan_summaries (bucket_start)')
+
+
+def merge_summaries(a, b):
+    """Merge two (lat, lon, count, spread, first_seen, last_seen) summaries of the same interval.
+
+    spread is the RMS distance in meters of the fixes to their centroid, so the merged
+    spread adds the distance of each centroid to the merged one.
+    """
+    lat_a, lon_a, n_a, spread_a, first_a, last_a = a
+    lat_b, lon_b, n_b, spread_b, first_b, last_b = b
+    n = n_a + n_b
+    lat = (lat_a * n_a + lat_b * n_b) / n
+    lon = (lon_a * n_a + lon_b * n_b) / n
+    cos_lat = np.cos(np.radians(lat))
+    squared = 0.0
+    for c_lat, c_lon, c_n, c_spread in ((lat_a, lon_a, n_a, spread_a), (lat_b, lon_b, n_b, spread_b)):
+        dy = (c_lat - lat) * METERS_PER_DEGREE_LAT
+        dx = (c_lon - lon) * METERS_PER_DEGREE_LAT * cos_lat
+        squared += c_n * (c_spread * c_spread + dx * dx + dy * dy)
+    return lat, lon, n, float(np.sqrt(squared / n)), min(first_a, first_b), max(last_a, last_b)
+
+
+class ScanRetention:
+    """Ages out the scans older than `keep_days` days into the scan_summaries table.
+
+    Each run rolls the expired fixes of every tracker into one summary per `bucket_seconds`
+    interval (centroid, number of fixes, spread), then deletes the scans. It works by
+    transactions of `batch_size` scans, oldest first, taking the write lock before reading
+    them so that several worker processes never summarize the same scans twice. The freed
+    pages are then given back to the file system by incremental vacuum, `vacuum_pages` pages
+    per transaction, so that ingest never waits long behind the job.
+
+    Runs every `interval` seconds in a background thread, or once from the command line.
+    """
+
+    def __init__(self, db_pool, keep_days=90.0, interval=3600.0, bucket_seconds=900, batch_size=5000,
+                 vacuum_pages=1000):
+        self.db_pool = db_pool
+        self.keep_days = keep_days
+        self.interval = interval
+        self.bucket_seconds = int(bucket_seconds)
+        self.batch_size = batch_size
+        self.vacuum_pages = vacuum_pages
+        self.runs = 0
+        self.scans_deleted = 0
+        self.summaries_written = 0
+        self.pages_vacuumed = 0
+        self.last_run = None
+        self.last_seconds = None
+        self._warned_auto_vacuum = False
+        self._run_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def cutoff(self, now=None):
+        """Time before which scans are summarized: keep_days ago, rounded down to a summary interval."""
+        now = now or datetime.datetime.now()
+        seconds = (now - datetime.timedelta(days=self.keep_days) - EPOCH).total_seconds()
+        return EPOCH + datetime.timedelta(seconds=seconds - seconds % self.bucket_seconds)
+
+    def run(self, now=None):
+        """Summarize and delete the expired scans, then vacuum. Returns the counters of this run."""
+        with self._run_lock:
+            start = time.perf_counter()
+            conn = self.db_pool.connection()
+            cutoff = self.cutoff(now)
+            deleted = summaries = 0
+            while not self._stop.is_set():
+                batch_deleted, batch_summaries = self.compact_batch(conn, cutoff)
+                if not batch_deleted:
+                    break
+                deleted += batch_deleted
+                summaries += batch_summaries
+            vacuumed = self.vacuum(conn)
+            self.runs += 1
+            self.scans_deleted += deleted
+            self.summaries_written += summaries
+            self.pages_vacuumed += vacuumed
+            self.last_run = datetime.datetime.now()
+            self.last_seconds = time.perf_counter() - start
+        counters = {'cutoff': cutoff.isoformat(' '), 'scans_deleted': deleted, 'summaries_written': summaries,
+                    'pages_vacuumed': vacuumed, 'seconds': round(self.last_seconds, 3)}
+        logging.info(f"Scan retention: {counters}")
+        return counters
+
+    def compact_batch(self, conn, cutoff):
+        """Summarize and delete up to batch_size scans older than cutoff in one transaction.
+
+        Returns (scans deleted, summaries written).
+        """
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            rows = conn.execute(SQL_SELECT_EXPIRED, (self.bucket_seconds, self.bucket_seconds, cutoff,
+                                                     self.batch_size)).fetchall()
+            summaries = self.summarize([row for row in rows if row[4] is not None and row[5] is not None])
+            for key, summary in summaries.items():
+                current = conn.execute(SQL_SELECT_SUMMARY, key).fetchone()
+                if current is not None:
+                    # Interval already summarized by a previous batch, or a scan uploaded late
+                    summary = merge_summaries(current, summary)
+                conn.execute(SQL_UPSERT_SUMMARY, (*key, self.bucket_seconds, *summary))
+            ids = [(row[0],) for row in rows]
+            conn.executemany(SQL_DELETE_PENDING_APS, ids)
+            conn.executemany(SQL_DELETE_SCAN, ids)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        return len(rows), len(summaries)
+
+    @staticmethod
+    def summarize(rows):
+        """Group (id, device_id, timestamp, bucket_start, lat, lon) fixes per tracker and interval.
+
+        Returns {(device_id, bucket_start): (lat, lon, count, spread, first_seen, last_seen)}.
+        """
+        if not rows:
+            return {}
+        devices, device_codes = np.unique([row[1] or '' for row in rows], return_inverse=True)
+        buckets, bucket_codes = np.unique([row[3] for row in rows], return_inverse=True)
+        _, inverse, counts = np.unique(device_codes * len(buckets) + bucket_codes, return_inverse=True,
+                                       return_counts=True)
+        lats = np.array([row[4] for row in rows], dtype=float)
+        lons = np.array([row[5] for row in rows], dtype=float)
+        mean_lats = np.bincount(inverse, weights=lats) / counts
+        mean_lons = np.bincount(inverse, weights=lons) / counts
+        dy = (lats - mean_lats[inverse]) * METERS_PER_DEGREE_LAT
+        dx = (lons - mean_lons[inverse]) * METERS_PER_DEGREE_LAT * np.cos(np.radians(mean_lats[inverse]))
+        spreads = np.sqrt(np.bincount(inverse, weights=dx * dx + dy * dy) / counts)
+        # Rows come in time order: the first and last row of a group are its first and last fix
+        first = np.full(len(counts), len(rows))
+        np.minimum.at(first, inverse, np.arange(len(rows)))
+        last = np.zeros(len(counts), dtype=int)
+        np.maximum.at(last, inverse, np.arange(len(rows)))
+        return {(rows[first[g]][1], rows[first[g]][3]):
+                (float(mean_lats[g]), float(mean_lons[g]), int(counts[g]), float(spreads[g]),
+                 rows[first[g]][2], rows[last[g]][2])
+                for g in range(len(counts))}
+
+    def vacuum(self, conn):
+        """Release the free pages of the database file. Returns the number of pages released.
+
+        Only databases in incremental auto_vacuum mode can do it; the others keep their
+        free pages for new scans, see `retention.py --vacuum`.
+        """
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+            if not self._warned_auto_vacuum:
+                logging.warning("Database not in incremental auto_vacuum mode, run retention.py --vacuum once")
+                self._warned_auto_vacuum = True
+            return 0
+        released = 0
+        free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        while free and not self._stop.is_set():
+            # Each step is its own transaction, the rows must be read for the pages to be released
+            conn.execute(f'PRAGMA incremental_vacuum({min(free, self.vacuum_pages)})').fetchall()
+            remaining = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            if remaining >= free:
+                break
+            released += free - remaining
+            free = remaining
+        return released
+
+    def start(self):
+        """Start the background runs, the first one right away."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='scan-retention', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run()
+            except Exception as e:
+                logging.exception(f"Scan retention failed: {e}")
+            self._stop.wait(self.interval)
+
+    def stats(self):
+        """Return the retention settings, counters and database size as a dict."""
+        conn = self.db_pool.connection()
+        page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+        return {
+            'keep_days': self.keep_days,
+            'bucket_seconds': self.bucket_seconds,
+            'cutoff': self.cutoff().isoformat(' '),
+            'summaries': conn.execute('SELECT COUNT(*) FROM scan_summaries').fetchone()[0],
+            'runs': self.runs,
+            'scans_deleted': self.scans_deleted,
+            'summaries_written': self.summaries_written,
+            'pages_vacuumed': self.pages_vacuumed,
+            'last_run': self.last_run.isoformat(' ') if self.last_run is not None else None,
+            'last_seconds': self.last_seconds,
+            'file_bytes': conn.execute('PRAGMA page_count').fetchone()[0] * page_size,
+            'free_bytes': conn.execute('PRAGMA freelist_count').fetchone()[0] * page_size,
+            'incremental_vacuum': conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarize and delete old scans, then compact the database.')
+    parser.add_argument('--db', default=DB_NAME, help='SQLite database (default DB_FILENAME)')
+    parser.add_argument('--keep-days', type=float, default=float(os.getenv('SCAN_RETENTION_DAYS', '0')) or None,
+                        help='days of full resolution scans kept (default SCAN_RETENTION_DAYS)')
+    parser.add_argument('--bucket-seconds', type=int, default=int(os.getenv('SCAN_SUMMARY_INTERVAL', '900')),
+                        help='length of a summary interval (default SCAN_SUMMARY_INTERVAL)')
+    parser.add_argument('--batch-size', type=int, default=int(os.getenv('SCAN_RETENTION_BATCH', '5000')),
+                        help='scans summarized and deleted per transaction')
+    parser.add_argument('--dry-run', action='store_true', help='only count the scans that would be summarized')
+    parser.add_argument('--vacuum', action='store_true',
+                        help='switch the database to incremental auto_vacuum with a full VACUUM, server stopped')
+    args = parser.parse_args()
+    if not args.db:
+        parser.error('DB_FILENAME not set in .env and no --db given')
+    if args.keep_days is None and not args.vacuum:
+        parser.error('SCAN_RETENTION_DAYS not set in .env and no --keep-days given')
+
+    pool = ConnectionPool(args.db)
+    conn = pool.connection()
+    if args.keep_days is not None:
+        retention = ScanRetention(pool, args.keep_days, bucket_seconds=args.bucket_seconds, batch_size=args.batch_size)
+        cutoff = retention.cutoff()
+        if args.dry_run:
+            count = conn.execute(SQL_COUNT_EXPIRED, (cutoff,)).fetchone()[0]
+            print(f"{count} scans older than {cutoff} would be summarized and deleted")
+        else:
+            init_summary_table(conn)
+            conn.commit()
+            counters = retention.run()
+            print(f"{counters['scans_deleted']} scans older than {counters['cutoff']} deleted, "
+                  f"{counters['summaries_written']} summaries written, {counters['pages_vacuumed']} pages released")
+    if args.vacuum and not args.dry_run:
+        before = os.path.getsize(args.db)
+        conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        conn.execute('VACUUM')
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        print(f"{args.db} vacuumed: {before} -> {os.path.getsize(args.db)} bytes, incremental auto_vacuum on")
+    pool.close_all()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+import logging
+import threading
+import time
+
+
+class ScanWriter:
+    """Write-behind buffer of estimated scans, flushed by a background thread with group commit.
+
+    `submit(scans)` only appends to an in-memory buffer. The flusher writes everything
+    buffered in one transaction every `flush_interval` seconds, or as soon as `flush_rows`
+    scans are waiting, with `write(conn, scans)`, then calls `on_flushed(scans, written)` with
+    the value returned by write once they are committed. A crash loses at most `max_rows`
+    scans, or `flush_interval` seconds of scans: when the buffer is full, submit blocks until
+    the flusher caught up.
+
+    A batch whose write fails is kept apart and retried on its own at the next flushes, so
+    the scans buffered after it are still written. After `max_attempts` failed writes it is
+    dropped and the number of scans lost is logged.
+    """
+
+    def __init__(self, db_pool, write, on_flushed=lambda scans, written: None,
+                 flush_interval=0.2, flush_rows=500, max_rows=5000, max_attempts=3):
+        self.db_pool = db_pool
+        self.write = write
+        self.on_flushed = on_flushed
+        self.flush_interval = flush_interval
+        self.flush_rows = flush_rows
+        self.max_rows = max_rows
+        self.max_attempts = max_attempts
+        self._buffer = []
+        self._failed = []  # (scans, failed attempts) of the batches to retry
+        self._writing = 0  # scans taken by a flush that is not committed yet
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()  # one flush at a time, so scans are committed in order
+        self._stop = False
+        self._thread = None
+        self.flushes = 0
+        self.rows_written = 0
+        self.blocked = 0
+        self.errors = 0
+        self.dropped = 0
+
+    def submit(self, scans):
+        """Buffer scan tuples (see store_scans in app.py) for the next flush."""
+        if not scans:
+            return
+        with self._cond:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop = False
+                self._thread = threading.Thread(target=self._run, name='scan-writer', daemon=True)
+                self._thread.start()
+            if self._unsaved() >= self.max_rows:
+                self.blocked += 1
+                self._cond.notify_all()
+                self._cond.wait_for(lambda: self._unsaved() < self.max_rows or self._stop)
+            self._buffer.extend(scans)
+            if len(self._buffer) >= self.flush_rows:
+                self._cond.notify_all()
+
+    def _unsaved(self):
+        return len(self._buffer) + sum(len(scans) for scans, _ in self._failed) + self._writing
+
+    def flush(self):
+        """Write what is buffered now, and the batches to retry, in the calling thread.
+
+        Returns the number of scans written.
+        """
+        with self._flush_lock:
+            with self._cond:
+                batches, self._failed = self._failed, []
+                if self._buffer:
+                    batches.append((self._buffer, 0))
+                    self._buffer = []
+                self._writing = sum(len(scans) for scans, _ in batches)
+            committed = []
+            try:
+                for scans, attempts in batches:
+                    written = self._write(scans, attempts)
+                    if written is not None:
+                        committed.append((scans, written))
+            finally:
+                with self._cond:
+                    self._writing = 0
+                    self._cond.notify_all()
+        for scans, written in committed:
+            self.on_flushed(scans, written)
+        return sum(len(scans) for scans, _ in committed)
+
+    def _write(self, scans, attempts):
+        """Commit one batch. Returns the value of write, or None when the batch failed."""
+        conn = self.db_pool.connection()
+        try:
+            with conn:
+                written = self.write(conn, scans)
+        except Exception as e:
+            self.errors += 1
+            attempts += 1
+            if attempts >= self.max_attempts:
+                self.dropped += len(scans)
+                logging.exception(f"Scan writer: dropped {len(scans)} scans after {attempts} failed flushes: {e}")
+            else:
+                logging.exception(f"Scan writer: flush of {len(scans)} scans failed ({attempts}/{self.max_attempts}): {e}")
+                with self._cond:
+                    self._failed.append((scans, attempts))
+            return None
+        self.flushes += 1
+        self.rows_written += len(scans)
+        return written
+
+    def stop(self, timeout=None):
+        """Flush the buffer and stop the flusher thread."""
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.flush()
+
+    def _run(self):
+        logging.info("Scan writer started")
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.flush_interval
+                while not self._stop and len(self._buffer) < self.flush_rows:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if self._stop:
+                    break
+            try:
+                self.flush()
+            except Exception as e:
+                logging.exception(f"Scan writer error: {e}")
+        logging.info("Scan writer stopped")
+
+    def stats(self):
+        """Return the writer counters as a dict."""
+        with self._cond:
+            buffered = len(self._buffer)
+            retrying = sum(len(scans) for scans, _ in self._failed)
+        return {
+            'buffered': buffered,
+            'retrying': retrying,
+            'flushes': self.flushes,
+            'rows_written': self.rows_written,
+            'blocked': self.blocked,
+            'errors': self.errors,
+            'dropped': self.dropped,
+            'flush_interval': self.flush_interval,
+            'max_rows': self.max_rows
+        }
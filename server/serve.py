@@ -0,0 +1,155 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import aiosqlite
+import uvicorn
+from a2wsgi import WSGIMiddleware
+from urllib.parse import parse_qs
+from dotenv import load_dotenv
+from db import SQLITE_BUSY_TIMEOUT
+import app as tracker
+
+# Production entry point: the tracking server as an ASGI application under uvicorn.
+# Live map streams are served natively on the event loop, reading through aiosqlite; the
+# other routes run in the Flask app, with its sqlite3 and WiGLE calls, on a bounded thread
+# pool, so a slow request only holds one of its threads.
+#
+# Run a single worker process. Every worker starts the background jobs of app.init_app:
+# the WiGLE queue, scan retention and radio map rebuilds. With several workers each one
+# would drain the queue with its own budget and repeat the retention and rebuild work.
+
+# Load environment variables
+load_dotenv()
+
+SERVE_HOST = os.getenv('SERVE_HOST', '127.0.0.1')
+SERVE_PORT = int(os.getenv('SERVE_PORT', '4201'))
+SERVE_WORKERS = int(os.getenv('SERVE_WORKERS', '1'))  # processes, see above before raising it
+SERVE_THREADS = int(os.getenv('SERVE_THREADS', '32'))  # Flask request threads per process
+SERVE_GRACEFUL_TIMEOUT = float(os.getenv('SERVE_GRACEFUL_TIMEOUT', '10'))  # seconds given to requests on shutdown
+
+SSE_HEADERS = [(b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache'), (b'x-accel-buffering', b'no')]
+
+wsgi = WSGIMiddleware(tracker.app, workers=SERVE_THREADS)
+stream_db = None  # per-worker aiosqlite connection shared by the live map streams
+
+
+async def lifespan(receive, send):
+    """Initialize config and schema when the worker starts, stop its background work when it exits."""
+    global stream_db
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            try:
+                await asyncio.to_thread(tracker.init_app)
+                stream_db = await aiosqlite.connect(tracker.DB_NAME, timeout=SQLITE_BUSY_TIMEOUT)
+                await stream_db.execute('PRAGMA journal_mode=WAL')
+            except Exception as e:
+                logging.exception("Worker startup failed")
+                await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                return
+            logging.info(f"Worker {os.getpid()} started")
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if stream_db is not None:
+                await stream_db.close()
+            await asyncio.to_thread(tracker.shutdown_app)
+            logging.info(f"Worker {os.getpid()} stopped")
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def wait_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def stream_points(scope, receive, send):
+    """Async /api/stream: the same 'fix' events as the Flask route, without holding a thread per viewer."""
+    headers = dict(scope['headers'])
+    query = parse_qs(scope['query_string'].decode('latin-1'))
+    device = query.get('device', [None])[0]
+    device = tracker.normalize_device_id(device) if device else None
+    last_id = None
+    for value in (headers.get(b'last-event-id'), query.get('since', [None])[0]):
+        try:
+            last_id = int(value)
+            break
+        except (TypeError, ValueError):
+            continue
+    if last_id is None:
+        async with stream_db.execute(tracker.SQL_SELECT_MAX_SCAN_ID) as cursor:
+            last_id = (await cursor.fetchone())[0]
+
+    loop = asyncio.get_running_loop()
+    published = asyncio.Event()
+
+    def listener():
+        loop.call_soon_threadsafe(published.set)
+
+    tracker.scan_feed.subscribe(listener)
+    disconnected = asyncio.ensure_future(wait_disconnect(receive))
+    seq = tracker.scan_feed.seq
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': SSE_HEADERS})
+        await send({'type': 'http.response.body', 'body': b'retry: 5000\n\n', 'more_body': True})
+        while not disconnected.done():
+            woken = asyncio.ensure_future(published.wait())
+            await asyncio.wait([woken, disconnected], timeout=tracker.LIVE_POLL_INTERVAL,
+                               return_when=asyncio.FIRST_COMPLETED)
+            woken.cancel()
+            if disconnected.done():
+                break
+            published.clear()
+            seq, updated = tracker.scan_feed.wait(seq, 0)
+            async with stream_db.execute(tracker.SQL_SELECT_SCANS_AFTER_ID, (last_id,)) as cursor:
+                rows = list(await cursor.fetchall())
+            updated = [scan_row for scan_row in updated if scan_row <= last_id]
+            if updated:
+                sql = tracker.SQL_SELECT_SCANS_BY_ID.format(','.join('?' * len(updated)))
+                async with stream_db.execute(sql, updated) as cursor:
+                    rows = list(await cursor.fetchall()) + rows
+            events = []
+            for scan_row, est_lat, est_lon, timestamp, device_id in rows:
+                last_id = max(last_id, scan_row)
+                if est_lat is not None and device in (None, device_id):
+                    events.append(f'id: {last_id}\nevent: fix\n'
+                                  f'data: {json.dumps([est_lat, est_lon, timestamp, device_id])}\n\n')
+            # Keeps proxies from closing the connection
+            body = ''.join(events) or ': keepalive\n\n'
+            await send({'type': 'http.response.body', 'body': body.encode(), 'more_body': True})
+    except OSError:
+        pass  # client went away while we were writing
+    finally:
+        tracker.scan_feed.unsubscribe(listener)
+        disconnected.cancel()
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+    elif scope['type'] == 'http' and scope['path'] == '/api/stream' and scope['method'] == 'GET':
+        await stream_points(scope, receive, send)
+    else:
+        await wsgi(scope, receive, send)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the tracking server in production.')
+    parser.add_argument('--host', default=SERVE_HOST)
+    parser.add_argument('--port', type=int, default=SERVE_PORT)
+    parser.add_argument('--workers', type=int, default=SERVE_WORKERS, help='worker processes')
+    args = parser.parse_args()
+    if args.workers > 1:
+        logging.warning(f"{args.workers} workers each run the WiGLE queue, retention and radio map jobs")
+    # On SIGTERM/SIGINT uvicorn stops accepting, lets requests finish for SERVE_GRACEFUL_TIMEOUT
+    # seconds (live streams are cut then, browsers reconnect with Last-Event-ID) and runs the
+    # lifespan shutdown of every worker.
+    uvicorn.run('serve:application', host=args.host, port=args.port, workers=args.workers,
+                lifespan='on', timeout_graceful_shutdown=SERVE_GRACEFUL_TIMEOUT,
+                proxy_headers=True)
+
+
+if __name__ == '__main__':
+    main()
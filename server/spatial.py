@@ -0,0 +1,93 @@
+import math
+import numpy as np
+
+EARTH_RADIUS = 6371000.0  # meters
+METERS_PER_DEGREE_LAT = 111194.0
+
+
+def init_spatial_index(conn):
+    """Create the R*Tree index of ap_locations and the triggers that keep it in sync.
+
+    The index is keyed by the ap_locations rowid, so rows must be updated in place
+    (INSERT ... ON CONFLICT DO UPDATE) rather than replaced, which would change the rowid.
+    """
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS ap_locations_rtree USING rtree(
+            id, min_lat, max_lat, min_lon, max_lon
+        )
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS ap_locations_rtree_insert AFTER INSERT ON ap_locations
+        WHEN new.lat IS NOT NULL AND new.lon IS NOT NULL
+        BEGIN
+            INSERT OR REPLACE INTO ap_locations_rtree VALUES (new.rowid, new.lat, new.lat, new.lon, new.lon);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS ap_locations_rtree_update AFTER UPDATE OF lat, lon ON ap_locations
+        BEGIN
+            DELETE FROM ap_locations_rtree WHERE id = old.rowid;
+            INSERT INTO ap_locations_rtree SELECT new.rowid, new.lat, new.lat, new.lon, new.lon
+                WHERE new.lat IS NOT NULL AND new.lon IS NOT NULL;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS ap_locations_rtree_delete AFTER DELETE ON ap_locations
+        BEGIN
+            DELETE FROM ap_locations_rtree WHERE id = old.rowid;
+        END
+    ''')
+    # Index rows stored before the R*Tree existed
+    conn.execute('''
+        INSERT INTO ap_locations_rtree
+        SELECT rowid, lat, lat, lon, lon FROM ap_locations
+        WHERE lat IS NOT NULL AND lon IS NOT NULL
+          AND rowid NOT IN (SELECT id FROM ap_locations_rtree)
+    ''')
+
+
+def bounding_box(lat, lon, radius_m):
+    """Return (min_lat, max_lat, min_lon, max_lon) of a square around a point."""
+    lat_delta = radius_m / METERS_PER_DEGREE_LAT
+    lon_delta = radius_m / (METERS_PER_DEGREE_LAT * max(math.cos(math.radians(lat)), 1e-6))
+    return lat - lat_delta, lat + lat_delta, lon - lon_delta, lon + lon_delta
+
+
+def haversine_distances(lat, lon, lats, lons):
+    """Distances in meters from one point to arrays of points."""
+    phi1 = np.radians(lat)
+    phi2 = np.radians(lats)
+    a = (np.sin((phi2 - phi1) / 2) ** 2
+         + np.cos(phi1) * np.cos(phi2) * np.sin(np.radians(np.asarray(lons) - lon) / 2) ** 2)
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(a))
+
+
+def aps_in_bbox(conn, min_lat, max_lat, min_lon, max_lon):
+    """Return (bssid, lat, lon) of every AP inside a bounding box."""
+    # The R*Tree stores 32 bit floats rounded outwards, so the exact test is redone on ap_locations
+    return conn.execute('''
+        SELECT a.bssid, a.lat, a.lon FROM ap_locations_rtree r
+        JOIN ap_locations a ON a.rowid = r.id
+        WHERE r.max_lat >= ? AND r.min_lat <= ? AND r.max_lon >= ? AND r.min_lon <= ?
+          AND a.lat BETWEEN ? AND ? AND a.lon BETWEEN ? AND ?
+    ''', (min_lat, max_lat, min_lon, max_lon, min_lat, max_lat, min_lon, max_lon)).fetchall()
+
+
+def aps_within(conn, lat, lon, radius_m):
+    """Return (bssid, lat, lon, distance) of the APs within radius_m of a point, nearest first."""
+    rows = aps_in_bbox(conn, *bounding_box(lat, lon, radius_m))
+    if not rows:
+        return []
+    distances = haversine_distances(lat, lon, [r[1] for r in rows], [r[2] for r in rows])
+    order = np.argsort(distances)
+    return [(rows[i][0], rows[i][1], rows[i][2], float(distances[i])) for i in order if distances[i] <= radius_m]
+
+
+def nearest_aps(conn, lat, lon, k=10, start_radius=100.0, max_radius=50000.0):
+    """Return the k nearest APs as (bssid, lat, lon, distance), growing the search box as needed."""
+    radius = start_radius
+    while True:
+        found = aps_within(conn, lat, lon, radius)
+        if len(found) >= k or radius >= max_radius:
+            return found[:k]
+        radius *= 4
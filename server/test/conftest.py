@@ -0,0 +1,13 @@
+import os
+import sys
+import tempfile
+
+# The server modules live in the parent directory and read their settings from the
+# environment when imported: point them at a throwaway database and an unreachable WiGLE.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_tmp = tempfile.mkdtemp(prefix='petwifi-test-')
+os.environ.setdefault('DB_FILENAME', os.path.join(_tmp, 'test.db'))
+os.environ.setdefault('WIGLE_API_URL', 'http://127.0.0.1:9/api/v2/network/search')
+os.environ.setdefault('WIGLE_QUOTA_DB', os.path.join(_tmp, 'wigle_quota.db'))
+os.environ.setdefault('WIGLE_CACHE_DIR', '')
+os.environ.setdefault('WIGLE_RETRIES', '0')
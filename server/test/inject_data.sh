@@ -4,7 +4,9 @@
 DATASET_FILE="test_dataset.json"
 
 # Flask server endpoint
-ENDPOINT="http://127.0.0.1:5000/api/scan"
+SERVER="${SERVER:-http://127.0.0.1:4201}"
+ENDPOINT="$SERVER/api/scan"
+BULK_ENDPOINT="$SERVER/api/scans"
 
 # Check if the dataset file exists
 if [ ! -f "$DATASET_FILE" ]; then
@@ -18,6 +20,13 @@ if ! command -v jq &> /dev/null; then
     exit 1
 fi
 
+# --bulk: replay the whole dataset in one request as NDJSON
+if [ "$1" == "--bulk" ]; then
+    echo "Sending $(jq length "$DATASET_FILE") scans in one bulk request"
+    jq -c '.[]' "$DATASET_FILE" | curl -s -X POST -H "Content-Type: application/x-ndjson" --data-binary @- "$BULK_ENDPOINT"
+    exit $?
+fi
+
 # Read the dataset and send each scan
 while IFS= read -r line; do
     # Skip empty lines
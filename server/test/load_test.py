@@ -0,0 +1,158 @@
+import argparse
+import asyncio
+import json
+import time
+from urllib.parse import urlencode, urlsplit
+
+# Replays a dataset against the server with many concurrent trackers and reports
+# throughput and latency percentiles, first with cold caches then with hot ones.
+# Stdlib only: a minimal HTTP/1.1 client on asyncio streams, one connection per tracker.
+
+FIRST_DEVICE_ID = 0x54705810  # CAT_UID of packet.h, the next trackers count up from it
+
+
+class Connection:
+    """Keep-alive HTTP/1.1 connection to the server."""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def request(self, method, path, body=None, content_type='application/json'):
+        """Send one request and return (status, body bytes). Reconnects when the server closed the connection."""
+        for attempt in range(2):
+            if self.writer is None:
+                self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+            headers = f'{method} {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n'
+            if body is not None:
+                headers += f'Content-Type: {content_type}\r\nContent-Length: {len(body)}\r\n'
+            self.writer.write(headers.encode() + b'\r\n' + (body or b''))
+            try:
+                await self.writer.drain()
+                status_line = await self.reader.readline()
+                if not status_line:
+                    raise ConnectionResetError('connection closed')
+                status = int(status_line.split()[1])
+                length = None
+                close = status_line.startswith(b'HTTP/1.0')
+                while True:
+                    line = await self.reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    name = name.strip().lower()
+                    if name == 'content-length':
+                        length = int(value)
+                    elif name == 'connection':
+                        close = value.strip().lower() == 'close'
+                data = await self.reader.readexactly(length) if length is not None else await self.reader.read()
+                if close or length is None:
+                    self.close()
+                return status, data
+            except (ConnectionError, asyncio.IncompleteReadError):
+                self.close()
+                if attempt:
+                    raise
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+def track_path(scan, device_id):
+    """GET /api/track query string the way the firmware builds it, trailing commas included."""
+    params = [('scan_id', f"{scan['scan_id']},"), ('uid', f"{device_id},")]
+    for ap in scan['aps']:
+        params.append(('bssid[]', f"{ap['bssid']},"))
+        params.append(('rssi[]', f"{ap['rssi']},"))
+    return '/api/track?' + urlencode(params)
+
+
+async def tracker(conn, device_id, scans, endpoint, latencies, errors):
+    """Post the scans of one tracker one after the other, recording each latency."""
+    for scan in scans:
+        start = time.perf_counter()
+        try:
+            if endpoint == 'track':
+                status, _ = await conn.request('GET', track_path(scan, device_id))
+            else:
+                body = json.dumps({'scan_id': scan['scan_id'], 'aps': scan['aps'], 'device_id': device_id}).encode()
+                status, _ = await conn.request('POST', '/api/scan', body)
+        except (OSError, asyncio.IncompleteReadError):
+            status = 0
+        latencies.append(time.perf_counter() - start)
+        if status != 200:
+            errors.append(status)
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(p / 100 * len(sorted_values)))]
+
+
+async def run(host, port, scans, concurrency, endpoint, devices):
+    """Split the scans over concurrency trackers, with devices distinct ids, and return the run statistics."""
+    latencies = []
+    errors = []
+    conns = [Connection(host, port) for _ in range(concurrency)]
+    start = time.perf_counter()
+    await asyncio.gather(*(tracker(conn, f'{FIRST_DEVICE_ID + i % devices:08X}', scans[i::concurrency],
+                                   endpoint, latencies, errors)
+                           for i, conn in enumerate(conns)))
+    elapsed = time.perf_counter() - start
+    for conn in conns:
+        conn.close()
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+        'max_ms': round(latencies[-1] * 1000, 1) if latencies else 0.0
+    }
+
+
+async def main(args):
+    url = urlsplit(args.server)
+    host, port = url.hostname, url.port or 80
+    with open(args.dataset) as f:
+        scans = json.load(f)
+    if args.scans:
+        scans = scans[:args.scans]
+    admin = Connection(host, port)
+
+    results = {}
+    for phase in ('cold', 'hot'):
+        if phase == 'cold':
+            # Empty the location and fingerprint caches, the database still answers known APs
+            await admin.request('DELETE', '/api/cache')
+        results[phase] = await run(host, port, scans, args.concurrency, args.endpoint, args.devices)
+        print(f"{phase:4}: {json.dumps(results[phase])}")
+    status, body = await admin.request('GET', '/api/cache')
+    if status == 200:
+        results['cache'] = json.loads(body)
+        print(f"cache: {body.decode()}")
+    admin.close()
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Concurrent load test of the scan endpoints.')
+    parser.add_argument('--server', default='http://127.0.0.1:4201')
+    parser.add_argument('--dataset', default='synthetic_dataset.json', help='scans from synthetic_dataset.py or create_dataset.py')
+    parser.add_argument('--scans', type=int, default=0, help='only replay the first scans, 0 = all')
+    parser.add_argument('--concurrency', type=int, default=50, help='simultaneous trackers')
+    parser.add_argument('--endpoint', choices=['scan', 'track'], default='scan',
+                        help='POST /api/scan, or GET /api/track like the firmware')
+    parser.add_argument('--devices', type=int, default=1, help='distinct tracker ids among the trackers')
+    parser.add_argument('--output', help='also save the results as JSON')
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,88 @@
+import argparse
+import json
+import math
+import random
+import numpy as np
+
+# Synthetic AP field and pet trajectory, no network access needed
+CENTER_LAT = 48.72868
+CENTER_LON = 2.22195
+RADIUS_M = 500
+METERS_PER_DEGREE_LAT = 111194.0
+
+# Log-distance path-loss model used to synthesize RSSI
+TX_POWER_1M = -40.0  # dBm
+PATH_LOSS_EXPONENT = 3.0
+RSSI_NOISE = 4.0  # dB standard deviation
+MIN_RSSI = -95  # weaker APs are not heard
+APS_PER_SCAN = 5  # MAX_APS_IN_PACKET on the tracker
+
+
+def random_bssid(rng):
+    """Random locally administered unicast MAC address."""
+    octets = [rng.randrange(256) for _ in range(6)]
+    octets[0] = (octets[0] | 0x02) & 0xFE
+    return ':'.join(f'{b:02X}' for b in octets)
+
+
+def generate_aps(count, rng, center_lat=CENTER_LAT, center_lon=CENTER_LON, radius_m=RADIUS_M):
+    """Scatter count APs uniformly over a disc, in the WiGLE result format (netid, trilat, trilong)."""
+    meters_per_degree_lon = METERS_PER_DEGREE_LAT * math.cos(math.radians(center_lat))
+    aps = []
+    for _ in range(count):
+        r = radius_m * math.sqrt(rng.random())
+        theta = rng.random() * 2 * math.pi
+        aps.append({
+            'netid': random_bssid(rng),
+            'trilat': center_lat + r * math.sin(theta) / METERS_PER_DEGREE_LAT,
+            'trilong': center_lon + r * math.cos(theta) / meters_per_degree_lon,
+            'lastupdt': '2025-01-01T00:00:00.000Z',
+            'channel': rng.choice([1, 6, 11, 36, 40, 44, 48])
+        })
+    return aps
+
+
+def generate_scans(aps, count, rng, step_m=15.0, center_lat=CENTER_LAT, center_lon=CENTER_LON, radius_m=RADIUS_M):
+    """Random-walk a pet inside the disc and synthesize one scan of the strongest APs per step."""
+    meters_per_degree_lon = METERS_PER_DEGREE_LAT * math.cos(math.radians(center_lat))
+    ap_x = np.array([(ap['trilong'] - center_lon) * meters_per_degree_lon for ap in aps])
+    ap_y = np.array([(ap['trilat'] - center_lat) * METERS_PER_DEGREE_LAT for ap in aps])
+    noise = np.random.default_rng(rng.randrange(2 ** 32))
+    x = y = 0.0
+    scans = []
+    for scan_id in range(1, count + 1):
+        # Pets mostly sleep: stay put half of the time
+        if rng.random() < 0.5:
+            x += rng.gauss(0, step_m)
+            y += rng.gauss(0, step_m)
+            if math.hypot(x, y) > radius_m:
+                x, y = x * 0.9, y * 0.9
+        d = np.maximum(np.hypot(ap_x - x, ap_y - y), 1.0)
+        rssi = TX_POWER_1M - 10 * PATH_LOSS_EXPONENT * np.log10(d) + noise.normal(0, RSSI_NOISE, len(aps))
+        strongest = [i for i in np.argsort(-rssi)[:APS_PER_SCAN] if rssi[i] >= MIN_RSSI]
+        scans.append({
+            'scan_id': scan_id,
+            'aps': [{'bssid': aps[i]['netid'], 'rssi': int(round(rssi[i]))} for i in strongest],
+            'true_lat': center_lat + y / METERS_PER_DEGREE_LAT,
+            'true_lon': center_lon + x / meters_per_degree_lon
+        })
+    return scans
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a synthetic AP field and scan dataset.')
+    parser.add_argument('--aps', type=int, default=300, help='number of APs in the field')
+    parser.add_argument('--scans', type=int, default=1000, help='number of scans')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--aps-file', default='synthetic_aps.json', help='AP field, input of wigle_stub.py')
+    parser.add_argument('--scans-file', default='synthetic_dataset.json', help='scans, same format as test_dataset.json')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    aps = generate_aps(args.aps, rng)
+    scans = generate_scans(aps, args.scans, rng)
+    with open(args.aps_file, 'w') as f:
+        json.dump(aps, f)
+    with open(args.scans_file, 'w') as f:
+        json.dump(scans, f)
+    print(f"{len(aps)} APs saved to {args.aps_file}, {len(scans)} scans saved to {args.scans_file}")
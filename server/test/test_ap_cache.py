@@ -0,0 +1,33 @@
+from ap_cache import LocationCache, normalize_bssid
+
+FOUND = {'lat': 48.70, 'lon': 2.20, 'error': None}
+UNKNOWN = {'lat': None, 'lon': None, 'error': 'WiGLE returned no location data'}
+
+
+def test_keys_are_normalized():
+    cache = LocationCache()
+    cache.put(' aa-bb-cc-00-00-01 ', FOUND)
+    assert normalize_bssid('aa-bb-cc-00-00-01') == 'AA:BB:CC:00:00:01'
+    assert cache.get('AA:BB:CC:00:00:01') is FOUND
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = LocationCache(maxsize=2)
+    cache.put('AA:BB:CC:00:00:01', FOUND)
+    cache.put('AA:BB:CC:00:00:02', FOUND)
+    cache.get('AA:BB:CC:00:00:01')
+    cache.put('AA:BB:CC:00:00:03', FOUND)
+    assert cache.get('AA:BB:CC:00:00:02') is None
+    assert cache.get('AA:BB:CC:00:00:01') is FOUND
+    assert cache.stats()['evictions'] == 1
+
+
+def test_negative_entries_expire_on_their_own_ttl():
+    cache = LocationCache(ttl=3600.0, negative_ttl=-1.0)
+    cache.put('AA:BB:CC:00:00:01', FOUND)
+    cache.put('AA:BB:CC:00:00:02', UNKNOWN)
+    assert cache.get('AA:BB:CC:00:00:02') is None
+    assert cache.get('AA:BB:CC:00:00:01') is FOUND
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['expirations']) == (1, 1, 1)
+    assert cache.invalidate() == 1
@@ -0,0 +1,39 @@
+import app as tracker
+from ap_learning import SQL_UPSERT_LOCATION
+
+
+def test_wigle_answer_relabels_a_learned_position():
+    tracker.init_db()
+    conn = tracker.db_pool.connection()
+    with conn:
+        conn.execute(SQL_UPSERT_LOCATION, ('AA:BB:CC:00:00:21', 48.70, 2.20))
+        conn.execute(tracker.SQL_INSERT_AP_LOCATION, ('AA:BB:CC:00:00:21', 48.71, 2.21))
+    row = conn.execute("SELECT lat, lon, source FROM ap_locations WHERE bssid = 'AA:BB:CC:00:00:21'").fetchone()
+    assert row == (48.71, 2.21, 'wigle')
+
+
+def learning_scans():
+    aps = [{'bssid': f'AA:BB:CC:00:00:3{n}', 'rssi': -40} for n in range(4)]
+    return [('AAAA0001', i, tracker.datetime.datetime.now(), (48.70 + i * 0.0005, 2.20), aps, [], tracker.NO_LINK_METRICS)
+            for i in range(4)]
+
+
+def test_learned_positions_are_cached_only_once_committed():
+    assert tracker.ap_learner is not None
+    tracker.init_db()
+    conn = tracker.db_pool.connection()
+    with conn:
+        conn.executemany(tracker.SQL_INSERT_AP_LOCATION, [(f'AA:BB:CC:00:00:3{n}', 48.70, 2.20) for n in range(3)])
+    tracker.ap_cache.invalidate()
+
+    try:
+        with conn:
+            assert tracker.store_scans(conn, learning_scans())
+            raise RuntimeError('flush failed')
+    except RuntimeError:
+        pass
+    assert tracker.ap_cache.get('AA:BB:CC:00:00:33') is None
+    assert conn.execute("SELECT 1 FROM ap_locations WHERE bssid = 'AA:BB:CC:00:00:33'").fetchone() is None
+
+    tracker.persist_scans(learning_scans())
+    assert tracker.ap_cache.get('AA:BB:CC:00:00:33')['lat'] is not None
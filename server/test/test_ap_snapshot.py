@@ -0,0 +1,36 @@
+import time
+import app as tracker
+from ap_learning import SQL_UPSERT_LOCATION
+from ap_snapshot import APSnapshot, write_snapshot
+
+
+def make_snapshot(tmp_path):
+    tracker.init_db()
+    conn = tracker.db_pool.connection()
+    with conn:
+        conn.execute('DELETE FROM ap_locations')
+        conn.executemany(tracker.SQL_INSERT_AP_LOCATION, [('AA:BB:CC:00:00:51', 48.70, 2.20),
+                                                          ('AA:BB:CC:00:00:52', 48.71, 2.21)])
+    path = str(tmp_path / 'ap_locations.snap')
+    write_snapshot(conn, path)
+    return APSnapshot(path, check_interval=0.0, db_pool=tracker.db_pool)
+
+
+def test_lookup_many_skips_keys_that_are_not_48_bit(tmp_path):
+    snapshot = make_snapshot(tmp_path)
+    found = snapshot.lookup_many(['AA:BB:CC:00:00:51', 'AA:BB:CC:00:00:51:00:00:00:00:00:00:00:00', 'nope', None])
+    assert found == {'AA:BB:CC:00:00:51': (48.70, 2.20)}
+    assert snapshot.stats()['misses'] == 3
+
+
+def test_rows_updated_after_the_snapshot_take_precedence(tmp_path):
+    snapshot = make_snapshot(tmp_path)
+    time.sleep(0.01)
+    conn = tracker.db_pool.connection()
+    with conn:
+        conn.execute(SQL_UPSERT_LOCATION, ('AA:BB:CC:00:00:51', 48.75, 2.25))
+        conn.execute(tracker.SQL_INSERT_AP_LOCATION, ('AA:BB:CC:00:00:53', 48.72, 2.22))
+    found = snapshot.lookup_many(['AA:BB:CC:00:00:51', 'AA:BB:CC:00:00:52', 'AA:BB:CC:00:00:53'])
+    assert found == {'AA:BB:CC:00:00:51': (48.75, 2.25), 'AA:BB:CC:00:00:52': (48.71, 2.21),
+                     'AA:BB:CC:00:00:53': (48.72, 2.22)}
+    assert snapshot.stats()['changed_since_built'] == 2
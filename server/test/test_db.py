@@ -0,0 +1,35 @@
+import threading
+from db import ConnectionPool
+
+
+def test_thread_per_request_reuses_connections(tmp_path):
+    pool = ConnectionPool(str(tmp_path / 'pool.db'))
+
+    def request():
+        pool.connection().execute('SELECT 1').fetchone()
+
+    for _ in range(50):
+        thread = threading.Thread(target=request)
+        thread.start()
+        thread.join()
+    assert pool.stats()['connections'] == 1
+    pool.close_all()
+
+
+def test_live_threads_get_their_own_connection(tmp_path):
+    pool = ConnectionPool(str(tmp_path / 'pool.db'))
+    barrier = threading.Barrier(4)
+    seen = []
+
+    def request():
+        seen.append(pool.connection())
+        barrier.wait()
+
+    threads = [threading.Thread(target=request) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len({id(conn) for conn in seen}) == 4
+    assert pool.stats() == {'connections': 4, 'idle': 4}
+    pool.close_all()
@@ -0,0 +1,125 @@
+import os
+import time
+import pytest
+
+os.environ.setdefault('CENTER_POINTS', '48.72868,2.22195')
+import download_bssids
+from db import ConnectionPool
+from wigle_client import WigleError
+
+CENTER = (48.72868, 2.22195)
+
+
+def ap(netid, lat, lon, lastupdt='2025-01-01T00:00:00'):
+    return {'netid': netid, 'trilat': lat, 'trilong': lon, 'lastupdt': lastupdt}
+
+
+class FakeClient:
+    """Serves canned result pages, then fails if failing is set."""
+
+    def __init__(self, pages, failing=False):
+        self.pages = list(pages)
+        self.failing = failing
+        self.params = []
+
+    def search(self, params):
+        self.params.append(dict(params))
+        if not self.pages:
+            raise WigleError('unavailable')
+        page = self.pages.pop(0)
+        if self.failing and not self.pages:
+            self.failing = False
+            raise WigleError('unavailable')
+        return page
+
+
+@pytest.fixture
+def pool(tmp_path, monkeypatch):
+    monkeypatch.setattr(download_bssids, 'DB_NAME', str(tmp_path / 'wigle.db'))
+    download_bssids.init_db()
+    pool = ConnectionPool(download_bssids.DB_NAME)
+    yield pool
+    pool.close_all()
+
+
+def add_tile(pool, tile, since=None):
+    conn = pool.connection()
+    with conn:
+        conn.execute('INSERT INTO crawl_tiles (tile_id, min_lat, max_lat, min_lon, max_lon, since) VALUES (?, ?, ?, ?, ?, ?)',
+                     (*tile, since))
+
+
+def test_tiles_cover_the_circle_once():
+    tiles = download_bssids.make_tiles([CENTER, CENTER], 1000, 500)
+    assert len({tile[0] for tile in tiles}) == len(tiles)
+    # Every point of the circle falls in exactly one tile
+    for dlat, dlon in [(0, 0), (0.008, 0), (-0.008, 0), (0, 0.0125), (0.005, -0.009)]:
+        lat, lon = CENTER[0] + dlat, CENTER[1] + dlon
+        assert download_bssids.haversine_distance(*CENTER, lat, lon) <= 1000
+        inside = [t for t in tiles if t[1] <= lat < t[2] and t[3] <= lon < t[4]]
+        assert len(inside) == 1
+
+
+def test_filter_page_keeps_aps_in_tile_and_radius():
+    tile = ('t', 48.725, 48.735, 2.215, 2.225)
+    results = [
+        ap('AA:00:00:00:00:01', 48.73, 2.22),
+        ap('AA:00:00:00:00:02', 48.74, 2.22),  # outside the tile
+        ap('AA:00:00:00:00:03', 48.725, 2.215),  # on the lower edges, inside
+        ap('AA:00:00:00:00:04', 48.735, 2.22),  # on the upper edge, next tile
+        {'netid': 'AA:00:00:00:00:05', 'trilat': None, 'trilong': 2.22},
+    ]
+    kept = download_bssids.filter_page(results, tile, [CENTER], 1000)
+    assert [a['netid'] for a in kept] == ['AA:00:00:00:00:01', 'AA:00:00:00:00:03']
+    assert download_bssids.filter_page(results, tile, [(48.0, 2.0)], 1000) == []
+
+
+def test_token_bucket_limits_the_rate():
+    bucket = download_bssids.TokenBucket(rate=50, capacity=2)
+    start = time.monotonic()
+    for _ in range(7):
+        bucket.acquire()
+    # Two saved up tokens, then five more at 50 per second
+    assert time.monotonic() - start >= 0.09
+
+
+def test_crawl_tile_resumes_from_its_cursor(pool):
+    tile = ('t', 48.72, 48.74, 2.21, 2.23)
+    add_tile(pool, tile)
+    pages = [
+        {'results': [ap('AA:00:00:00:00:01', 48.73, 2.22)], 'searchAfter': 'cursor1'},
+        {'results': [ap('AA:00:00:00:00:02', 48.73, 2.22)], 'searchAfter': None},
+    ]
+    client = FakeClient(pages, failing=True)
+    assert download_bssids.crawl_tile(tile, client, pool, [CENTER], 1000) == ('t', [1, 0, 0], False)
+    conn = pool.connection()
+    assert conn.execute('SELECT search_after, done FROM crawl_tiles').fetchone() == ('cursor1', 0)
+
+    client = FakeClient(pages[1:])
+    assert download_bssids.crawl_tile(tile, client, pool, [CENTER], 1000) == ('t', [1, 0, 0], True)
+    assert client.params[0]['searchAfter'] == 'cursor1'
+    assert conn.execute('SELECT search_after, done, pages FROM crawl_tiles').fetchone() == (None, 1, 2)
+    assert conn.execute('SELECT COUNT(*) FROM ap_locations').fetchone()[0] == 2
+
+
+def test_upsert_counts_added_updated_and_unchanged(pool):
+    conn = pool.connection()
+    with conn:
+        assert download_bssids.upsert_aps(conn, [ap('aa:00:00:00:00:01', 48.73, 2.22),
+                                                 ap('AA:00:00:00:00:02', 48.73, 2.22)]) == (2, 0, 0)
+    with conn:
+        counts = download_bssids.upsert_aps(conn, [ap('AA:00:00:00:00:01', 48.73, 2.22),
+                                                   ap('AA:00:00:00:00:02', 48.731, 2.22, '2025-06-01T00:00:00'),
+                                                   ap('AA:00:00:00:00:03', 48.73, 2.22)])
+    assert counts == (1, 1, 1)
+    assert conn.execute("SELECT lat, lastupdt FROM ap_locations WHERE bssid = 'AA:00:00:00:00:02'").fetchone() == \
+        (48.731, '2025-06-01T00:00:00')
+
+
+def test_refresh_asks_only_for_updated_networks(pool):
+    tile = ('t', 48.72, 48.74, 2.21, 2.23)
+    add_tile(pool, tile, since='2025-03-04T05:06:07')
+    client = FakeClient([{'results': [], 'searchAfter': None}])
+    assert download_bssids.crawl_tile(tile, client, pool, [CENTER], 1000) == ('t', [0, 0, 0], True)
+    assert client.params[0]['lastupdt'] == '20250304050607'
+    assert download_bssids.wigle_timestamp('2025-12-31T23:59:58.123456') == '20251231235958'
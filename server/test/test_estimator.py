@@ -0,0 +1,49 @@
+import math
+import random
+import numpy as np
+import pytest
+import estimator
+from synthetic_dataset import CENTER_LAT, METERS_PER_DEGREE_LAT, generate_aps, generate_scans
+
+
+@pytest.fixture(scope='module')
+def dataset():
+    rng = random.Random(1)
+    aps = generate_aps(300, rng)
+    scans = generate_scans(aps, 300, rng)
+    located = {ap['netid']: (ap['trilat'], ap['trilong']) for ap in aps}
+    batch = [[(*located[ap['bssid']], ap['rssi']) for ap in scan['aps']] for scan in scans]
+    return scans, batch
+
+
+def errors(scans, est_lat, est_lon):
+    cos0 = math.cos(math.radians(CENTER_LAT))
+    return np.hypot((est_lat - np.array([s['true_lat'] for s in scans])) * METERS_PER_DEGREE_LAT,
+                    (est_lon - np.array([s['true_lon'] for s in scans])) * METERS_PER_DEGREE_LAT * cos0)
+
+
+def test_estimates_are_accurate_on_the_synthetic_dataset(dataset):
+    scans, batch = dataset
+    plain_mean = errors(scans, np.array([np.mean([ap[0] for ap in aps]) for aps in batch]),
+                        np.array([np.mean([ap[1] for ap in aps]) for aps in batch]))
+    centroid = errors(scans, *estimator.estimate_batch(*estimator.pad_scans(batch), algorithm='centroid'))
+    trilateration = errors(scans, *estimator.estimate_batch(*estimator.pad_scans(batch), algorithm='trilateration'))
+    assert np.median(centroid) < 25.0
+    assert np.median(centroid) < np.median(plain_mean)
+    assert np.median(trilateration) < 20.0
+
+
+def test_batch_matches_single_estimates(dataset):
+    _, batch = dataset
+    est_lat, est_lon = estimator.estimate_batch(*estimator.pad_scans(batch[:20]), k=3)
+    for aps, lat, lon in zip(batch[:20], est_lat, est_lon):
+        assert estimator.estimate(aps, k=3) == pytest.approx((lat, lon))
+
+
+def test_scans_without_aps_have_no_estimate():
+    est_lat, est_lon = estimator.estimate_batch(*estimator.pad_scans([[], [(48.7, 2.2, -50)]]))
+    assert np.isnan(est_lat[0]) and np.isnan(est_lon[0])
+    assert (est_lat[1], est_lon[1]) == pytest.approx((48.7, 2.2))
+    assert estimator.estimate([]) is None
+    with pytest.raises(ValueError):
+        estimator.estimate([(48.7, 2.2, -50)], algorithm='nearest')
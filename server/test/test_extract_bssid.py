@@ -0,0 +1,48 @@
+import random
+import sqlite3
+import extract_bssid
+
+
+def make_db():
+    con = sqlite3.connect(':memory:')
+    con.execute('CREATE TABLE ap_locations (bssid TEXT PRIMARY KEY, lat REAL, lon REAL)')
+    con.executemany('INSERT INTO ap_locations VALUES (?, ?, ?)', [
+        ('AA:BB:CC:00:00:02', 48.70, 2.20),
+        ('aa-bb-cc-00-00-01', 48.70, 2.20),
+        ('AA:BB:CC:00:00:01', 48.70, 2.20),  # same key as the dash separated one
+        ('AA:BB:CC:00:00:03', 49.00, 2.20),
+        ('not a bssid', 48.70, 2.20),
+    ])
+    return con
+
+
+def test_load_bssids_sorts_dedupes_and_filters():
+    con = make_db()
+    assert extract_bssid.load_bssids(con) == [bytes.fromhex('AABBCC000001'), bytes.fromhex('AABBCC000002'),
+                                              bytes.fromhex('AABBCC000003')]
+    assert len(extract_bssid.load_bssids(con, bbox=(48.6, 2.1, 48.8, 2.3))) == 2
+
+
+def test_bloom_filter_has_no_false_negatives():
+    rng = random.Random(1)
+    keys = [rng.randbytes(6) for _ in range(2000)]
+    bits, m, k = extract_bssid.build_bloom(keys, 0.01)
+
+    def known(key):
+        h = extract_bssid.fnv1a64(key)
+        h1, h2 = h & 0xFFFFFFFF, (h >> 32) | 1
+        return all(bits[(h1 + i * h2) % m >> 3] & 1 << ((h1 + i * h2) % m & 7) for i in range(k))
+
+    assert all(known(key) for key in keys)
+    others = [rng.randbytes(6) for _ in range(5000)]
+    assert sum(known(key) for key in others) / len(others) < 0.02
+
+
+def test_write_bin_header(tmp_path):
+    keys = [bytes.fromhex('AABBCC000001'), bytes.fromhex('AABBCC000002')]
+    path = tmp_path / 'bssids.bin'
+    extract_bssid.write_bin(path, extract_bssid.BIN_KIND_SORTED, b''.join(keys), len(keys))
+    data = path.read_bytes()
+    header = extract_bssid.BIN_HEADER.unpack_from(data)
+    assert header == (b'BSSD', 1, extract_bssid.BIN_KIND_SORTED, 0, 2, 0, 0)
+    assert data[extract_bssid.BIN_HEADER.size:] == b''.join(keys)
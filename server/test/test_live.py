@@ -0,0 +1,16 @@
+import asyncio
+from live import ScanFeed
+
+
+def test_publish_drops_listeners_of_closed_loops():
+    feed = ScanFeed()
+    loop = asyncio.new_event_loop()
+    loop.close()
+    calls = []
+    feed.subscribe(lambda: loop.call_soon_threadsafe(calls.append, 'dead'))
+    feed.subscribe(lambda: calls.append('live'))
+
+    feed.publish()
+    feed.publish()
+    assert calls == ['live', 'live']
+    assert feed.seq == 2
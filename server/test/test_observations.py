@@ -0,0 +1,62 @@
+import sqlite3
+import numpy as np
+import pytest
+import observations
+
+APS = [
+    {'bssid': 'AA:BB:CC:00:00:01', 'rssi': -60, 'channel': 6},
+    {'bssid': 'aa-bb-cc-00-00-02', 'rssi': -200},
+    {'bssid': 'AA:BB:CC:00:00', 'rssi': -70},
+    {'bssid': None, 'rssi': -70},
+]
+
+
+def test_pack_round_trip_skips_malformed_bssids():
+    blob = observations.pack_observation(APS)
+    assert len(blob) == 2 * observations.AP_RECORD.size
+    assert observations.unpack_observation(blob) == [
+        {'bssid': 'AA:BB:CC:00:00:01', 'rssi': -60, 'channel': 6},
+        {'bssid': 'AA:BB:CC:00:00:02', 'rssi': -128, 'channel': 0},
+    ]
+    assert observations.unpack_observation(None) == []
+
+
+def test_bssid_key_round_trip():
+    key = observations.bssid_key('aa:bb:cc:00:00:01')
+    assert key == 0xAABBCC000001
+    assert observations.format_bssid_key(key) == 'AA:BB:CC:00:00:01'
+    for bad in ('AA:BB:CC:00:00', 'AA:BB:CC:00:00:01:02'):
+        with pytest.raises(ValueError):
+            observations.bssid_key(bad)
+
+
+def test_read_observations_and_locate():
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE scans (id INTEGER PRIMARY KEY, timestamp TEXT, device_id TEXT, est_lat REAL, '
+                 'est_lon REAL, vbat REAL, cat_rssi REAL, cat_snr REAL, ap_rssi REAL, ap_snr REAL, observation BLOB)')
+    conn.execute('CREATE TABLE ap_locations (bssid TEXT PRIMARY KEY, lat REAL, lon REAL)')
+    conn.executemany('INSERT INTO scans (timestamp, device_id, observation) VALUES (?, ?, ?)', [
+        ('2025-01-01 10:00:00', 'A', observations.pack_observation(APS)),
+        ('2025-01-01 10:01:00', 'B', observations.pack_observation(APS[:1])),
+        ('2025-01-01 10:02:00', 'A', None),
+        ('2025-01-01 11:00:00', 'A', observations.pack_observation(APS)),
+    ])
+    conn.executemany('INSERT INTO ap_locations VALUES (?, ?, ?)',
+                     [('AA:BB:CC:00:00:01', 48.7, 2.2), ('AA:BB:CC:00:00:09', 48.8, 2.3)])
+
+    batches = list(observations.read_observations(conn, '2025-01-01 09:00:00', '2025-01-01 10:30:00', batch_size=2))
+    assert [len(batch['id']) for batch in batches] == [2, 1]
+    first = batches[0]
+    assert first['device_id'].tolist() == ['A', 'B']
+    assert first['mask'].tolist() == [[True, True], [True, False]]
+    assert first['rssis'][1, 1] == -np.inf
+    assert first['bssids'][0, 1] == 0xAABBCC000002
+    assert batches[1]['mask'].shape == (1, 0)
+
+    only_a = list(observations.read_observations(conn, '2025-01-01 09:00:00', '2025-01-01 10:30:00', 'A'))
+    assert only_a[0]['id'].tolist() == [1, 3]
+
+    lats, lons, located = observations.locate(conn, first['bssids'], first['mask'])
+    assert located.tolist() == [[True, False], [True, False]]
+    assert lats[located].tolist() == [48.7, 48.7]
+    assert lons[located].tolist() == [2.2, 2.2]
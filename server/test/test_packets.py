@@ -0,0 +1,12 @@
+import app as tracker
+from packet import encode_cat_packet
+
+
+def test_packet_upload_stores_station_link_metrics():
+    tracker.init_db()
+    body = encode_cat_packet(0x54705810, 77, 3900, -90, 7, 30, [('AA:BB:CC:00:00:41', -50, 6)])
+    response = tracker.app.test_client().post('/api/packet?ap_rssi=-101&ap_snr=-3', data=body)
+    assert response.status_code == 200
+    row = tracker.db_pool.connection().execute(
+        'SELECT vbat, cat_rssi, cat_snr, ap_rssi, ap_snr FROM scans WHERE scan_id = 77').fetchone()
+    assert row == (3.9, -90, 7, -101, -3)
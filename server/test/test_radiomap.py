@@ -0,0 +1,57 @@
+import os
+import pytest
+import numpy as np
+import app as tracker
+from radiomap import RadioMap, RadioMapUpdater
+
+BSSIDS = [f'AA:BB:CC:00:00:4{n}' for n in range(5)]
+
+
+def one_cell_map(lat=48.70, lon=2.20, rssi=-50.0):
+    """A radio map of one cell where every BSSID of BSSIDS is heard at rssi."""
+    n = len(BSSIDS)
+    return RadioMap(BSSIDS, np.arange(n + 1), np.zeros(n, dtype=int), np.full(n, rssi + 100.0),
+                    np.array([lat]), np.array([lon]), np.array([5]))
+
+
+def scan(bssids, rssi=-50):
+    return [{'bssid': bssid, 'rssi': rssi} for bssid in bssids]
+
+
+def test_weak_matches_are_not_used():
+    radio_map = one_cell_map()
+    assert radio_map.match(scan(BSSIDS)) == (48.70, 2.20)
+    assert radio_map.match(scan(BSSIDS[:2])) is None
+    # A BSSID listed twice is one BSSID in common, not two
+    assert radio_map.match(scan(BSSIDS[:2] + BSSIDS[:2])) is None
+    assert radio_map.match(scan(BSSIDS[:2] + [BSSIDS[2], BSSIDS[2].lower()])) is None
+
+
+def test_fallback_is_used_for_weak_matches(monkeypatch):
+    updater = RadioMapUpdater(None)
+    updater.radio_map = one_cell_map()
+    monkeypatch.setattr(tracker, 'radio_map', updater)
+    located = [[(48.71, 2.21, -50.0)]]
+
+    # Too few BSSIDs in common with the map
+    assert tracker.estimate_positions(located, [scan(BSSIDS[:2])]) == [(48.71, 2.21)]
+    # Enough of them, but more than max_offset meters from the fallback estimate
+    assert tracker.estimate_positions(located, [scan(BSSIDS)]) == [(48.71, 2.21)]
+    assert updater.rejected == 1
+    # No fallback, or one close to the match
+    assert tracker.estimate_positions([[]], [scan(BSSIDS)]) == [(48.70, 2.20)]
+    assert tracker.estimate_positions([[(48.7001, 2.20, -50.0)]], [scan(BSSIDS)]) == [(48.70, 2.20)]
+
+
+def test_rebuild_calls_on_built():
+    tracker.init_db()
+    built = []
+    updater = RadioMapUpdater(tracker.db_pool, on_built=lambda: built.append(True))
+    updater.rebuild()
+    assert built == [True]
+
+
+@pytest.mark.skipif('ESTIMATOR_ALGORITHM' in os.environ, reason='estimator chosen by the environment')
+def test_radio_map_is_off_by_default():
+    assert not tracker.RADIO_MAP
+    assert tracker.radio_map is None
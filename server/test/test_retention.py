@@ -0,0 +1,77 @@
+import datetime
+import pytest
+from db import ConnectionPool
+from retention import METERS_PER_DEGREE_LAT, ScanRetention, init_summary_table, merge_summaries
+
+NOW = datetime.datetime(2025, 6, 1, 12, 0, 0)
+OLD = datetime.datetime(2025, 1, 1, 10, 0, 0)
+STEP = 20 / METERS_PER_DEGREE_LAT  # 20 m north
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = ConnectionPool(str(tmp_path / 'retention.db'))
+    conn = pool.connection()
+    conn.execute('CREATE TABLE scans (id INTEGER PRIMARY KEY, device_id TEXT, timestamp DATETIME, est_lat REAL, '
+                 'est_lon REAL)')
+    conn.execute('CREATE TABLE scan_pending_aps (scan_row INTEGER, bssid TEXT)')
+    init_summary_table(conn)
+    conn.commit()
+    yield pool
+    pool.close_all()
+
+
+def add_scans(conn, rows):
+    conn.executemany('INSERT INTO scans (device_id, timestamp, est_lat, est_lon) VALUES (?, ?, ?, ?)',
+                     [(device, timestamp.isoformat(' '), lat, lon) for device, timestamp, lat, lon in rows])
+    conn.commit()
+
+
+def test_old_scans_are_rolled_into_summaries(pool):
+    conn = pool.connection()
+    minute = datetime.timedelta(minutes=1)
+    add_scans(conn, [
+        ('A', OLD, 48.7, 2.2),
+        ('A', OLD + minute, 48.7 + STEP, 2.2),
+        ('A', OLD + 2 * minute, 48.7 + 2 * STEP, 2.2),
+        ('A', OLD + 20 * minute, 48.8, 2.3),  # next 15 minute interval
+        ('B', OLD + minute, 48.6, 2.1),
+        ('A', OLD + 3 * minute, None, None),  # no fix, deleted without a summary
+        ('A', NOW - minute, 48.7, 2.2),  # recent, kept
+    ])
+    conn.execute('INSERT INTO scan_pending_aps VALUES (1, ?)', ('AA:BB:CC:00:00:01',))
+    conn.commit()
+
+    # Batches of two scans: the first interval of A is summarized twice and merged
+    retention = ScanRetention(pool, keep_days=90, bucket_seconds=900, batch_size=2)
+    counters = retention.run(now=NOW)
+    assert counters['scans_deleted'] == 6
+    assert conn.execute('SELECT COUNT(*) FROM scans').fetchone()[0] == 1
+    assert conn.execute('SELECT COUNT(*) FROM scan_pending_aps').fetchone()[0] == 0
+
+    summaries = {row[:2]: row[2:] for row in conn.execute(
+        'SELECT device_id, bucket_start, lat, lon, count, spread, first_seen, last_seen FROM scan_summaries')}
+    assert set(summaries) == {('A', '2025-01-01 10:00:00'), ('A', '2025-01-01 10:15:00'), ('B', '2025-01-01 10:00:00')}
+    lat, lon, count, spread, first_seen, last_seen = summaries[('A', '2025-01-01 10:00:00')]
+    assert (count, first_seen, last_seen) == (3, '2025-01-01 10:00:00', '2025-01-01 10:02:00')
+    assert lat == pytest.approx(48.7 + STEP)
+    # RMS distance of fixes -20, 0 and +20 m from their centroid
+    assert spread == pytest.approx((800 / 3) ** 0.5, rel=1e-3)
+    assert summaries[('B', '2025-01-01 10:00:00')][2:4] == (1, 0.0)
+
+    # Nothing left to do on the next run
+    assert retention.run(now=NOW)['scans_deleted'] == 0
+
+
+def test_merge_summaries_matches_a_single_pass():
+    a = (48.7, 2.2, 1, 0.0, '10:00', '10:00')
+    b = (48.7 + STEP, 2.2, 1, 0.0, '10:01', '10:01')
+    lat, lon, count, spread, first_seen, last_seen = merge_summaries(b, a)
+    assert (count, first_seen, last_seen) == (2, '10:00', '10:01')
+    assert lat == pytest.approx(48.7 + STEP / 2)
+    assert spread == pytest.approx(10.0, rel=1e-3)
+
+
+def test_cutoff_is_rounded_to_an_interval():
+    retention = ScanRetention(None, keep_days=1, bucket_seconds=900)
+    assert retention.cutoff(datetime.datetime(2025, 6, 2, 12, 7, 30)) == datetime.datetime(2025, 6, 1, 12, 0, 0)
@@ -0,0 +1,54 @@
+import threading
+import app as tracker
+from scan_writer import ScanWriter
+
+
+def writer(fail, **options):
+    """A ScanWriter whose write fails for the batches that contain a scan in fail."""
+    stored = []
+
+    def write(conn, scans):
+        if fail & set(scans):
+            raise ValueError('bad row')
+        stored.extend(scans)
+        return len(scans)
+
+    return ScanWriter(tracker.db_pool, write, **options), stored
+
+
+def test_failed_batch_does_not_block_later_writes():
+    scan_writer, stored = writer({'bad'}, max_attempts=3)
+    scan_writer.submit(['a', 'bad'])
+    assert scan_writer.flush() == 0
+    scan_writer.submit(['b', 'c'])
+    assert scan_writer.flush() == 2
+    assert stored == ['b', 'c']
+    assert scan_writer.stats()['retrying'] == 2
+
+    assert scan_writer.flush() == 0
+    stats = scan_writer.stats()
+    assert (stats['retrying'], stats['dropped'], stats['errors']) == (0, 2, 3)
+    assert scan_writer.flush() == 0
+
+
+def test_retried_batch_is_written_once_the_error_clears():
+    fail = {'a'}
+    scan_writer, stored = writer(fail, max_attempts=3)
+    scan_writer.submit(['a'])
+    scan_writer.flush()
+    fail.clear()
+    assert scan_writer.flush() == 1
+    assert stored == ['a']
+    assert scan_writer.stats()['dropped'] == 0
+
+
+def test_failed_flush_wakes_blocked_submit():
+    scan_writer, stored = writer({'bad'}, max_rows=2, max_attempts=1, flush_rows=1000, flush_interval=0.05)
+    scan_writer.submit(['bad', 'bad2'])
+    done = threading.Event()
+    thread = threading.Thread(target=lambda: (scan_writer.submit(['c']), done.set()))
+    thread.start()
+    assert done.wait(5.0)
+    scan_writer.stop(5.0)
+    assert stored == ['c']
+    assert scan_writer.stats()['dropped'] == 2
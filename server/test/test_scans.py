@@ -0,0 +1,84 @@
+import json
+import pytest
+import app as tracker
+
+GOOD_APS = [{'bssid': 'AA:BB:CC:00:00:01', 'rssi': -50}, {'bssid': 'AA:BB:CC:00:00:02', 'rssi': -60}]
+
+
+@pytest.fixture
+def client():
+    tracker.init_db()
+    conn = tracker.db_pool.connection()
+    with conn:
+        conn.execute('DELETE FROM scans')
+        conn.executemany(tracker.SQL_INSERT_AP_LOCATION, [('AA:BB:CC:00:00:01', 48.70, 2.20),
+                                                          ('AA:BB:CC:00:00:02', 48.71, 2.21)])
+    tracker.ap_cache.invalidate()
+    tracker.fingerprint_cache.clear()
+    return tracker.app.test_client()
+
+
+def post_scans(client, scans):
+    response = client.post('/api/scans', json=scans)
+    assert response.status_code == 200
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_malformed_scan_in_the_middle_of_a_batch(client):
+    results = post_scans(client, [
+        {'scan_id': 1, 'aps': GOOD_APS},
+        {'scan_id': 2, 'aps': 'x'},
+        {'scan_id': 3, 'aps': ['x']},
+        {'scan_id': 4, 'aps': [{'bssid': 'AA:BB:CC:00:00:01', 'rssi': 'loud'}]},
+        {'scan_id': 5, 'aps': GOOD_APS[:1]},
+    ])
+    assert [r['scan_id'] for r in results] == [1, 2, 3, 4, 5]
+    assert [r['status'] for r in results] == ['success', 'error', 'error', 'error', 'success']
+    stored = tracker.db_pool.connection().execute('SELECT scan_id FROM scans ORDER BY id').fetchall()
+    assert stored == [(1,), (5,)]
+
+
+def test_single_scan_rejects_malformed_aps(client):
+    response = client.post('/api/scan', json={'scan_id': 1, 'aps': [{'bssid': 'AA:BB:CC:00:00:01', 'rssi': 'loud'}]})
+    assert response.status_code == 400
+
+
+def test_memoized_scans_keep_input_order(client):
+    post_scans(client, [{'scan_id': 1, 'aps': GOOD_APS}])
+    results = post_scans(client, [
+        {'scan_id': 2, 'aps': GOOD_APS[:1]},
+        {'scan_id': 3, 'aps': GOOD_APS},  # answered from the fingerprint memo
+        {'scan_id': 4, 'aps': GOOD_APS[1:]},
+    ])
+    assert [r['status'] for r in results] == ['success'] * 3
+    stored = tracker.db_pool.connection().execute('SELECT scan_id FROM scans ORDER BY id').fetchall()
+    assert stored == [(1,), (2,), (3,), (4,)]
+    assert tracker.fingerprint_cache.stats()['hits'] >= 1
+
+
+def test_batch_with_aware_and_naive_timestamps(client):
+    aware = tracker.datetime.datetime.fromisoformat('2026-10-18T08:00:00+02:00')
+    results = post_scans(client, [
+        {'scan_id': 1, 'aps': GOOD_APS, 'timestamp': '2026-10-18T08:00:00+02:00'},
+        {'scan_id': 2, 'aps': GOOD_APS[:1], 'timestamp': '2026-10-18T09:00:00'},
+        {'scan_id': 3, 'aps': GOOD_APS[1:]},
+    ])
+    assert [r['status'] for r in results] == ['success'] * 3
+    stored = tracker.db_pool.connection().execute('SELECT scan_id, timestamp FROM scans ORDER BY id').fetchall()
+    assert [scan_id for scan_id, _ in stored] == [1, 2, 3]
+    assert stored[0][1] == str(aware.astimezone().replace(tzinfo=None))
+    assert all(tracker.datetime.datetime.fromisoformat(timestamp).tzinfo is None for _, timestamp in stored)
+
+
+def test_device_summary_with_an_aware_timestamp_first(client):
+    results = post_scans(client, [
+        {'scan_id': 1, 'aps': GOOD_APS, 'device_id': 'DEADBEEF', 'timestamp': '2026-10-18T08:00:00Z'},
+        {'scan_id': 2, 'aps': GOOD_APS[:1], 'device_id': 'DEADBEEF'},
+    ])
+    assert [r['status'] for r in results] == ['success', 'success']
+    first_seen, last_seen, scans = tracker.db_pool.connection().execute(
+        "SELECT first_seen, last_seen, scans FROM devices WHERE device_id = 'DEADBEEF'").fetchone()
+    utc = tracker.datetime.datetime(2026, 10, 18, 8, tzinfo=tracker.datetime.timezone.utc)
+    assert first_seen == str(utc.astimezone().replace(tzinfo=None))
+    assert last_seen > first_seen
+    assert scans == 2
@@ -0,0 +1,39 @@
+import sqlite3
+import pytest
+from spatial import haversine_distances, init_spatial_index, nearest_aps
+
+UPSERT = 'INSERT INTO ap_locations (bssid, lat, lon) VALUES (?, ?, ?) ON CONFLICT(bssid) DO UPDATE SET lat = excluded.lat, lon = excluded.lon'
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE ap_locations (bssid TEXT PRIMARY KEY, lat REAL, lon REAL)')
+    # Rows stored before the index existed are indexed by init_spatial_index
+    conn.execute(UPSERT, ('AA:BB:CC:00:00:01', 48.7000, 2.2000))
+    init_spatial_index(conn)
+    conn.executemany(UPSERT, [('AA:BB:CC:00:00:02', 48.7010, 2.2000),
+                              ('AA:BB:CC:00:00:03', 48.7100, 2.2000),
+                              ('AA:BB:CC:00:00:04', None, None)])
+    return conn
+
+
+def test_haversine_distances():
+    assert haversine_distances(48.7, 2.2, [48.7, 49.7], [2.2, 2.2]) == pytest.approx([0.0, 111195.0], rel=1e-3)
+
+
+def test_nearest_aps_are_sorted_by_distance(conn):
+    found = nearest_aps(conn, 48.7002, 2.2000, k=2)
+    assert [row[0] for row in found] == ['AA:BB:CC:00:00:01', 'AA:BB:CC:00:00:02']
+    assert found[0][3] == pytest.approx(22.2, abs=0.5)
+    # The third AP is 1 km away, found by growing the search box
+    assert [row[0] for row in nearest_aps(conn, 48.7002, 2.2000, k=5)][2:] == ['AA:BB:CC:00:00:03']
+
+
+def test_index_follows_updated_and_deleted_rows(conn):
+    conn.execute(UPSERT, ('AA:BB:CC:00:00:04', 48.7001, 2.2000))
+    conn.execute(UPSERT, ('AA:BB:CC:00:00:01', 48.7500, 2.2000))
+    conn.execute("DELETE FROM ap_locations WHERE bssid = 'AA:BB:CC:00:00:02'")
+    found = nearest_aps(conn, 48.7000, 2.2000, k=1)
+    assert found[0][0] == 'AA:BB:CC:00:00:04'
+    assert conn.execute('SELECT COUNT(*) FROM ap_locations_rtree').fetchone()[0] == 3
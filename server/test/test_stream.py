@@ -0,0 +1,17 @@
+import app as tracker
+from test_scans import GOOD_APS, client, post_scans  # noqa: F401 (fixture)
+
+
+def test_stream_resumes_after_the_points_it_was_drawn_from(client, monkeypatch):
+    monkeypatch.setattr(tracker, 'LIVE_POLL_INTERVAL', 0.01)
+    post_scans(client, [{'scan_id': 1, 'aps': GOOD_APS}])
+    last_scan_id = client.get('/api/points').get_json()['last_scan_id']
+    # Stored after the map fetched its points, before it opened the stream
+    post_scans(client, [{'scan_id': 2, 'aps': GOOD_APS[:1]}])
+
+    response = client.get(f'/api/stream?since={last_scan_id}', buffered=False)
+    chunks = (chunk.decode() for chunk in response.response)
+    assert next(chunks).startswith('retry:')
+    event = next(chunks)
+    response.close()
+    assert event.startswith(f'id: {last_scan_id + 1}\nevent: fix\n')
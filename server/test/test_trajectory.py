@@ -0,0 +1,33 @@
+import numpy as np
+from trajectory import aggregate_grid, simplify
+
+
+def test_simplify_keeps_the_endpoints_and_the_corners():
+    # An L-shaped walk: east along a street, then north, 200 points in all
+    lats = np.concatenate([np.full(100, 48.70), np.linspace(48.70, 48.71, 100)])
+    lons = np.concatenate([np.linspace(2.20, 2.21, 100), np.full(100, 2.21)])
+    keep = simplify(lats, lons, max_points=3)
+    assert keep == [0, 99, 199] or keep == [0, 100, 199]
+    assert simplify(lats, lons, max_points=1000) == list(range(200))
+
+
+def test_simplify_stops_at_the_tolerance():
+    rng = np.random.default_rng(1)
+    lats = 48.70 + rng.normal(0, 1e-6, 500)  # about 0.1 m of jitter on a straight line
+    lons = np.linspace(2.20, 2.25, 500)
+    keep = simplify(lats, lons, max_points=100, tolerance=1.0)
+    assert keep == [0, 499]
+
+
+def test_aggregate_grid_respects_the_cell_budget():
+    rng = np.random.default_rng(2)
+    lats = 48.70 + rng.uniform(0, 0.01, 1000)
+    lons = 2.20 + rng.uniform(0, 0.01, 1000)
+    timestamps = list(range(1000))
+    cell_size, cells = aggregate_grid(lats, lons, timestamps, max_cells=20)
+    assert len(cells) <= 20
+    assert cell_size > 25.0
+    assert sum(cell['count'] for cell in cells) == 1000
+    assert [cell['first'] for cell in cells] == sorted(cell['first'] for cell in cells)
+    _, weighted = aggregate_grid(lats[:2], lons[:2], timestamps[:2], max_cells=1, weights=[3, 1])
+    assert weighted[0]['count'] == 4
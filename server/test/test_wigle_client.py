@@ -0,0 +1,89 @@
+import os
+import time
+import pytest
+from wigle_client import QuotaTracker, ResponseCache, WigleClient, WigleError
+
+URL = 'http://127.0.0.1:9/api/v2/network/search'
+PARAMS = {'latrange1': 48.72, 'latrange2': 48.74}
+
+
+class FakeResponse:
+    def __init__(self, status_code, data=None, headers=None):
+        self.status_code = status_code
+        self.data = data
+        self.text = str(data)
+        self.headers = headers or {}
+
+    def json(self):
+        return self.data
+
+
+def client(tmp_path, responses, **kwargs):
+    """WigleClient whose session answers with the given responses, in order."""
+    options = dict(url=URL, retries=0, backoff=0, quota_db=str(tmp_path / 'quota.db'), cache_dir='')
+    options.update(kwargs)
+    wigle = WigleClient('user', 'token', **options)
+    answers = list(responses)
+    wigle.session.get = lambda url, params, timeout: answers.pop(0)
+    return wigle
+
+
+def test_quota_refuses_after_the_daily_budget(tmp_path):
+    quota = QuotaTracker(str(tmp_path / 'quota.db'), daily_quota=2)
+    assert quota.acquire() is None
+    # A second tracker on the same file shares the budget
+    assert QuotaTracker(quota.path, daily_quota=2).acquire() is None
+    assert 'daily WiGLE quota' in quota.acquire()
+    assert quota.stats()['used_today'] == 2
+
+
+def test_quota_block_refuses_every_request(tmp_path):
+    quota = QuotaTracker(str(tmp_path / 'quota.db'))
+    quota.block(60)
+    assert 'blocked' in quota.acquire()
+    assert 55 <= quota.stats()['blocked_for_s'] <= 60
+
+
+def test_client_raises_quota_error_without_sending(tmp_path):
+    wigle = client(tmp_path, [FakeResponse(200, {'success': True, 'results': []})], daily_quota=1)
+    assert wigle.search(PARAMS) == {'success': True, 'results': []}
+    with pytest.raises(WigleError) as refused:
+        wigle.search(PARAMS)
+    assert refused.value.quota and refused.value.status is None
+    assert wigle.stats()['requests'] == 1
+    assert wigle.stats()['quota_refusals'] == 1
+
+
+def test_final_429_blocks_the_quota(tmp_path):
+    wigle = client(tmp_path, [FakeResponse(429, 'slow down'), FakeResponse(429, 'slow down')],
+                   retries=1, quota_block=300)
+    with pytest.raises(WigleError) as error:
+        wigle.search(PARAMS)
+    assert error.value.status == 429 and error.value.quota
+    assert wigle.retried == 1
+    assert wigle.quota.stats()['blocked_for_s'] > 290
+
+
+def test_too_many_queries_blocks_until_tomorrow(tmp_path):
+    wigle = client(tmp_path, [FakeResponse(200, {'success': False, 'message': 'too many queries today'})])
+    with pytest.raises(WigleError) as error:
+        wigle.search(PARAMS)
+    assert error.value.quota
+    assert 'blocked' in wigle.quota.acquire()
+
+
+def test_response_cache(tmp_path):
+    cache = ResponseCache(str(tmp_path / 'cache'), ttl=60)
+    assert cache.get(URL, PARAMS) is None
+    cache.put(URL, PARAMS, {'success': True, 'results': [1]})
+    assert cache.get(URL, dict(reversed(list(PARAMS.items())))) == {'success': True, 'results': [1]}
+    assert cache.get(URL, {**PARAMS, 'searchAfter': 'x'}) is None
+    stale = time.time() - 120
+    os.utime(cache.path(URL, PARAMS), (stale, stale))
+    assert cache.get(URL, PARAMS) is None
+
+
+def test_client_answers_from_the_cache(tmp_path):
+    wigle = client(tmp_path, [FakeResponse(200, {'success': True, 'results': []})], cache_dir=str(tmp_path / 'cache'))
+    assert wigle.search(PARAMS) == wigle.search(PARAMS)
+    assert (wigle.requests, wigle.cache_hits) == (1, 1)
@@ -0,0 +1,47 @@
+import time
+from db import ConnectionPool
+from wigle_queue import WigleQueue
+
+LOCATION = {'lat': 48.70, 'lon': 2.20, 'error': None}
+
+
+def make_queue(tmp_path, lookup, **options):
+    pool = ConnectionPool(str(tmp_path / 'queue.db'))
+    resolved = []
+    queue = WigleQueue(pool, lookup, lambda bssid, loc: resolved.append(bssid), **options)
+    with pool.connection() as conn:
+        queue.init_db(conn)
+    return queue, resolved
+
+
+def drain(queue, resolved, count):
+    """Wait for the worker thread to resolve count BSSIDs, then stop it."""
+    deadline = time.monotonic() + 5.0
+    while len(resolved) < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+    queue.stop(5.0)
+
+
+def test_only_requests_sent_use_the_budget(tmp_path):
+    sent = [0]
+    known = {'AA:BB:CC:00:00:01'}  # answered from the database
+
+    def lookup(bssid):
+        if bssid not in known:
+            sent[0] += 2  # one retry
+        return LOCATION
+
+    queue, resolved = make_queue(tmp_path, lookup, requests_sent=lambda: sent[0], budget=3)
+    queue.enqueue(['AA:BB:CC:00:00:01', 'AA:BB:CC:00:00:02'])
+    drain(queue, resolved, 2)
+    assert sorted(resolved) == ['AA:BB:CC:00:00:01', 'AA:BB:CC:00:00:02']
+    assert queue.stats()['used_in_period'] == 2
+    assert queue._budget_wait() == 0
+
+
+def test_budget_without_request_count(tmp_path):
+    queue, resolved = make_queue(tmp_path, lambda bssid: LOCATION, budget=2, period=3600.0)
+    queue.enqueue(['AA:BB:CC:00:00:01', 'AA:BB:CC:00:00:02'])
+    drain(queue, resolved, 2)
+    assert queue.stats()['used_in_period'] == 2
+    assert queue._budget_wait() > 3500
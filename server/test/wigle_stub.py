@@ -0,0 +1,99 @@
+import argparse
+import json
+import random
+import threading
+import time
+from collections import deque
+from flask import Flask, request, jsonify
+
+# Local stand-in for the WiGLE network/search API, point WIGLE_API_URL at it:
+# WIGLE_API_URL=http://127.0.0.1:4300/api/v2/network/search
+app = Flask(__name__)
+
+APS = []
+BY_NETID = {}
+LATENCY = 0.0  # seconds added to every response
+JITTER = 0.0  # seconds, uniform
+ERROR_RATE = 0.0  # fraction of requests answered with HTTP 500
+RATE_LIMIT = 0  # requests per second before answering 429, 0 = unlimited
+DAILY_QUOTA = 0  # requests before answering 429 for good, 0 = unlimited
+
+_requests = deque()
+_lock = threading.Lock()
+stats = {'requests': 0, 'errors': 0, 'rate_limited': 0}
+
+
+def limited():
+    """Return the 429 reason if the rate limit or the quota is exhausted, else None."""
+    now = time.monotonic()
+    with _lock:
+        stats['requests'] += 1
+        if DAILY_QUOTA and stats['requests'] > DAILY_QUOTA:
+            return 'too many queries today'
+        while _requests and _requests[0] <= now - 1.0:
+            _requests.popleft()
+        if RATE_LIMIT and len(_requests) >= RATE_LIMIT:
+            return 'too many queries'
+        _requests.append(now)
+    return None
+
+
+@app.route('/api/v2/network/search', methods=['GET'])
+def search():
+    """Answer netid lookups and lat/lon range searches with searchAfter pagination."""
+    if LATENCY or JITTER:
+        time.sleep(LATENCY + random.random() * JITTER)
+    reason = limited()
+    if reason:
+        stats['rate_limited'] += 1
+        return jsonify({'success': False, 'message': reason}), 429
+    if random.random() < ERROR_RATE:
+        stats['errors'] += 1
+        return jsonify({'success': False, 'message': 'internal error'}), 500
+
+    netid = request.args.get('netid')
+    if netid:
+        ap = BY_NETID.get(netid.upper())
+        results = [ap] if ap else []
+    else:
+        lat1 = request.args.get('latrange1', type=float)
+        lat2 = request.args.get('latrange2', type=float)
+        lon1 = request.args.get('longrange1', type=float)
+        lon2 = request.args.get('longrange2', type=float)
+        lastupdt = request.args.get('lastupdt')
+        results = [ap for ap in APS if lat1 <= ap['trilat'] <= lat2 and lon1 <= ap['trilong'] <= lon2]
+        if lastupdt:
+            results = [ap for ap in results if ap.get('lastupdt', '').replace('-', '').replace('T', '').replace(':', '') > lastupdt]
+
+    per_page = request.args.get('resultsPerPage', default=100, type=int)
+    start = int(request.args.get('searchAfter') or 0)
+    page = results[start:start + per_page]
+    search_after = str(start + per_page) if start + per_page < len(results) else None
+    return jsonify({'success': True, 'totalResults': len(results), 'resultCount': len(page),
+                    'results': page, 'searchAfter': search_after})
+
+
+@app.route('/stats', methods=['GET'])
+def stub_stats():
+    """Requests served, errors injected and requests rate limited."""
+    return jsonify(stats)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local WiGLE network/search stub.')
+    parser.add_argument('--aps', default='synthetic_aps.json', help='AP field from synthetic_dataset.py')
+    parser.add_argument('--port', type=int, default=4300)
+    parser.add_argument('--latency', type=float, default=0.2, help='seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.1, help='random extra latency, seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of HTTP 500 answers')
+    parser.add_argument('--rate-limit', type=int, default=0, help='requests per second, 0 = unlimited')
+    parser.add_argument('--quota', type=int, default=0, help='total requests allowed, 0 = unlimited')
+    args = parser.parse_args()
+
+    with open(args.aps) as f:
+        APS = json.load(f)
+    BY_NETID = {ap['netid'].upper(): ap for ap in APS}
+    LATENCY, JITTER, ERROR_RATE = args.latency, args.jitter, args.error_rate
+    RATE_LIMIT, DAILY_QUOTA = args.rate_limit, args.quota
+    print(f"Serving {len(APS)} APs on port {args.port}")
+    app.run(port=args.port, threaded=True)
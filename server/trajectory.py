@@ -0,0 +1,92 @@
+import heapq
+import math
+import numpy as np
+
+METERS_PER_DEGREE_LAT = 111194.0
+
+
+def _project(lats, lons):
+    """Equirectangular projection to meters around the mean latitude, good enough at city scale."""
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+    cos0 = math.cos(math.radians(float(lats.mean()))) if len(lats) else 1.0
+    return lons * METERS_PER_DEGREE_LAT * cos0, lats * METERS_PER_DEGREE_LAT
+
+
+def _farthest(x, y, first, last):
+    """Index and distance of the point farthest from segment first-last, strictly between them."""
+    if last - first < 2:
+        return None, 0.0
+    px = x[first + 1:last]
+    py = y[first + 1:last]
+    dx = x[last] - x[first]
+    dy = y[last] - y[first]
+    seg_len2 = dx * dx + dy * dy
+    if seg_len2 == 0:
+        dist = np.hypot(px - x[first], py - y[first])
+    else:
+        t = np.clip(((px - x[first]) * dx + (py - y[first]) * dy) / seg_len2, 0.0, 1.0)
+        dist = np.hypot(px - (x[first] + t * dx), py - (y[first] + t * dy))
+    i = int(np.argmax(dist))
+    return first + 1 + i, float(dist[i])
+
+
+def simplify(lats, lons, max_points, tolerance=0.0):
+    """Douglas-Peucker simplification down to a point budget.
+
+    Segments are split in order of largest deviation until max_points are kept or no
+    point deviates by more than tolerance meters. Returns the sorted indices to keep.
+    """
+    n = len(lats)
+    if n <= max(max_points, 2):
+        return list(range(n))
+    x, y = _project(lats, lons)
+    keep = {0, n - 1}
+    heap = []
+    index, dist = _farthest(x, y, 0, n - 1)
+    if index is not None:
+        heapq.heappush(heap, (-dist, 0, n - 1, index))
+    while heap and len(keep) < max_points:
+        neg_dist, first, last, index = heapq.heappop(heap)
+        if -neg_dist <= tolerance:
+            break
+        keep.add(index)
+        for a, b in ((first, index), (index, last)):
+            split, dist = _farthest(x, y, a, b)
+            if split is not None:
+                heapq.heappush(heap, (-dist, a, b, split))
+    return sorted(keep)
+
+
+def aggregate_grid(lats, lons, timestamps, max_cells, cell_size=25.0, weights=None):
+    """Aggregate points into square grid cells, doubling the cell size until at most max_cells remain.
+
+    Returns (cell_size, cells) with cells as dicts of centroid lat/lon, count, first and last
+    timestamp, ordered by first timestamp. weights, e.g. the number of fixes a summarized
+    point stands for, default to 1 per point.
+    """
+    if not len(lats):
+        return cell_size, []
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+    x, y = _project(lats, lons)
+    while True:
+        keys = np.stack([np.floor(x / cell_size), np.floor(y / cell_size)], axis=1)
+        uniq, inverse = np.unique(keys, axis=0, return_inverse=True)
+        if len(uniq) <= max_cells:
+            break
+        cell_size *= 2
+    inverse = inverse.ravel()
+    weights = np.ones(len(lats)) if weights is None else np.asarray(weights, dtype=float)
+    counts = np.bincount(inverse, weights=weights)
+    cell_lats = np.bincount(inverse, weights=lats * weights) / counts
+    cell_lons = np.bincount(inverse, weights=lons * weights) / counts
+    # Points arrive in time order, so the first/last occurrence of a cell gives its time span
+    first = np.full(len(uniq), len(lats))
+    np.minimum.at(first, inverse, np.arange(len(lats)))
+    last = np.zeros(len(uniq), dtype=int)
+    np.maximum.at(last, inverse, np.arange(len(lats)))
+    cells = [{'lat': float(cell_lats[c]), 'lon': float(cell_lons[c]), 'count': int(counts[c]),
+              'first': timestamps[first[c]], 'last': timestamps[last[c]]}
+             for c in np.argsort(first)]
+    return cell_size, cells
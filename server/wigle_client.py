@@ -0,0 +1,271 @@
+import hashlib
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPBasicAuth
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# WiGLE API credentials and client settings, overridable from .env
+WIGLE_USER = os.getenv('WIGLE_USER')
+WIGLE_TOKEN = os.getenv('WIGLE_TOKEN')
+WIGLE_API_URL = os.getenv('WIGLE_API_URL', 'https://api.wigle.net/api/v2/network/search')  # overridable for test/wigle_stub.py
+WIGLE_CONNECT_TIMEOUT = float(os.getenv('WIGLE_CONNECT_TIMEOUT', '5'))  # seconds
+WIGLE_READ_TIMEOUT = float(os.getenv('WIGLE_READ_TIMEOUT', '30'))  # seconds
+WIGLE_RETRIES = int(os.getenv('WIGLE_RETRIES', '3'))  # extra attempts on 429, 5xx and network errors
+WIGLE_BACKOFF = float(os.getenv('WIGLE_BACKOFF', '1.0'))  # seconds, doubled per attempt, +-50% jitter
+WIGLE_MAX_BACKOFF = float(os.getenv('WIGLE_MAX_BACKOFF', '60'))  # seconds
+WIGLE_POOL_SIZE = int(os.getenv('WIGLE_POOL_SIZE', '10'))  # keep-alive connections
+# Requests per UTC day shared by every process using the same WIGLE_QUOTA_DB, 0 = no limit
+WIGLE_DAILY_QUOTA = int(os.getenv('WIGLE_DAILY_QUOTA', '0'))
+WIGLE_QUOTA_DB = os.getenv('WIGLE_QUOTA_DB', 'wigle_quota.db')
+WIGLE_QUOTA_BLOCK = float(os.getenv('WIGLE_QUOTA_BLOCK', '900'))  # seconds without requests after a final 429
+# On-disk cache of successful responses, keyed by the request, empty = no cache
+WIGLE_CACHE_DIR = os.getenv('WIGLE_CACHE_DIR', 'wigle_cache')
+WIGLE_CACHE_TTL = float(os.getenv('WIGLE_CACHE_TTL', str(7 * 86400)))  # seconds
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class WigleError(Exception):
+    """A WiGLE request that failed after the retries.
+
+    status is the HTTP status (None for network errors and local quota refusals, 200 for an
+    API error reported in the body); quota is True when WiGLE or the local quota refused it.
+    """
+
+    def __init__(self, message, status=None, quota=False):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.quota = quota
+
+
+class QuotaTracker:
+    """Daily WiGLE request budget shared by processes through a small SQLite file.
+
+    Each request takes one unit in a transaction (BEGIN IMMEDIATE), so concurrent crawlers,
+    workers and scripts never spend more than `daily_quota` requests per UTC day together.
+    A quota refusal from WiGLE blocks every process until `blocked_until`.
+    """
+
+    def __init__(self, path, daily_quota=0):
+        self.path = path
+        self.daily_quota = daily_quota
+        self._local = threading.local()
+        conn = self._connection()
+        with conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS wigle_quota (day TEXT PRIMARY KEY, used INTEGER DEFAULT 0, '
+                         'blocked_until REAL DEFAULT 0)')
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _today():
+        return time.strftime('%Y-%m-%d', time.gmtime())
+
+    def acquire(self):
+        """Take one request from today's budget. Returns None, or the reason the request may not be sent."""
+        conn = self._connection()
+        day = self._today()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('INSERT OR IGNORE INTO wigle_quota (day) VALUES (?)', (day,))
+            used, blocked_until = conn.execute('SELECT used, blocked_until FROM wigle_quota WHERE day = ?',
+                                               (day,)).fetchone()
+            if blocked_until > time.time():
+                conn.execute('ROLLBACK')
+                return f'WiGLE quota blocked for {blocked_until - time.time():.0f} s'
+            if self.daily_quota and used >= self.daily_quota:
+                conn.execute('ROLLBACK')
+                return f'daily WiGLE quota of {self.daily_quota} requests used'
+            conn.execute('UPDATE wigle_quota SET used = used + 1 WHERE day = ?', (day,))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return None
+
+    def block(self, seconds=None):
+        """Stop every process from sending requests for seconds, or until the next UTC day."""
+        if seconds is None:
+            now = time.time()
+            until = now - now % 86400 + 86400
+        else:
+            until = time.time() + seconds
+        conn = self._connection()
+        conn.execute('INSERT INTO wigle_quota (day, blocked_until) VALUES (?, ?) ON CONFLICT(day) DO UPDATE SET '
+                     'blocked_until = MAX(blocked_until, excluded.blocked_until)', (self._today(), until))
+
+    def stats(self):
+        row = self._connection().execute('SELECT used, blocked_until FROM wigle_quota WHERE day = ?',
+                                         (self._today(),)).fetchone()
+        used, blocked_until = row if row else (0, 0)
+        return {'used_today': used, 'daily_quota': self.daily_quota,
+                'blocked_for_s': max(0, round(blocked_until - time.time()))}
+
+
+class ResponseCache:
+    """Content-addressed on-disk cache of WiGLE JSON responses.
+
+    The file name is the SHA-256 of the URL and the sorted query parameters, sharded by its
+    first two hex digits. Entries are written to a temporary file and renamed, so concurrent
+    processes never read half a response.
+    """
+
+    def __init__(self, directory, ttl=7 * 86400.0):
+        self.directory = directory
+        self.ttl = ttl
+
+    def path(self, url, params):
+        key = hashlib.sha256(json.dumps([url, sorted((str(k), str(v)) for k, v in params.items())]).encode()).hexdigest()
+        return os.path.join(self.directory, key[:2], f'{key}.json')
+
+    def get(self, url, params):
+        path = self.path(url, params)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                return None
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, url, params, data):
+        path = self.path(url, params)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+
+class WigleClient:
+    """The one WiGLE API client of the server and the scripts.
+
+    Requests go through a pooled keep-alive session with explicit (connect, read) timeouts,
+    so a hung WiGLE never blocks the caller for more than about `retries` times the read
+    timeout. 429, 5xx and network errors are retried with jittered exponential backoff,
+    honouring Retry-After. Every request sent is counted in the shared QuotaTracker, and
+    successful responses are kept in the ResponseCache, so repeated crawls and dataset
+    generation do not ask WiGLE again. `throttle()`, e.g. a rate limiter, is called before
+    each request actually sent.
+    """
+
+    def __init__(self, user=WIGLE_USER, token=WIGLE_TOKEN, url=WIGLE_API_URL,
+                 timeout=(WIGLE_CONNECT_TIMEOUT, WIGLE_READ_TIMEOUT), retries=WIGLE_RETRIES, backoff=WIGLE_BACKOFF,
+                 max_backoff=WIGLE_MAX_BACKOFF, pool_size=WIGLE_POOL_SIZE, daily_quota=WIGLE_DAILY_QUOTA,
+                 quota_db=WIGLE_QUOTA_DB, quota_block=WIGLE_QUOTA_BLOCK, cache_dir=WIGLE_CACHE_DIR,
+                 cache_ttl=WIGLE_CACHE_TTL, throttle=None):
+        self.url = url
+        self.throttle = throttle
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.quota_block = quota_block
+        self.session = requests.Session()
+        self.session.auth = HTTPBasicAuth(user, token)
+        self.session.headers.update({'Accept': 'application/json'})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.quota = QuotaTracker(quota_db, daily_quota) if quota_db else None
+        self.cache = ResponseCache(cache_dir, cache_ttl) if cache_dir else None
+        self.requests = 0
+        self.cache_hits = 0
+        self.retried = 0
+        self.quota_refusals = 0
+
+    def search(self, params, use_cache=True):
+        """GET the network search with params and return the decoded JSON of a successful answer.
+
+        Raises WigleError when WiGLE cannot be reached, answers with an HTTP error or
+        success false, or when the quota is used up.
+        """
+        if use_cache and self.cache is not None:
+            data = self.cache.get(self.url, params)
+            if data is not None:
+                self.cache_hits += 1
+                return data
+        data = self._get(params)
+        if not data.get('success'):
+            message = str(data.get('message', 'Unknown error'))
+            quota = 'too many queries' in message.lower()
+            if quota and self.quota is not None:
+                # WiGLE's daily limit: nobody asks again before tomorrow
+                self.quota.block()
+            raise WigleError(message, status=200, quota=quota)
+        if self.cache is not None:
+            try:
+                self.cache.put(self.url, params, data)
+            except OSError as e:
+                logging.warning(f"WiGLE response not cached: {e}")
+        return data
+
+    def _get(self, params):
+        for attempt in range(self.retries + 1):
+            if self.quota is not None:
+                refused = self.quota.acquire()
+                if refused:
+                    self.quota_refusals += 1
+                    raise WigleError(refused, quota=True)
+            if self.throttle is not None:
+                self.throttle()
+            self.requests += 1
+            logging.info(f"WiGLE API request: {params}")
+            retry_after = None
+            try:
+                response = self.session.get(self.url, params=params, timeout=self.timeout)
+                logging.info(f"WiGLE API response status: {response.status_code}")
+                if response.status_code == 200:
+                    try:
+                        return response.json()
+                    except ValueError:
+                        error = WigleError(f"invalid JSON: {response.text[:200]}", status=200)
+                else:
+                    error = WigleError(response.text, status=response.status_code, quota=response.status_code == 429)
+                    if response.status_code not in RETRY_STATUSES:
+                        raise error
+                    retry_after = response.headers.get('Retry-After')
+            except requests.RequestException as e:
+                error = WigleError(str(e))
+            if attempt == self.retries:
+                break
+            self.retried += 1
+            delay = min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.5)
+            if retry_after is not None and retry_after.isdigit():
+                delay = max(delay, min(float(retry_after), self.max_backoff))
+            logging.warning(f"WiGLE request failed ({error.message[:200]}), retry in {delay:.1f} s")
+            time.sleep(delay)
+        if error.status == 429 and self.quota is not None:
+            self.quota.block(self.quota_block)
+        raise error
+
+    def close(self):
+        self.session.close()
+
+    def stats(self):
+        """Return the request, cache and quota counters as a dict."""
+        stats = {
+            'requests': self.requests,
+            'cache_hits': self.cache_hits,
+            'retried': self.retried,
+            'quota_refusals': self.quota_refusals
+        }
+        if self.quota is not None:
+            stats.update(self.quota.stats())
+        return stats
@@ -0,0 +1,180 @@
+import collections
+import logging
+import threading
+import time
+
+
+class WigleQueue:
+    """Persistent queue of BSSIDs waiting for a WiGLE lookup, drained by a background thread.
+
+    BSSIDs are stored in the `wigle_queue` table, one row per BSSID, so duplicates collapse
+    and queued work survives a restart. The worker spends at most `budget` WiGLE requests per
+    `period` seconds. `lookup(bssid)` returns a location dict, `retryable(loc)` tells whether a
+    failed lookup should be tried again later, and `on_resolved(bssid, loc)` is called once
+    a BSSID leaves the queue.
+
+    `requests_sent()` returns the running count of requests sent to WiGLE. Only the requests
+    a lookup actually sent are charged to the budget, not lookups answered from the database
+    or the response cache; without it every lookup counts as one request. The budget is kept
+    in memory and so applies per process: the daily quota shared by every process is the
+    QuotaTracker of wigle_client.py.
+    """
+
+    def __init__(self, db_pool, lookup, on_resolved, retryable=lambda loc: False, requests_sent=None,
+                 budget=100, period=86400.0, max_attempts=5, retry_delay=300.0, lease=60.0):
+        self.db_pool = db_pool
+        self.lookup = lookup
+        self.on_resolved = on_resolved
+        self.retryable = retryable
+        self.requests_sent = requests_sent
+        self.budget = budget
+        self.period = period
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.lease = lease
+        self._requests = collections.deque()  # monotonic timestamps of WiGLE requests in the current period
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.resolved = 0
+        self.retried = 0
+        self.dropped = 0
+
+    def init_db(self, conn):
+        """Create the queue table."""
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS wigle_queue (
+                bssid TEXT PRIMARY KEY,
+                enqueued_at REAL,
+                next_attempt_at REAL,
+                attempts INTEGER DEFAULT 0,
+                last_error TEXT
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_wigle_queue_next ON wigle_queue (next_attempt_at)')
+
+    def enqueue(self, bssids, conn=None):
+        """Queue BSSIDs for lookup, ignoring those already queued. Returns how many were added."""
+        if not bssids:
+            return 0
+        conn = conn or self.db_pool.connection()
+        now = time.time()
+        with conn:
+            before = conn.total_changes
+            conn.executemany('INSERT OR IGNORE INTO wigle_queue (bssid, enqueued_at, next_attempt_at) VALUES (?, ?, ?)',
+                             [(bssid, now, now) for bssid in bssids])
+            added = conn.total_changes - before
+        if added:
+            self.start()
+            self._wakeup.set()
+        return added
+
+    def queued(self, bssids):
+        """Return the subset of bssids that is still waiting in the queue."""
+        if not bssids:
+            return set()
+        conn = self.db_pool.connection()
+        sql = 'SELECT bssid FROM wigle_queue WHERE bssid IN ({})'.format(','.join('?' * len(bssids)))
+        return {row[0] for row in conn.execute(sql, list(bssids))}
+
+    def start(self):
+        """Start the worker thread if it is not running yet."""
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='wigle-queue', daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout=None):
+        """Ask the worker thread to exit and wait for it."""
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _budget_wait(self):
+        """Seconds to wait before the next WiGLE request fits in the budget, 0 if it fits now."""
+        now = time.monotonic()
+        while self._requests and self._requests[0] <= now - self.period:
+            self._requests.popleft()
+        if len(self._requests) < self.budget:
+            return 0.0
+        return self._requests[0] + self.period - now
+
+    def _claim_next(self):
+        """Lease the oldest due BSSID so that other processes sharing the database skip it."""
+        conn = self.db_pool.connection()
+        now = time.time()
+        while True:
+            row = conn.execute('SELECT bssid, attempts FROM wigle_queue WHERE next_attempt_at <= ? '
+                               'ORDER BY enqueued_at LIMIT 1', (now,)).fetchone()
+            if row is None:
+                return None, None
+            with conn:
+                claimed = conn.execute('UPDATE wigle_queue SET next_attempt_at = ? WHERE bssid = ? AND next_attempt_at <= ?',
+                                       (now + self.lease, row[0], now)).rowcount
+            if claimed:
+                return row
+
+    def _next_due_in(self):
+        conn = self.db_pool.connection()
+        row = conn.execute('SELECT MIN(next_attempt_at) FROM wigle_queue').fetchone()
+        if row[0] is None:
+            return None
+        return max(row[0] - time.time(), 0.0)
+
+    def _process(self, bssid, attempts):
+        conn = self.db_pool.connection()
+        before = self.requests_sent() if self.requests_sent is not None else None
+        loc = self.lookup(bssid)
+        sent = 1 if before is None else self.requests_sent() - before
+        self._requests.extend([time.monotonic()] * sent)
+        if loc['error'] and self.retryable(loc) and attempts + 1 < self.max_attempts:
+            with conn:
+                conn.execute('UPDATE wigle_queue SET attempts = ?, last_error = ?, next_attempt_at = ? WHERE bssid = ?',
+                             (attempts + 1, loc['error'], time.time() + self.retry_delay * 2 ** attempts, bssid))
+            self.retried += 1
+            logging.info(f"WiGLE queue: retrying {bssid} later: {loc['error']}")
+            return
+        with conn:
+            conn.execute('DELETE FROM wigle_queue WHERE bssid = ?', (bssid,))
+        if loc['error'] and self.retryable(loc):
+            self.dropped += 1
+            logging.error(f"WiGLE queue: giving up on {bssid} after {attempts + 1} attempts: {loc['error']}")
+        else:
+            self.resolved += 1
+        self.on_resolved(bssid, loc)
+
+    def _run(self):
+        logging.info("WiGLE queue worker started")
+        while not self._stop.is_set():
+            self._wakeup.clear()
+            try:
+                wait = self._budget_wait()
+                if wait > 0:
+                    self._wakeup.wait(wait)
+                    continue
+                bssid, attempts = self._claim_next()
+                if bssid is None:
+                    self._wakeup.wait(self._next_due_in())
+                    continue
+                self._process(bssid, attempts)
+            except Exception as e:
+                logging.exception(f"WiGLE queue worker error: {e}")
+                self._stop.wait(self.retry_delay)
+        logging.info("WiGLE queue worker stopped")
+
+    def stats(self):
+        """Return queue counters as a dict."""
+        conn = self.db_pool.connection()
+        size = conn.execute('SELECT COUNT(*) FROM wigle_queue').fetchone()[0]
+        return {
+            'queued': size,
+            'resolved': self.resolved,
+            'retried': self.retried,
+            'dropped': self.dropped,
+            'budget': self.budget,
+            'period': self.period,
+            'used_in_period': len(self._requests)
+        }